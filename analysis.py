@@ -1,543 +1,2030 @@
+import argparse
+import asyncio
+import copy
+import datetime
+import functools
+import glob
+import hashlib
+import importlib
+import io
+import json
+import math
+import os
+import pickle
+import shutil
+import sys
+import time
+import tracemalloc
+import warnings
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import nullcontext, redirect_stdout
+from itertools import repeat
+from urllib.parse import parse_qs, urlsplit
+
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
-import scipy.stats as stats
+
+
+
+##### LAZY IMPORTS #####
+class LazyModule:
+    # module that is only imported on first use (matplotlib and scipy dominate the start-up time)
+    
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def __getattr__(self, attr):
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+
+matplotlib = LazyModule('matplotlib')
+plt = LazyModule('matplotlib.pyplot')
+stats = LazyModule('scipy.stats')
+
+
+
+##### PROFILING #####
+# stage trace (wall time, cpu time, peak traced memory, rows in/out); disabled by default, the decorated
+# functions are then called directly
+PROFILE = {'enabled': False, 'path': None, 'stages': [], 'stack': []}
+
+
+def configure_profiling(path=None, enabled=True):
+    PROFILE.update(enabled=enabled, path=path, stages=[], stack=[])
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def row_count(data):
+    
+    # rows of a data frame, response matrix or of the first element of a returned tuple
+    if isinstance(data, tuple) and data:
+        data = data[0]
+    if isinstance(data, (pd.DataFrame, pd.Series, np.ndarray)) or hasattr(data, 'participant'):
+        return len(data)
+    return None
+
+
+class ProfileStage:
+    # context manager recording one stage; nested stages fold their memory peak into the enclosing ones
+    
+    __slots__ = ('name', 'function', 'rows_in', 'rows_out', 'start', 'cpu', 'memory', 'peak')
+    
+    def __init__(self, name, function=None, rows_in=None):
+        self.name = name
+        self.function = function
+        self.rows_in = rows_in
+        self.rows_out = None
+    
+    def __enter__(self):
+        current, peak = tracemalloc.get_traced_memory()
+        for stage in PROFILE['stack']:
+            stage.peak = max(stage.peak, peak)
+        tracemalloc.reset_peak()
+        PROFILE['stack'].append(self)
+        self.memory, self.peak = current, current
+        self.start, self.cpu = time.perf_counter(), time.process_time()
+        return self
+    
+    def __exit__(self, *exc):
+        wall, cpu = time.perf_counter() - self.start, time.process_time() - self.cpu
+        self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        PROFILE['stack'].pop()
+        for stage in PROFILE['stack']:
+            stage.peak = max(stage.peak, self.peak)
+        # nested: called inside a stage of the same name (e.g. load_data() in load_data_cached()), already in its totals
+        PROFILE['stages'].append({'stage': self.name, 'function': self.function, 'depth': len(PROFILE['stack']), 'wall_s': wall, 'cpu_s': cpu,
+                                  'peak_bytes': self.peak - self.memory, 'rows_in': self.rows_in, 'rows_out': self.rows_out,
+                                  'nested': any(stage.name == self.name for stage in PROFILE['stack'])})
+        return False
+
+
+def profiled(name):
+    
+    # decorator of a pipeline stage (rows in: first argument, rows out: return value)
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILE['enabled']:
+                return func(*args, **kwargs)
+            with ProfileStage(name, func.__name__, row_count(args[0]) if args else None) as stage:
+                result = func(*args, **kwargs)
+                stage.rows_out = row_count(result)
+            return result
+        return wrapper
+    return decorator
+
+
+def write_trace(path=None):
+    
+    # json trace: every stage call (in completion order) and totals per stage (outermost calls of a stage only,
+    # so that a stage wrapping another one of the same name is not counted twice)
+    path = path or PROFILE['path']
+    totals = {}
+    for record in PROFILE['stages']:
+        if record.get('nested'):
+            continue
+        total = totals.setdefault(record['stage'], {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'peak_bytes': 0})
+        total['calls'] += 1
+        total['wall_s'] += record['wall_s']
+        total['cpu_s'] += record['cpu_s']
+        total['peak_bytes'] = max(total['peak_bytes'], record['peak_bytes'])
+    trace = {'stages': PROFILE['stages'], 'totals': totals}
+    if path:
+        with open(path, 'w') as f:
+            json.dump(trace, f, indent=1)
+    return trace
+
+
+
+##### CONSTANTS #####
+RAW_COLUMNS = ['participant', 'age:1', 'gender:1', 'group:1', 'behaviour:1', 'behaviour:2', 'behaviour:3', 'behaviour:4',
+               'emotion:1', 'emotion:2', 'emotion:3', 'emotion:4', 'country', 'TIME_start', 'TIME_end', 'TIME_total']
+COLUMNS = ['participant', 'age', 'gender', 'group', 'behaviour_dom', 'behaviour_nature', 'behaviour_public', 'behaviour_traffic',
+           'emotion_dom', 'emotion_nature', 'emotion_public', 'emotion_traffic', 'country', 'TIME_start', 'TIME_end', 'TIME_total']
+ITEMS = ['behaviour_dom', 'behaviour_nature', 'behaviour_public', 'behaviour_traffic',
+         'emotion_dom', 'emotion_nature', 'emotion_public', 'emotion_traffic']
+GENDER_CODES = {1:'female', 2:'male', 3:'other'}
+GROUP_CODES = {1:'stroke', 2:'control'}
+GROUPS = list(GROUP_CODES.values())
+GENDERS = list(GENDER_CODES.values())
+ENVIRONMENTS = ['dom', 'nature', 'public', 'traffic']
+DIMENSIONS = ['behaviour', 'emotion']
+AGE_BANDS = [(60, '60-69'), (70, '70-79'), (80, '80-89'), (90, '90+')]
+MIN_AGE = 60
+MAX_AGE = 120
+MAX_EXAMPLES = 5
+
+# dtypes while parsing (float so that missing values survive until they are counted) and after cleaning
+READ_DTYPES = {col: 'float32' for col in ['age', 'gender', 'group'] + ITEMS + ['TIME_total']}
+READ_DTYPES.update({'participant': 'object', 'country': 'object', 'TIME_start': 'object', 'TIME_end': 'object'})
+CLEAN_DTYPES = {col: 'uint8' for col in ['age'] + ITEMS}
+CLEAN_DTYPES.update({'TIME_start': 'int64', 'TIME_end': 'int64', 'TIME_total': 'int32'})
+TIME_FORMAT = '%Y-%m-%d-%H-%M'
+EPOCH = pd.Timestamp('1970-01-01')
+CACHE_DIR = '.cache'
+LIKERT_LEVELS = 4
+EXACT_MAX_N = 30
+EXACT_MAX_TABLE = 25000000
+EXACT_CACHE_SIZE = 1024
+PERMUTATION_BATCH = 10000
+BOOTSTRAP_REPLICATES = 10000
+
+
+
+##### STREAMING INGESTION & CLEANING #####
+def epoch_minutes(values):
+    
+    # fixed-width YYYY-MM-DD-HH-MM strings to epoch minutes by arithmetic on the digit bytes (no per-row parsing);
+    # anything else (wrong length or separators, impossible dates) becomes NaN
+    if pd.api.types.is_numeric_dtype(values):
+        return values
+    text = np.asarray(values.to_numpy(dtype=object), dtype='S17').view(np.uint8).reshape(len(values), 17).astype(np.int64)
+    digits = text - ord('0')
+    number = lambda start, width: (digits[:, start:start+width] * 10**np.arange(width-1, -1, -1)).sum(axis=1)
+    year, month, day, hour, minute = number(0, 4), number(5, 2), number(8, 2), number(11, 2), number(14, 2)
+    positions = np.array([0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15])
+    valid = (((digits[:, positions] >= 0) & (digits[:, positions] <= 9)).all(axis=1) & (text[:, [4, 7, 10, 13]] == ord('-')).all(axis=1)
+             & (text[:, 16] == 0) & (month >= 1) & (month <= 12) & (hour < 24) & (minute < 60))
+    months = ((year - 1970) * 12 + np.clip(month, 1, 12) - 1).astype('datetime64[M]')
+    month_days = ((months + 1).astype('datetime64[D]') - months.astype('datetime64[D]')).astype(np.int64)
+    valid &= (day >= 1) & (day <= month_days)
+    days = months.astype('datetime64[D]').astype(np.int64) + day - 1
+    minutes = np.where(valid, (days * 24 + hour) * 60 + minute, np.nan)
+    return pd.Series(minutes, index=values.index)
+
+
+def rejection_report():
+    
+    # rows removed per reason (+ a few participant ids as examples), accumulated over chunks
+    return {'invalid': {}, 'duplicates': 0, 'examples': {}}
+
+
+def record_rejections(report, reason, rejected, participants):
+    
+    count = int(rejected.sum())
+    if report is None or not count:
+        return
+    if reason == 'duplicates':
+        report['duplicates'] += count
+    else:
+        report['invalid'][reason] = report['invalid'].get(reason, 0) + count
+    examples = report['examples'].setdefault(reason, [])
+    examples.extend(participants[rejected][:MAX_EXAMPLES-len(examples)].tolist())
+
+
+def validate_chunk(chunk, report=None):
+    
+    # one vectorized pass over complete rows: items outside 1..LIKERT_LEVELS (or not whole numbers),
+    # gender and group codes that are not in GENDER_CODES / GROUP_CODES, implausible ages
+    items = chunk[ITEMS].to_numpy()
+    bad_items = (items < 1) | (items > LIKERT_LEVELS) | (items != np.round(items))
+    age = chunk['age'].to_numpy()
+    checks = {col: bad_items[:, i] for i, col in enumerate(ITEMS)}
+    checks['gender'] = ~chunk['gender'].isin(list(GENDER_CODES)).to_numpy()
+    checks['group'] = ~chunk['group'].isin(list(GROUP_CODES)).to_numpy()
+    checks['age'] = (age <= 0) | (age > MAX_AGE) | (age != np.round(age))
+    invalid = np.zeros(len(chunk), dtype=bool)
+    participants = chunk['participant'].to_numpy()
+    for reason, rejected in checks.items():
+        record_rejections(report, reason, rejected, participants)
+        invalid |= rejected
+    return ~invalid
+
+
+def reject_duplicates(df, report=None):
+    
+    # repeated submissions of a participant (one hash pass over the ids, first submission is kept)
+    duplicated = df['participant'].duplicated(keep='first').to_numpy()
+    record_rejections(report, 'duplicates', duplicated, df['participant'].to_numpy())
+    return df[~duplicated] if duplicated.any() else df
+
+
+def format_report(report):
+    
+    invalid = ', '.join(reason+': '+str(count) for reason, count in report['invalid'].items()) or '0'
+    lines = ['invalid codes (removed): '+invalid, 'duplicate submissions (removed): '+str(report['duplicates'])]
+    for reason, examples in report['examples'].items():
+        lines.append('  e.g. '+reason+': '+', '.join(examples))
+    return '\n'.join(lines)
+
+
+@profiled('clean')
+def clean_chunk(chunk, min_age=MIN_AGE, report=None):
+    
+    # timestamps (YYYY-MM-DD-HH-MM) to epoch minutes, missing completion times recomputed from them
+    chunk = chunk.assign(TIME_start=epoch_minutes(chunk['TIME_start']), TIME_end=epoch_minutes(chunk['TIME_end']))
+    chunk['TIME_total'] = chunk['TIME_total'].fillna(chunk['TIME_end'] - chunk['TIME_start'])
+    
+    # remove incomplete trials (including invalid timestamps)
+    complete = chunk.notna().all(axis=1)
+    incomplete = int((~complete).sum())
+    chunk = chunk[complete]
+    
+    # remove invalid codes (counted per reason in the report)
+    chunk = chunk[validate_chunk(chunk, report)]
+    
+    # remove subjects younger than min_age
+    old = chunk['age'] >= min_age
+    young = int((~old).sum())
+    chunk = chunk[old].astype(CLEAN_DTYPES)
+    
+    # replace number coding of gender and group with actual strings
+    chunk['gender'] = pd.Categorical(chunk['gender'].map(GENDER_CODES), categories=list(GENDER_CODES.values()))
+    chunk['group'] = pd.Categorical(chunk['group'].map(GROUP_CODES), categories=list(GROUP_CODES.values()))
+    
+    return chunk, incomplete, young
+
+
+@profiled('load')
+def load_data(path, chunksize=100000, min_age=MIN_AGE, report=None):
+    
+    # rename, clean, validate and recode each chunk in a single pass so that memory is bounded by chunksize
+    chunks = []
+    incomplete, young = 0, 0
+    reader = pd.read_csv(path, names=COLUMNS, header=0, dtype=READ_DTYPES, index_col=False, chunksize=chunksize)
+    for chunk in reader:
+        chunk, chunk_incomplete, chunk_young = clean_chunk(chunk, min_age, report)
+        chunks.append(chunk)
+        incomplete += chunk_incomplete
+        young += chunk_young
+    
+    df = reject_duplicates(pd.concat(chunks), report)
+    df['country'] = df['country'].astype('category')
+    
+    return df, incomplete, young
+
+
+
+##### INGESTION OF RAW PARTICIPANT FILES #####
+def parse_participant_file(path):
+    
+    # one s.<uuid>.txt file of the survey platform (psytoolkit): every question block starts with
+    # 'l: <label>' and lists its answers as '- <answer>' (or 'a: <answer>') lines, one per item;
+    # times are given as 'TIME_start: YYYY-MM-DD-HH-MM' lines (a missing TIME_total is recomputed by clean_chunk);
+    # the file is read in one go
+    with open(path, encoding='utf-8', errors='replace') as f:
+        lines = f.read().splitlines()
+    row = {'participant': os.path.basename(path)}
+    label, item = None, 0
+    for line in lines:
+        line = line.strip()
+        if line.startswith('l:'):
+            label, item = line[2:].strip(), 0
+        elif line.startswith(('- ', 'a:')) and label:
+            item += 1
+            answer = line[2:].strip()
+            if answer.startswith('{') and '}' in answer:
+                answer = answer[answer.index('}')+1:].strip()
+            column = label+':'+str(item)
+            row[column if column in RAW_COLUMNS else label] = answer
+        elif line.startswith('TIME_') and ':' in line:
+            key, value = line.split(':', 1)
+            row[key.strip()] = value.strip()
+    
+    return row
+
+
+def parse_participant_files(paths):
+    
+    # one task of the process pool: a batch of files
+    return [parse_participant_file(path) for path in paths]
+
+
+def read_participant_files(directory, ingested=(), workers=None, batch_size=1000):
+    
+    # scan the directory for participant files that are not ingested yet and parse them concurrently
+    names = sorted(entry.name for entry in os.scandir(directory)
+                   if entry.name.startswith('s.') and entry.name.endswith('.txt') and entry.name not in ingested)
+    paths = [os.path.join(directory, name) for name in names]
+    batches = [paths[i:i+batch_size] for i in range(0, len(paths), batch_size)]
+    workers = min(workers or os.cpu_count(), len(batches) or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            rows = [row for batch in pool.map(parse_participant_files, batches) for row in batch]
+    else:
+        rows = [row for batch in batches for row in parse_participant_files(batch)]
+    
+    # same wide table (and parse dtypes) as the csv export
+    raw = pd.DataFrame(rows, columns=RAW_COLUMNS)
+    raw.columns = COLUMNS
+    for col, dtype in READ_DTYPES.items():
+        if dtype != 'object':
+            raw[col] = pd.to_numeric(raw[col], errors='coerce').astype(dtype)
+        else:
+            raw[col] = raw[col].astype(object)
+    return raw, names
+
+
+@profiled('load')
+def load_directory(directory, manifest=None, min_age=MIN_AGE, workers=None, report=None):
+    
+    # ingest new participant files; the manifest (one file name per line) records what is ingested already and the
+    # cleaned rows of those files are kept next to it (<manifest>.rows), so that the whole data set is returned
+    ingested, previous = set(), None
+    if manifest and os.path.exists(manifest):
+        with open(manifest) as f:
+            ingested = set(f.read().split())
+        if os.path.isdir(manifest+'.rows'):
+            previous = load_cache(manifest+'.rows')[0]
+    raw, names = read_participant_files(directory, ingested, workers=workers)
+    df, incomplete, young = clean_chunk(raw, min_age, report)
+    if previous is not None:
+        df = pd.concat([previous.astype({'country': object}), df], ignore_index=True)
+    df = reject_duplicates(df, report)
+    df['country'] = df['country'].astype('category')
+    return df, incomplete, young, names
+
+
+def save_manifest(manifest, df, names):
+    
+    # record the ingested files (and keep their cleaned rows) only after the run succeeded
+    save_cache(df, {'source': 'participant files'}, manifest+'.rows')
+    if names:
+        with open(manifest, 'a') as f:
+            f.write('\n'.join(names)+'\n')
+
+
+
+##### ON-DISK CACHE OF CLEANED DATA #####
+def file_hash(path, blocksize=1<<20):
+    
+    # content hash of the raw export (changes whenever the export changes)
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(blocksize), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def save_cache(df, meta, cache_path):
+    
+    # one .npy file per column (+ index), categoricals stored as codes, strings as fixed width unicode,
+    # so that every column can be memory-mapped on load
+    tmp_path = cache_path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    meta = dict(meta, columns=list(df.columns), categories={})
+    np.save(os.path.join(tmp_path, 'index.npy'), df.index.to_numpy())
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            meta['categories'][col] = df[col].cat.categories.tolist()
+            values = df[col].cat.codes.to_numpy()
+        elif df[col].dtype.kind in 'OUT':
+            values = df[col].to_numpy().astype(str)
+        else:
+            values = df[col].to_numpy()
+        np.save(os.path.join(tmp_path, col+'.npy'), values)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    
+    # publish atomically
+    shutil.rmtree(cache_path, ignore_errors=True)
+    os.replace(tmp_path, cache_path)
+
+
+def load_cache(cache_path):
+    
+    with open(os.path.join(cache_path, 'meta.json')) as f:
+        meta = json.load(f)
+    index = np.load(os.path.join(cache_path, 'index.npy'), mmap_mode='r')
+    data = {}
+    for col in meta['columns']:
+        values = np.load(os.path.join(cache_path, col+'.npy'), mmap_mode='r')
+        if col in meta['categories']:
+            data[col] = pd.Categorical.from_codes(np.asarray(values), categories=meta['categories'][col])
+        elif values.dtype.kind == 'U':
+            data[col] = pd.Series(values.astype(object), index=index, dtype=object)
+        else:
+            data[col] = values
+    df = pd.DataFrame(data, index=index)
+    
+    return df, meta
+
+
+@profiled('load')
+def load_data_cached(path, cache_dir=CACHE_DIR, chunksize=100000, min_age=MIN_AGE, report=None):
+    
+    # cache key: content of the raw export + cleaning parameters
+    params = {'min_age': min_age, 'timestamps': 'epoch_minutes', 'validated': True}
+    source_hash = file_hash(path)
+    key = hashlib.sha256((source_hash + json.dumps(params, sort_keys=True)).encode()).hexdigest()[:16]
+    cache_path = os.path.join(cache_dir, key)
+    
+    # warm start: no parsing at all
+    if os.path.exists(os.path.join(cache_path, 'meta.json')):
+        df, meta = load_cache(cache_path)
+        if report is not None:
+            report.update(meta['report'])
+        return df, meta['incomplete'], meta['young']
+    
+    # cold start: parse & clean, then drop stale entries of the same export and store the new one
+    rejections = rejection_report()
+    df, incomplete, young = load_data(path, chunksize=chunksize, min_age=min_age, report=rejections)
+    if report is not None:
+        report.update(rejections)
+    source = os.path.abspath(path)
+    if os.path.isdir(cache_dir):
+        for entry in os.listdir(cache_dir):
+            try:
+                with open(os.path.join(cache_dir, entry, 'meta.json')) as f:
+                    stale = json.load(f)['source'] == source
+            except (OSError, ValueError, KeyError):
+                continue
+            if stale:
+                shutil.rmtree(os.path.join(cache_dir, entry), ignore_errors=True)
+    save_cache(df, {'source': source, 'source_hash': source_hash, 'params': params,
+                    'incomplete': incomplete, 'young': young, 'report': rejections}, cache_path)
+    
+    return df, incomplete, young
+
+
+
+##### BATCH MODE: DATED EXPORT WAVES #####
+def wave_date(path):
+    
+    # exports are named data-DD-MM-YYYY.csv
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        return datetime.datetime.strptime(name[-10:], '%d-%m-%Y').date()
+    except ValueError:
+        return None
+
+
+def wave_paths(pattern):
+    
+    # export files matching the glob, oldest wave first (undated exports last)
+    return sorted(glob.glob(pattern), key=lambda path: (wave_date(path) or datetime.date.max, path))
+
+
+def load_wave(path, cache_dir=CACHE_DIR, min_age=MIN_AGE):
+    
+    # runs in a worker process
+    report = rejection_report()
+    if cache_dir is None:
+        return load_data(path, min_age=min_age, report=report) + (report,)
+    return load_data_cached(path, cache_dir=cache_dir, min_age=min_age, report=report) + (report,)
+
+
+@profiled('load')
+def load_waves(paths, cache_dir=CACHE_DIR, min_age=MIN_AGE, workers=None):
+    
+    # parse & clean all waves in parallel
+    workers = min(workers or os.cpu_count(), len(paths))
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            loaded = list(pool.map(load_wave, paths, repeat(cache_dir), repeat(min_age)))
+    else:
+        loaded = [load_wave(path, cache_dir, min_age) for path in paths]
+    
+    # keep the first submission of every participant across waves (waves in date order, hash set of participant ids;
+    # repeated submissions within a wave are already removed by the validation)
+    # and the mergeable partial statistics of each wave
+    seen = set()
+    waves = []
+    for path, (df, incomplete, young, report) in zip(paths, loaded):
+        new = ~df['participant'].isin(seen)
+        df = df[new]
+        seen.update(df['participant'])
+        waves.append({'wave': os.path.splitext(os.path.basename(path))[0], 'date': wave_date(path), 'data': df,
+                      'incomplete': incomplete, 'young': young, 'duplicates': int((~new).sum()), 'report': report,
+                      'summary': batch_summary(df)})
+    return waves
+
+
+def pool_waves(waves):
+    
+    # one data set and the merged statistics of all waves (participants are disjoint after de-duplication)
+    df = pd.concat([wave['data'].assign(country=wave['data']['country'].astype(object)) for wave in waves])
+    df['country'] = df['country'].astype('category')
+    summary = functools.reduce(merge_summary, [wave['summary'] for wave in waves], summary_state())
+    return df, summary
 
 
 
 ##### DEMOGRAPHIC INFO & SUMMARY VALUES OF RAW DATA #####
-def info_data(df):
+@profiled('info')
+def info_data(df, summary=False, age_tests=False):
+    
+    # all values are derived from the aggregate cube (participant counts and age histograms)
+    cube = AggregateCube.from_data(df)
+    report_info(cube.participant_counts(by=('group', 'gender')).unstack().reindex(GROUPS).to_numpy(),
+                [cube.age_histogram(group=group) for group in GROUPS], age_tests=age_tests)
+    
+    # summary values of the single items by group (mean, mode, median, std)
+    if summary:
+        print('\nSUMMARIZATION VALUES')
+        for statistic in ['mean', 'mode', 'median', 'std']:
+            values = cube.summary(statistic, by=('group', 'dimension', 'environment')).unstack(['dimension', 'environment'])
+            values.columns = [dimension+'_'+env for dimension, env in values.columns]
+            print('\n'+statistic+': '+str(values.reindex(GROUPS)[ITEMS].to_string()))
+
+
+def report_info(per_group_gender, age_hist, moments=None, age_tests=False):
+    
+    # demographic report from subject counts (groups x genders) and age histograms per group ({age: count});
+    # running moments (count, mean, m2 per group) are used for mean and std if given. the tests of age between
+    # groups (shapiro-wilk, levene, t-test) are opt-in, as they are the only part that needs scipy
+    if moments is None:
+        moments = np.array([[sum(hist.values()), 0, 0] for hist in age_hist], dtype=float)
+        for i, hist in enumerate(age_hist):
+            ages, counts = np.array(list(hist.keys()), dtype=float), np.array(list(hist.values()), dtype=float)
+            if counts.sum():
+                moments[i, 1] = (ages*counts).sum()/counts.sum()
+                moments[i, 2] = (counts*(ages - moments[i, 1])**2).sum()
     
     # count group size and gender distribution
-    group_count = df['group'].value_counts()
-    gender_count = df['gender'].value_counts()
-    gender_group = df.groupby('group')['gender'].value_counts()
+    group_count = pd.Series(per_group_gender.sum(axis=1), index=pd.Index(GROUPS, name='group'), name='count')
+    gender_count = pd.Series(per_group_gender.sum(axis=0), index=pd.Index(GENDERS, name='gender'), name='count')
+    gender_group = pd.Series(per_group_gender.ravel(), index=pd.MultiIndex.from_product([GROUPS, GENDERS], names=['group', 'gender']), name='count')
     
     # inspect age
-    age_mean = df['age'].mean()
-    age_std = df['age'].std()
-    age_groupmean = df.groupby('group').age.mean()
-    age_groupstd = df.groupby('group').age.std()
-    age_stroke = df.loc[df.group.eq('stroke'), 'age']
-    age_control = df.loc[df.group.eq('control'), 'age']
-    age_stroke_distribution = stats.shapiro(age_stroke.values)
-    age_control_distribution = stats.shapiro(age_control.values)
-    age_variance = stats.levene(age_stroke.values, age_control.values)
-    age_match = stats.ttest_ind(age_stroke.values, age_control.values)
+    total = combine_moments(moments[0], moments[1])
+    age_mean = total[1]
+    age_std = np.sqrt(total[2]/(total[0]-1))
+    age_groupmean = pd.Series(np.where(moments[:, 0] > 0, moments[:, 1], np.nan), index=pd.Index(GROUPS, name='group'), name='age')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.where(moments[:, 0] > 1, np.sqrt(moments[:, 2]/(moments[:, 0]-1)), np.nan)
+    age_groupstd = pd.Series(std, index=pd.Index(GROUPS, name='group'), name='age')
+    age_hist = {group: pd.Series(hist, name='count', dtype=np.int64).sort_index() for group, hist in zip(GROUPS, age_hist)}
     
     # print infos
     print('\n### DEMOGRAPHIC INFO ###')
     print('\nsubjects per group: '+str(group_count))
     print('\nsubjects per gender: '+str(gender_count))
     print('\nsubjects per group and gender: '+str(gender_group))
-    print('\nage in stroke group: ' +str(age_stroke))
-    print('\nage in control group: ' +str(age_control))
+    print('\nage in stroke group: ' +str(age_hist['stroke']))
+    print('\nage in control group: ' +str(age_hist['control']))
     print('\ntotal mean age: '+str(age_mean))
     print('\ntotal std of age: '+str(age_std))
     print('\nmean age by group: '+str(age_groupmean))
     print('\nstd of age by group: '+str(age_groupstd))
-    print('\ndistribution of age in control subjects: '+str(age_control_distribution))
-    print('distribution of age in stroke subjects: '+str(age_stroke_distribution))
+    if not age_tests:
+        return
+    
+    # shapiro-wilk needs at least three observations (nan for smaller groups)
+    age_distribution = {group: stats.shapiro(np.repeat(hist.index.to_numpy(), hist.to_numpy())) if hist.sum() >= 3 else (np.nan, np.nan)
+                        for group, hist in age_hist.items()}
+    age_variance = levene_from_histograms([hist.to_dict() for hist in age_hist.values()])
+    age_match = stats.ttest_ind_from_stats(moments[0, 1], age_groupstd['stroke'], moments[0, 0],
+                                           moments[1, 1], age_groupstd['control'], moments[1, 0])
+    print('\ndistribution of age in control subjects: '+str(age_distribution['control']))
+    print('distribution of age in stroke subjects: '+str(age_distribution['stroke']))
     print('variance of age between groups: '+str(age_variance))
     print('t-test for age difference between groups: ' +str(age_match))
 
     
-    # # mean values by group
-    # mean = df.groupby('group').mean(numeric_only=True)
+
+def median_values(df):
+    
+    # median values of the single items by group (input of plot_twosided_bar), from the aggregate cube
+    median = AggregateCube.from_data(df).summary('median', by=('group', 'dimension', 'environment')).unstack(['dimension', 'environment'])
+    median.columns = [dimension+'_'+env for dimension, env in median.columns]
+    df_median = median.reindex(GROUPS)[ITEMS]
+    df_median.index.name = 'group'
+    df_median.reset_index(inplace=True)
+    return df_median
+
+    
+
+##### INCREMENTAL SUMMARY STATISTICS #####
+# mergeable state of everything info_data() reports: processed participants, running moments of age
+# (count, mean, sum of squared deviations) and age histograms per group, response counts per
+# group x gender x item x level; new batches are folded in without touching the history
+
+def summary_state():
+    
+    return {'participants': set(),
+            'age': np.zeros((len(GROUPS), 3)),
+            'age_hist': [{} for group in GROUPS],
+            'items': np.zeros((len(GROUPS), len(GENDERS), len(ITEMS), LIKERT_LEVELS), dtype=np.int64)}
+
+
+def combine_moments(a, b):
+    
+    # parallel (chan) form of welford's update: rows of (count, mean, m2)
+    n = a[..., 0] + b[..., 0]
+    delta = b[..., 1] - a[..., 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(n > 0, a[..., 1] + delta*b[..., 0]/n, 0)
+        m2 = np.where(n > 0, a[..., 2] + b[..., 2] + delta**2*a[..., 0]*b[..., 0]/n, 0)
+    return np.stack([n, mean, m2], axis=-1)
+
+
+def merge_summary(state, other):
+    
+    # states of disjoint sets of participants (e.g. shards or waves)
+    overlap = state['participants'] & other['participants']
+    if overlap:
+        raise ValueError('participants counted in both states: '+str(sorted(overlap)[:5]))
+    merged = summary_state()
+    merged['participants'] = state['participants'] | other['participants']
+    merged['age'] = combine_moments(state['age'], other['age'])
+    for i in range(len(GROUPS)):
+        hist = dict(state['age_hist'][i])
+        for age, count in other['age_hist'][i].items():
+            hist[age] = hist.get(age, 0) + count
+        merged['age_hist'][i] = hist
+    merged['items'] = state['items'] + other['items']
+    return merged
+
+
+def batch_summary(df):
+    
+    # state of one batch of cleaned rows (vectorized over the batch)
+    batch = summary_state()
+    batch['participants'] = set(df['participant'])
+    group = pd.Categorical(df['group'], categories=GROUPS).codes.astype(np.intp)
+    gender = pd.Categorical(df['gender'], categories=GENDERS).codes.astype(np.intp)
+    age = df['age'].to_numpy().astype(float)
+    for i in range(len(GROUPS)):
+        ages = age[group == i]
+        if len(ages):
+            batch['age'][i] = [len(ages), ages.mean(), ((ages - ages.mean())**2).sum()]
+            values, counts = np.unique(ages.astype(int), return_counts=True)
+            batch['age_hist'][i] = dict(zip(values.tolist(), counts.tolist()))
+    
+    # one bincount over group x gender x item x level
+    levels = df[ITEMS].to_numpy().astype(np.intp) - 1
+    known = (group >= 0) & (gender >= 0)
+    index = np.ravel_multi_index((np.repeat(group[known], len(ITEMS)), np.repeat(gender[known], len(ITEMS)),
+                                  np.tile(np.arange(len(ITEMS)), known.sum()), levels[known].ravel()), batch['items'].shape)
+    batch['items'] = np.bincount(index, minlength=batch['items'].size).reshape(batch['items'].shape)
+    return batch
+
+
+def update_summary(state, df):
+    
+    # fold in only participants that are not part of the state yet
+    new = df[~df['participant'].isin(state['participants'])]
+    new = new.drop_duplicates('participant')
+    return merge_summary(state, batch_summary(new))
+
+
+def save_summary(state, path):
+    
+    data = {'participants': sorted(state['participants']), 'age': state['age'].tolist(),
+            'age_hist': [{str(age): count for age, count in hist.items()} for hist in state['age_hist']],
+            'items': state['items'].tolist()}
+    with open(path+'.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path+'.tmp', path)
+
+
+def load_summary(path):
+    
+    if not os.path.exists(path):
+        return summary_state()
+    with open(path) as f:
+        data = json.load(f)
+    return {'participants': set(data['participants']), 'age': np.array(data['age'], dtype=float),
+            'age_hist': [{int(age): count for age, count in hist.items()} for hist in data['age_hist']],
+            'items': np.array(data['items'], dtype=np.int64)}
+
+
+def levene_from_histograms(hists):
+    
+    # levene test (center=median, as scipy's default) from per-group histograms {value: count};
+    # undefined (nan) if a group has fewer than two observations
+    if any(sum(hist.values()) < 2 for hist in hists):
+        return np.nan, np.nan
+    groups = []
+    for hist in hists:
+        values = np.array(sorted(hist), dtype=float)
+        counts = np.array([hist[value] for value in sorted(hist)], dtype=float)
+        cumulative = np.cumsum(counts)
+        n = cumulative[-1]
+        lower = values[np.searchsorted(cumulative, (n+1)//2)]
+        upper = values[np.searchsorted(cumulative, n//2 + 1)]
+        deviation = np.abs(values - (lower+upper)/2)
+        groups.append((n, counts, deviation, (counts*deviation).sum()/n))
+    k = len(groups)
+    total = sum(n for n, _, _, _ in groups)
+    grand = sum(n*mean for n, _, _, mean in groups) / total
+    between = sum(n*(mean - grand)**2 for n, _, _, mean in groups)
+    within = sum((counts*(deviation - mean)**2).sum() for _, counts, deviation, mean in groups)
+    statistic = (total - k)/(k - 1) * between/within
+    return statistic, stats.f.sf(statistic, k-1, total-k)
+
+
+@profiled('info')
+def info_summary(state, age_tests=False):
+    
+    # same report as info_data(), from the incremental state (O(levels) instead of O(participants))
+    report_info(state['items'][:, :, 0, :].sum(axis=2), state['age_hist'], state['age'], age_tests=age_tests)
+
+
+
+##### INTER-ITEM RELIABILITY #####
+def covariance_state():
+    
+    # per group: count, item means and co-moment matrix (sum of outer products of deviations), O(items^2) memory
+    return {'n': np.zeros(len(GROUPS)), 'mean': np.zeros((len(GROUPS), len(ITEMS))),
+            'm2': np.zeros((len(GROUPS), len(ITEMS), len(ITEMS)))}
+
+
+def batch_covariance(df):
+    
+    # state of one chunk of cleaned rows
+    batch = covariance_state()
+    group = pd.Categorical(df['group'], categories=GROUPS).codes
+    values = df[ITEMS].to_numpy(dtype=float)
+    for i in range(len(GROUPS)):
+        rows = values[group == i]
+        if len(rows):
+            deviation = rows - rows.mean(axis=0)
+            batch['n'][i], batch['mean'][i], batch['m2'][i] = len(rows), rows.mean(axis=0), deviation.T @ deviation
+    return batch
+
+
+def merge_covariance(state, other):
+    
+    # multivariate form of combine_moments() (states of disjoint chunks, shards or waves)
+    n = state['n'] + other['n']
+    delta = other['mean'] - state['mean']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weight = np.where(n > 0, other['n'] / n, 0)
+        cross = np.where(n > 0, state['n']*other['n'] / n, 0)
+    return {'n': n, 'mean': state['mean'] + delta*weight[:, None],
+            'm2': state['m2'] + other['m2'] + cross[:, None, None]*delta[:, :, None]*delta[:, None, :]}
+
+
+def update_covariance(state, df):
+    return merge_covariance(state, batch_covariance(df))
+
+
+def stream_covariance(path, chunksize=100000, min_age=MIN_AGE):
     
-    # # mode values 
-    # mode = df.groupby('group').agg(pd.Series.mode)
-    # mode.drop(labels=['participant', 'TIME_start', 'TIME_end', 'country'], axis=1, inplace=True)
+    # one pass over the chunks of an export (cleaned and validated like load_data(); repeated submissions are only
+    # removed within a chunk, as a set of all participant ids would not fit the memory bound)
+    state = covariance_state()
+    reader = pd.read_csv(path, names=COLUMNS, header=0, dtype=READ_DTYPES, index_col=False, chunksize=chunksize)
+    for chunk in reader:
+        chunk = reject_duplicates(clean_chunk(chunk, min_age)[0])
+        state = update_covariance(state, chunk)
+    return state
 
 
-    # # median values
-    # df2 = df.drop(labels=['age', 'TIME_start', 'TIME_end', 'TIME_total'], axis=1)
-    # global df_median 
-    # df_median = df2.groupby('group').median()
-    # df_median.reset_index(inplace=True)
+def reliability(state):
     
-    # # print summary values
-    # print('\nSUMMARIZATION VALUES')
-    # print('\nmean: '+str(mean))
-    # print('\nmode: ' +str(mode.to_string()))
-    # print('\nmedian: ' + str(df_median))
+    # covariance & correlation matrix, cronbach's alpha per dimension (and of all items) and corrected item-total
+    # correlations (item vs. sum of the other items of its dimension), per group and of all groups, from the state only
+    pooled = functools.reduce(merge_covariance, [{key: value[[i]] for key, value in state.items()} for i in range(len(GROUPS))])
+    scales = {dimension: [i for i, item in enumerate(ITEMS) if item.startswith(dimension)] for dimension in DIMENSIONS}
+    scales['all'] = list(range(len(ITEMS)))
+    results = {'correlation': {}, 'alpha': [], 'item_total': []}
+    for group, n, m2 in zip(GROUPS + ['all'], np.append(state['n'], pooled['n']), np.concatenate([state['m2'], pooled['m2']])):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance = m2 / (n - 1)
+            sd = np.sqrt(np.diag(covariance))
+            results['correlation'][group] = pd.DataFrame(covariance / np.outer(sd, sd), index=ITEMS, columns=ITEMS)
+            for scale, items in scales.items():
+                sub = covariance[np.ix_(items, items)]
+                k = len(items)
+                results['alpha'].append({'group': group, 'scale': scale, 'n': int(n), 'items': k,
+                                         'alpha': k/(k-1) * (1 - np.trace(sub)/sub.sum())})
+                if scale == 'all':
+                    continue
+                for j, item in enumerate(items):
+                    rest = sub[j].sum() - sub[j, j]
+                    rest_variance = sub.sum() - 2*sub[j].sum() + sub[j, j]
+                    results['item_total'].append({'group': group, 'item': ITEMS[item], 'corrected_r': rest / np.sqrt(sub[j, j]*rest_variance),
+                                                  'alpha_if_deleted': (k-1)/(k-2) * (1 - (np.trace(sub) - sub[j, j])/rest_variance)})
+    results['alpha'] = pd.DataFrame(results['alpha'])
+    results['item_total'] = pd.DataFrame(results['item_total'])
+    return results
+
 
+def print_reliability(state):
     
+    results = reliability(state)
+    print('\n### INTER-ITEM RELIABILITY ###')
+    print('\ncronbach\'s alpha:\n'+results['alpha'].to_string(index=False))
+    print('\ncorrected item-total correlations:\n'+results['item_total'].to_string(index=False))
+    for group, correlation in results['correlation'].items():
+        print('\ninter-item correlations ('+group+'):\n'+correlation.round(3).to_string())
+    return results
+
+
 
 ##### REARRANGE DATA SET FOR FURTHER ANALYSIS & VISUALIZATION#####
+class ResponseMatrix:
+    # compact layout of the survey scores: values[participant, environment, dimension] (uint8) plus
+    # small code arrays per participant (country: codes into the countries labels, -1 if unknown); participants
+    # are sorted by group, so that selections of environment, dimension and group are views of the same array
+    # (no long format copies)
+    
+    __slots__ = ('values', 'participant', 'group', 'gender', 'age', 'country', 'countries')
+    
+    def __init__(self, values, participant, group, gender, age, country=None, countries=()):
+        self.values = values
+        self.participant = participant
+        self.group = group
+        self.gender = gender
+        self.age = age
+        self.country = np.full(len(values), -1, dtype=np.int16) if country is None else country
+        self.countries = np.asarray(countries, dtype=object)
+    
+    @classmethod
+    def from_frame(cls, df):
+        
+        # wide data frame (one row per participant, ITEMS columns)
+        group = pd.Categorical(df['group'], categories=GROUPS).codes.astype(np.int8)
+        gender = pd.Categorical(df['gender'], categories=GENDERS).codes.astype(np.int8) if 'gender' in df else np.full(len(df), -1, dtype=np.int8)
+        country, countries = pd.factorize(df['country'].astype(str)) if 'country' in df else (np.full(len(df), -1), [])
+        order = np.argsort(group, kind='stable')
+        values = df[ITEMS].to_numpy(dtype=np.uint8).reshape(-1, len(DIMENSIONS), len(ENVIRONMENTS)).transpose(0, 2, 1)
+        return cls(np.ascontiguousarray(values[order]), df['participant'].to_numpy(dtype=object)[order],
+                   group[order], gender[order], df['age'].to_numpy(dtype=np.uint8)[order], country.astype(np.int16)[order], countries)
+    
+    @classmethod
+    def from_long(cls, df):
+        
+        # long data frame (df_melted1: one row per participant and item)
+        wide = df.pivot_table(index=['participant', 'group', 'age'], columns='env', values='value', observed=True).reset_index()
+        return cls.from_frame(wide)
+    
+    @classmethod
+    def from_pairs(cls, df):
+        
+        # long data frame (df_melted2: one row per participant and environment, behaviour & emotion columns)
+        df = df.assign(env=df['env'].astype(str).replace({'home': 'dom', 'domestic': 'dom'}))
+        wide = df.pivot_table(index=['participant', 'group', 'age'], columns='env', values=DIMENSIONS, observed=True)
+        wide.columns = [dimension+'_'+env for dimension, env in wide.columns]
+        return cls.from_frame(wide.reset_index())
+    
+    def __len__(self):
+        return len(self.values)
+    
+    def group_slice(self, group):
+        code = GROUPS.index(group)
+        return slice(int(np.searchsorted(self.group, code, 'left')), int(np.searchsorted(self.group, code, 'right')))
+    
+    def view(self, environment=None, dimension=None, group=None):
+        
+        # zero-copy selection, e.g. view(dimension='behaviour') -> (participants x environments)
+        rows = slice(None) if group is None else self.group_slice(group)
+        env = slice(None) if environment is None else ENVIRONMENTS.index(environment)
+        dim = slice(None) if dimension is None else DIMENSIONS.index(dimension)
+        return self.values[rows, env, dim]
+    
+    def subset(self, group):
+        rows = self.group_slice(group)
+        return ResponseMatrix(self.values[rows], self.participant[rows], self.group[rows], self.gender[rows], self.age[rows],
+                              self.country[rows], self.countries)
+    
+    def factors(self):
+        
+        # per-participant factors (input of SubgroupIndex)
+        return {'group': np.array(GROUPS+[None], dtype=object)[self.group],
+                'gender': np.array(GENDERS+[None], dtype=object)[self.gender],
+                'country': np.append(self.countries, None)[self.country],
+                'age_band': age_bands(self.age)}
+    
+    def histogram_cube(self, levels=LIKERT_LEVELS):
+        
+        # counts[group, dimension, environment, level] in one bincount
+        known = self.group >= 0
+        shape = (len(GROUPS), len(DIMENSIONS), len(ENVIRONMENTS), levels)
+        group = np.broadcast_to(self.group[known, None, None], self.values[known].shape)
+        env = np.broadcast_to(np.arange(len(ENVIRONMENTS))[None, :, None], group.shape)
+        dim = np.broadcast_to(np.arange(len(DIMENSIONS))[None, None, :], group.shape)
+        index = np.ravel_multi_index((group, dim, env, self.values[known].astype(np.intp)-1), shape)
+        return np.bincount(index.ravel(), minlength=int(np.prod(shape))).reshape(shape)
+    
+    def to_long(self):
+        
+        # df_melted1 layout
+        n = len(self)
+        values = self.values.transpose(0, 2, 1).reshape(n, -1)
+        return pd.DataFrame({'participant': np.repeat(self.participant, len(ITEMS)),
+                             'group': pd.Categorical.from_codes(np.repeat(self.group, len(ITEMS)), categories=GROUPS),
+                             'age': np.repeat(self.age, len(ITEMS)),
+                             'env': np.tile(ITEMS, n),
+                             'value': values.ravel()})
+    
+    def to_pairs(self):
+        
+        # df_melted2 layout
+        n = len(self)
+        return pd.DataFrame({'participant': np.repeat(self.participant, len(ENVIRONMENTS)),
+                             'group': pd.Categorical.from_codes(np.repeat(self.group, len(ENVIRONMENTS)), categories=GROUPS),
+                             'age': np.repeat(self.age, len(ENVIRONMENTS)),
+                             'env': np.tile(['home', 'nature', 'public', 'traffic'], n),
+                             'behaviour': self.view(dimension='behaviour').ravel(),
+                             'emotion': self.view(dimension='emotion').ravel()})
+
+
+def as_response_matrix(data):
+    
+    # downstream functions accept the matrix itself as well as the wide and both long data frames
+    if isinstance(data, ResponseMatrix):
+        return data
+    if set(ITEMS) <= set(data.columns):
+        return ResponseMatrix.from_frame(data)
+    if 'value' in data.columns:
+        return ResponseMatrix.from_long(data)
+    return ResponseMatrix.from_pairs(data)
+
+
+@profiled('rearrange')
 def rearrange_data(df):
     
-    # sort by group
-    df.sort_values('group')
-    
-    # delete columns
-    df2 = df.drop(labels=['TIME_start', 'TIME_end', 'TIME_total', 'gender', 'country'], axis=1)
-    
-    # merge settings into one column
-    global df_melted1
-    df_melted1 = df2.melt(id_vars=['participant', 'group', 'age'], var_name = 'env', value_name = 'value')
-    df_melted1.sort_values('participant', inplace=True)
-
-    # rearrange survey scores into environmemt, behaviour, emotion (columns)
-    df_behaviour, df_emotion = df_melted1[(mask:=df_melted1['env'].str.contains('behaviour'))].copy(), df_melted1[~mask].copy()
-    df_behaviour2 = df_behaviour.replace(to_replace=['behaviour_dom', 'behaviour_nature', 'behaviour_public', 'behaviour_traffic'], value=['domestic', 'nature', 'public', 'traffic'])
-    df_behaviour2.rename(columns={'value': 'behaviour'}, inplace=True)
-    df_emotion2 = df_emotion.replace(to_replace=['emotion_dom', 'emotion_nature', 'emotion_public', 'emotion_traffic'], value=['home', 'nature', 'public', 'traffic'])
-    df_emotion2.rename(columns={'value': 'emotion'}, inplace=True)
-    global df_melted2
-    df_melted2 = df_behaviour2.merge(df_emotion2, how='inner', on=['env', 'participant', 'group', 'age'])
-    df_melted2.sort_values('participant', inplace=True)
+    # survey scores of all participants as (participants x environment x dimension) matrix;
+    # the long formats (df_melted1 / df_melted2) are available via to_long() / to_pairs()
+    return ResponseMatrix.from_frame(df)
    
    
 
+##### SUBGROUP INDEX #####
+def age_bands(age):
+    
+    # label of the age band of every subject ('<60' below the first band)
+    edges = [edge for edge, label in AGE_BANDS]
+    labels = np.array(['<'+str(edges[0])] + [label for edge, label in AGE_BANDS], dtype=object)
+    return labels[np.searchsorted(edges, np.asarray(age), side='right')]
+
+
+def frame_factors(df):
+    
+    # factor arrays of a wide or long data frame (environment & dimension are split from env once)
+    factors = {factor: np.asarray(df[factor].astype(str)) for factor in ['group', 'gender', 'country'] if factor in df}
+    if 'age' in df:
+        factors['age_band'] = age_bands(df['age'])
+    if 'env' in df:
+        env_codes, env_labels = pd.factorize(df['env'])
+        env_labels = pd.Index(env_labels).astype(str)
+        if env_labels.str.contains('_').all():
+            factors['dimension'] = np.asarray(env_labels.str.split('_').str[0])[env_codes]
+            env_labels = env_labels.str.split('_').str[1]
+        factors['environment'] = np.asarray(env_labels.map(lambda env: 'dom' if env in ['home', 'domestic'] else env))[env_codes]
+    return factors
+
+
+class SubgroupIndex:
+    # one bitset (np.packbits) of the rows of every value of every factor, built once;
+    # any conjunction of selections is answered by ANDs (ORs within a factor) of the bitsets
+    
+    __slots__ = ('n', 'bits')
+    
+    def __init__(self, factors):
+        self.n = len(next(iter(factors.values())))
+        self.bits = {}
+        for factor, values in factors.items():
+            codes, labels = pd.factorize(values)
+            for code, label in enumerate(labels):
+                self.bits[(factor, label)] = np.packbits(codes == code)
+    
+    def repeat(self, k, **factors):
+        
+        # index of a layout with k consecutive rows per indexed row (to_pairs / to_long of a response matrix);
+        # factors hold the values of further factors within every run of k rows, e.g. environment=ENVIRONMENTS
+        index = SubgroupIndex.__new__(SubgroupIndex)
+        index.n = self.n * k
+        index.bits = {key: np.packbits(np.repeat(np.unpackbits(bits, count=self.n), k)) for key, bits in self.bits.items()}
+        for factor, values in factors.items():
+            codes, labels = pd.factorize(np.asarray(values))
+            for code, label in enumerate(labels):
+                index.bits[(factor, label)] = np.packbits(np.tile(codes == code, self.n))
+        return index
+    
+    def bitset(self, **selection):
+        
+        # e.g. bitset(group='stroke', environment='traffic', age_band=['70-79', '80-89'])
+        bits = np.packbits(np.ones(self.n, dtype=bool))
+        empty = np.zeros_like(bits)
+        for factor, value in selection.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            factor_bits = empty
+            for value in values:
+                factor_bits = factor_bits | self.bits.get((factor, value), empty)
+            bits &= factor_bits
+        return bits
+    
+    def mask(self, **selection):
+        return np.unpackbits(self.bitset(**selection), count=self.n).view(bool)
+    
+    def rows(self, **selection):
+        return np.flatnonzero(self.mask(**selection))
+    
+    def count(self, **selection):
+        return int(np.unpackbits(self.bitset(**selection), count=self.n).sum())
+
+
+def subgroup_index(data):
+    
+    # subgroup index of the participants of a data set (rows of the response matrix), built once per data set
+    return SubgroupIndex(as_response_matrix(data).factors())
+
+
+
+##### COMPLETION-TIME INDEX #####
+def to_minutes(value):
+    
+    # epoch minutes of a timestamp, date string ('2022-06', '2022-06-13-08-29', ...) or of epoch minutes
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, str) and value.count('-') == 4:
+        value = pd.to_datetime(value, format=TIME_FORMAT)
+    return int((pd.Timestamp(value) - EPOCH) // pd.Timedelta(minutes=1))
+
+
+class TimeIndex:
+    # start times and completion times sorted once; time-window and speed queries are binary searches
+    # (O(log n) + size of the result) returning row positions of the data frame
+    
+    __slots__ = ('n', 'start', 'by_start', 'duration', 'by_duration', 'mismatch')
+    
+    def __init__(self, df):
+        start = df['TIME_start'].to_numpy(dtype=np.int64)
+        duration = df['TIME_end'].to_numpy(dtype=np.int64) - start
+        self.n = len(df)
+        self.by_start = np.argsort(start, kind='stable')
+        self.start = start[self.by_start]
+        self.by_duration = np.argsort(duration, kind='stable')
+        self.duration = duration[self.by_duration]
+        self.mismatch = np.flatnonzero(df['TIME_total'].to_numpy(dtype=np.int64) != duration)
+    
+    def window(self, begin=None, end=None):
+        
+        # rows started in [begin, end)
+        lo = 0 if begin is None else np.searchsorted(self.start, to_minutes(begin), side='left')
+        hi = self.n if end is None else np.searchsorted(self.start, to_minutes(end), side='left')
+        return self.by_start[lo:max(lo, hi)]
+    
+    def month(self, year, month):
+        begin = pd.Timestamp(year, month, 1)
+        return self.window(begin, begin + pd.offsets.MonthBegin())
+    
+    def faster_than(self, minutes):
+        return self.by_duration[:np.searchsorted(self.duration, minutes, side='left')]
+    
+    def slower_than(self, minutes):
+        return self.by_duration[np.searchsorted(self.duration, minutes, side='right'):]
+    
+    def inconsistent(self):
+        
+        # rows whose reported TIME_total differs from TIME_end - TIME_start
+        return self.mismatch
+    
+    def mask(self, rows):
+        mask = np.zeros(self.n, dtype=bool)
+        mask[rows] = True
+        return mask
+
+
+def select_times(df, begin=None, end=None, min_duration=None):
+    
+    # responses started in [begin, end) that took at least min_duration minutes (implausibly fast ones excluded)
+    index = TimeIndex(df)
+    keep = index.mask(index.window(begin, end))
+    if min_duration is not None:
+        fast = index.mask(index.faster_than(min_duration))
+        keep &= ~fast
+    return df[keep], index
+
+
+
+##### AGGREGATE CUBE #####
+def histogram_median(counts, levels):
+    
+    # median of every histogram along the last axis (mean of the two middle values for even counts)
+    n = counts.sum(axis=-1, keepdims=True)
+    cumulative = np.cumsum(counts, axis=-1)
+    lower = levels[np.argmax(cumulative >= (n+1)//2, axis=-1)]
+    upper = levels[np.argmax(cumulative >= n//2 + 1, axis=-1)]
+    return np.where(n[..., 0] > 0, (lower+upper)/2, np.nan)
+
+
+class AggregateCube:
+    # response counts over group x gender x country x age band x environment x dimension x level and
+    # subject counts over group x gender x country x age, each materialized by one bincount;
+    # means, medians, modes, stds and percentages are derived from the cells (O(cells), not O(rows))
+    
+    __slots__ = ('counts', 'subjects', 'labels')
+    AXES = ['group', 'gender', 'country', 'age_band', 'environment', 'dimension']
+    SUBJECT_AXES = ['group', 'gender', 'country', 'age']
+    
+    def __init__(self, counts, subjects, labels):
+        self.counts = counts
+        self.subjects = subjects
+        self.labels = labels
+    
+    @classmethod
+    def from_data(cls, data):
+        
+        # wide data frame, response matrix or one of the long data frames
+        if isinstance(data, AggregateCube):
+            return data
+        if isinstance(data, pd.DataFrame) and set(ITEMS) <= set(data.columns):
+            group = pd.Categorical(data['group'], categories=GROUPS).codes
+            gender = pd.Categorical(data['gender'], categories=GENDERS).codes if 'gender' in data else np.full(len(data), -1)
+            country, countries = pd.factorize(data['country'].astype(str)) if 'country' in data else (np.zeros(len(data), dtype=np.intp), ['unknown'])
+            values = data[ITEMS].to_numpy(dtype=np.intp).reshape(-1, len(DIMENSIONS), len(ENVIRONMENTS)).transpose(0, 2, 1)
+            age = data['age'].to_numpy()
+        else:
+            matrix = as_response_matrix(data)
+            group, gender, age, values = matrix.group, matrix.gender, matrix.age, matrix.values.astype(np.intp)
+            country, countries = matrix.country, matrix.countries
+        
+        # unknown codes get their own label
+        def with_unknown(codes, labels):
+            codes = np.asarray(codes, dtype=np.intp)
+            if (codes < 0).any():
+                return np.where(codes < 0, len(labels), codes), list(labels) + ['unknown']
+            return codes, list(labels)
+        group, group_labels = with_unknown(group, GROUPS)
+        gender, gender_labels = with_unknown(gender, GENDERS)
+        country, countries = with_unknown(country, countries)
+        bands = age_bands(age)
+        band_labels = ['<'+str(AGE_BANDS[0][0])] + [label for edge, label in AGE_BANDS]
+        band = np.array([band_labels.index(label) for label in band_labels])[pd.Categorical(bands, categories=band_labels).codes]
+        ages, age_codes = np.unique(np.asarray(age, dtype=np.int64), return_inverse=True)
+        labels = {'group': group_labels, 'gender': gender_labels, 'country': list(countries), 'age_band': band_labels,
+                  'environment': ENVIRONMENTS, 'dimension': DIMENSIONS, 'level': list(range(1, LIKERT_LEVELS+1)), 'age': ages.tolist()}
+        
+        # one bincount per cube
+        shape = tuple(len(labels[axis]) for axis in cls.AXES) + (LIKERT_LEVELS,)
+        subject = np.ravel_multi_index((group, gender, country, band), shape[:4])
+        env = np.arange(len(ENVIRONMENTS))[None, :, None]
+        dim = np.arange(len(DIMENSIONS))[None, None, :]
+        index = ((subject[:, None, None]*len(ENVIRONMENTS) + env)*len(DIMENSIONS) + dim)*LIKERT_LEVELS + values - 1
+        counts = np.bincount(index.ravel(), minlength=int(np.prod(shape))).reshape(shape)
+        subject_shape = shape[:3] + (len(ages),)
+        subjects = np.bincount(np.ravel_multi_index((group, gender, country, age_codes), subject_shape),
+                               minlength=int(np.prod(subject_shape))).reshape(subject_shape)
+        return cls(counts, subjects, labels)
+    
+    def _reduce(self, array, axes, by, selection):
+        
+        # select labels (single value or list per axis) and sum over every axis not in by
+        by_labels = []
+        for i, axis in enumerate(axes):
+            labels = self.labels[axis]
+            if axis in selection:
+                values = selection[axis] if isinstance(selection[axis], (list, tuple, set)) else [selection[axis]]
+                positions = [labels.index(value) for value in values if value in labels]
+                array = np.take(array, positions, axis=i)
+                labels = [labels[position] for position in positions]
+            if axis in by:
+                by_labels.append((axis, labels))
+        array = array.sum(axis=tuple(i for i, axis in enumerate(axes) if axis not in by))
+        return array, by_labels
+    
+    def histogram(self, by=(), **selection):
+        return self._reduce(self.counts, self.AXES + ['level'], list(by) + ['level'], selection)
+    
+    def summary(self, statistic, by=('group',), **selection):
+        
+        # statistic of the responses per cell of the by-axes: count, mean, std, median, mode or percentage (per level)
+        counts, by_labels = self.histogram(by, **selection)
+        by_labels = by_labels[:-1]
+        levels = np.arange(1, LIKERT_LEVELS+1)
+        n = counts.sum(axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = (counts*levels).sum(axis=-1) / n
+            if statistic == 'count':
+                values = n
+            elif statistic == 'mean':
+                values = mean
+            elif statistic == 'std':
+                values = np.sqrt((counts*(levels - mean[..., None])**2).sum(axis=-1) / (n-1))
+            elif statistic == 'median':
+                values = histogram_median(counts, levels)
+            elif statistic == 'mode':
+                values = np.where(n > 0, levels[np.argmax(counts, axis=-1)], np.nan)
+            elif statistic == 'percentage':
+                values = counts / n[..., None] * 100
+            else:
+                raise ValueError('unknown statistic: '+statistic)
+        
+        if not by_labels:
+            return values
+        index = pd.MultiIndex.from_product([labels for axis, labels in by_labels], names=[axis for axis, labels in by_labels])
+        if statistic == 'percentage':
+            return pd.DataFrame(values.reshape(len(index), -1), index=index, columns=pd.Index(levels, name='level'))
+        return pd.Series(values.ravel(), index=index, name=statistic)
+    
+    def participant_counts(self, by=('group',), **selection):
+        counts, by_labels = self._reduce(self.subjects, self.SUBJECT_AXES, by, selection)
+        index = pd.MultiIndex.from_product([labels for axis, labels in by_labels], names=[axis for axis, labels in by_labels])
+        return pd.Series(counts.ravel(), index=index, name='count')
+    
+    def age_histogram(self, **selection):
+        counts, _ = self._reduce(self.subjects, self.SUBJECT_AXES, ['age'], selection)
+        return {age: int(count) for age, count in zip(self.labels['age'], counts) if count}
+
+
+
+##### FIGURE RENDERING #####
+# 'show': interactive plt.show() per figure, 'save': headless (Agg), figures are queued and
+# written to files by flush_figures() on a process pool; histograms=False skips the diagnostic histograms
+RENDER = {'mode': 'show', 'directory': 'figures', 'formats': ['png'], 'histograms': True, 'workers': None}
+FIGURE_JOBS = []
+
+
+def configure_rendering(mode='show', directory='figures', formats=('png',), histograms=True, workers=None):
+    
+    RENDER.update(mode=mode, directory=directory, formats=list(formats), histograms=histograms, workers=workers)
+    if mode == 'save':
+        matplotlib.use('Agg')
+
+
+def render_figure(name, draw, *args):
+    
+    if RENDER['mode'] == 'show':
+        draw(*args)
+        plt.show()
+    else:
+        FIGURE_JOBS.append((name, draw, args))
+
+
+def save_figure(name, draw, args, directory, formats):
+    
+    # runs in a worker process
+    matplotlib.use('Agg')
+    fig = draw(*args)
+    name = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in name)
+    paths = []
+    for fmt in formats:
+        paths.append(os.path.join(directory, name+'.'+fmt))
+        fig.savefig(paths[-1])
+    plt.close(fig)
+    return paths
+
+
+@profiled('plot')
+def flush_figures():
+    
+    # render all queued figures in parallel
+    jobs = FIGURE_JOBS[:]
+    FIGURE_JOBS.clear()
+    if not jobs:
+        return []
+    os.makedirs(RENDER['directory'], exist_ok=True)
+    workers = RENDER['workers'] or os.cpu_count()
+    args = [(name, draw, draw_args, RENDER['directory'], RENDER['formats']) for name, draw, draw_args in jobs]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+            paths = list(pool.map(save_figure, *zip(*args)))
+    else:
+        paths = [save_figure(*job) for job in args]
+    return [path for job_paths in paths for path in job_paths]
+
+
+
 ##### MANN-WHITNEY-U-TEST #####
-def significance_test(df):
+
+def significance_spec():
+    
+    # declarative description of all comparisons of significance_test():
+    # every sample is a selection on group / dimension / environment (missing key = all)
+    spec = []
+    def add(test, title, label, a, b, alternative='two-sided', kind='between', hist=True):
+        spec.append({'test': test, 'title': title, 'label': label, 'a': a, 'b': b,
+                     'alternative': alternative, 'kind': kind, 'hist': hist})
+    
+    #1: compare overall values of stroke and control
+    add(1, 'compare overall values of stroke and control', 'stroke vs control', {'group': 'stroke'}, {'group': 'control'}, 'greater')
+    
+    #2 & 3: compare behaviour and emotion within groups
+    for test, group in [(2, 'stroke'), (3, 'control')]:
+        add(test, 'compare behaviour and emotion in '+group, 'behaviour vs emotion',
+            {'group': group, 'dimension': 'behaviour'}, {'group': group, 'dimension': 'emotion'}, kind='within')
+    
+    #4 & 5: compare behaviour / emotion in stroke and control
+    for test, dimension in [(4, 'behaviour'), (5, 'emotion')]:
+        add(test, 'compare '+dimension+' in stroke and control', 'stroke vs control',
+            {'group': 'stroke', 'dimension': dimension}, {'group': 'control', 'dimension': dimension}, 'greater')
+    
+    #6-9: compare environments between stroke and control (overall, behaviour, emotion)
+    for test, env in zip([6, 7, 8, 9], ENVIRONMENTS):
+        for dimension in [None] + DIMENSIONS:
+            a, b = {'group': 'stroke', 'environment': env}, {'group': 'control', 'environment': env}
+            if dimension:
+                a['dimension'] = b['dimension'] = dimension
+            add(test, 'compare environments between stroke and control ('+env+')', env+' '+(dimension or 'overall'), a, b, 'greater')
+    
+    #10 & 11: compare environments within groups
+    for test, group in [(10, 'stroke'), (11, 'control')]:
+        for dimension in [None] + DIMENSIONS:
+            for i, env1 in enumerate(ENVIRONMENTS):
+                for env2 in ENVIRONMENTS[i+1:]:
+                    a, b = {'group': group, 'environment': env1}, {'group': group, 'environment': env2}
+                    if dimension:
+                        a['dimension'] = b['dimension'] = dimension
+                    add(test, 'compare environments within groups ('+group+')', (dimension or 'overall')+': '+env1+' vs '+env2,
+                        a, b, kind='within', hist=False)
+    
+    return spec
+
+
+def sample_codes(df):
+    
+    # factor codes of the long data frame (env column is split once on its unique values)
+    env_codes, env_labels = pd.factorize(df['env'])
+    env_labels = pd.Index(env_labels).astype(str)
+    dimension_labels, dimension_of_env = np.unique(env_labels.str.split('_').str[0], return_inverse=True)
+    environment_labels, environment_of_env = np.unique(env_labels.str.split('_').str[1], return_inverse=True)
+    group_codes, group_labels = pd.factorize(df['group'].astype(str))
+    return {'group': (group_codes, list(group_labels)),
+            'dimension': (dimension_of_env[env_codes], list(dimension_labels)),
+            'environment': (environment_of_env[env_codes], list(environment_labels))}
+
+
+def likert_histograms(values, codes, selections, levels=LIKERT_LEVELS):
+    
+    # one bincount over group x dimension x environment x response level,
+    # every selection is then a sum over a sub-cube (O(levels) per sample instead of O(n))
+    factors = ['group', 'dimension', 'environment']
+    shape = tuple(len(codes[factor][1]) for factor in factors) + (levels,)
+    index = np.ravel_multi_index(tuple(codes[factor][0] for factor in factors) + (np.asarray(values, dtype=np.intp)-1,), shape)
+    cube = np.bincount(index, minlength=int(np.prod(shape))).reshape(shape)
+    return select_counts(cube, {factor: codes[factor][1] for factor in factors}, selections)
+
+
+def select_counts(cube, labels, selections):
+    
+    # per-selection counts over the levels of a group x dimension x environment x level cube
+    factors = ['group', 'dimension', 'environment']
+    counts = np.zeros((len(selections), cube.shape[-1]), dtype=np.int64)
+    for i, selection in enumerate(selections):
+        if any(value not in labels[factor] for factor, value in selection.items()):
+            continue
+        sub = tuple(labels[factor].index(selection[factor]) if factor in selection else slice(None) for factor in factors)
+        counts[i] = cube[sub].reshape(-1, cube.shape[-1]).sum(axis=0)
+    return counts
+
+
+def selection_masks(codes, selections):
+    
+    # row masks of the selections from the factor codes of sample_codes()
+    masks = np.ones((len(selections), len(codes['group'][0])), dtype=bool)
+    for i, selection in enumerate(selections):
+        for factor, value in selection.items():
+            factor_codes, labels = codes[factor]
+            masks[i] &= factor_codes == labels.index(value) if value in labels else False
+    return masks
+
+
+def rank_histograms(values, masks):
+    
+    # generic path: one shared sorting of the values, the tie blocks of the sorted array are the rank levels
+    order = np.argsort(values, kind='stable')
+    sorted_values = np.asarray(values)[order]
+    starts = np.flatnonzero(np.r_[True, sorted_values[1:] != sorted_values[:-1]])
+    counts = np.add.reduceat(masks[:, order], starts, axis=1, dtype=np.int64)
+    return sorted_values[starts], counts
+
+
+@functools.lru_cache(maxsize=EXACT_CACHE_SIZE)
+def exact_null_distribution(n1, n2, ties, cache_dir=CACHE_DIR):
+    
+    # exact null distribution of 2*U for sample sizes n1, n2 and the combined counts per occupied level (ties);
+    # kept in memory (lru) and on disk, so that every further test with the same pattern is a lookup
+    key = hashlib.sha1(repr((n1, n2, ties)).encode()).hexdigest()
+    path = os.path.join(cache_dir, 'mwu_exact', key+'.npy')
+    if os.path.exists(path):
+        return np.load(path)
+    
+    # dynamic programming over the levels: ways[k, s] = number of ways to draw k observations of sample a
+    # with doubled rank sum s from the levels processed so far
+    ties = np.asarray(ties, dtype=np.int64)
+    midrank2 = 2*(np.cumsum(ties) - ties) + ties + 1
+    max_sum = int(2*n1*(n1+n2) + 1)
+    ways = np.zeros((n1+1, max_sum+1))
+    ways[0, 0] = 1
+    for t, m in zip(ties, midrank2):
+        new = np.zeros_like(ways)
+        for a in range(min(t, n1)+1):
+            new[a:, a*m:] += math.comb(int(t), a) * ways[:n1+1-a, :max_sum+1-a*m]
+        ways = new
+    
+    # doubled rank sum -> doubled U statistic
+    offset = n1*(n1+1)
+    pmf = ways[n1, offset:offset+2*n1*n2+1] / math.comb(n1+n2, n1)
+    
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.save(path+'.tmp.npy', pmf)
+    os.replace(path+'.tmp.npy', path)
+    return pmf
+
+
+def mann_whitney_exact(counts_a, counts_b, alternative):
+    
+    # exact p-value for tied data from the cached null distribution
+    counts = counts_a + counts_b
+    n1, n2 = int(counts_a.sum()), int(counts_b.sum())
+    pmf = exact_null_distribution(n1, n2, tuple(int(t) for t in counts[counts > 0]))
+    below = np.cumsum(counts) - counts
+    u2 = int(round(2*((counts_a*(below + (counts+1)/2)).sum() - n1*(n1+1)/2)))
+    greater, less = pmf[u2:].sum(), pmf[:u2+1].sum()
+    if alternative == 'greater':
+        return min(greater, 1.0)
+    if alternative == 'less':
+        return min(less, 1.0)
+    return min(2*min(greater, less), 1.0)
+
+
+def mann_whitney_counts(counts_a, counts_b, alternatives, use_continuity=True, method='asymptotic'):
+    
+    # mann-whitney-u test from per-sample counts over ordered levels (one row per test)
+    counts_a, counts_b = np.atleast_2d(counts_a), np.atleast_2d(counts_b)
+    
+    # mid-ranks per level within the combined sample of each test
+    counts = counts_a + counts_b
+    below = np.cumsum(counts, axis=1) - counts
+    midrank = below + (counts+1)/2
+    n1, n2 = counts_a.sum(axis=1), counts_b.sum(axis=1)
+    n = n1 + n2
+    
+    # U statistic of sample a
+    u1 = (counts_a*midrank).sum(axis=1) - n1*(n1+1)/2
+    u2 = n1*n2 - u1
+    
+    # normal approximation with tie correction
+    alternatives = np.broadcast_to(np.asarray(alternatives), u1.shape)
+    u = np.where(alternatives == 'greater', u1, np.where(alternatives == 'less', u2, np.maximum(u1, u2)))
+    factor = np.where(alternatives == 'two-sided', 2, 1)
+    tie_term = (counts**3 - counts).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.sqrt(n1*n2/12 * ((n+1) - tie_term/(n*(n-1))))
+        z = (u - n1*n2/2 - 0.5*use_continuity) / sigma
+    pvalue = np.clip(stats.norm.sf(z)*factor, 0, 1)
+    
+    # exact p-values ('exact' for every test, 'auto' for small samples)
+    if method != 'asymptotic':
+        exact = (n1 > 0) & (n2 > 0)
+        if method == 'auto':
+            exact &= (n1 <= EXACT_MAX_N) & (n2 <= EXACT_MAX_N)
+        
+        # 'exact' falls back to the normal approximation (with a warning) where the dynamic programming table of the
+        # null distribution, (n1+1) x 2*n1*(n1+n2) doubles, would exceed EXACT_MAX_TABLE elements
+        too_large = exact & ((n1+1)*(2*n1*n + 2) > EXACT_MAX_TABLE)
+        if too_large.any():
+            warnings.warn(str(too_large.sum())+' test(s) too large for the exact null distribution (n1, n2 = '+
+                          ', '.join(str(a)+'/'+str(b) for a, b in zip(n1[too_large], n2[too_large]))+'), asymptotic p-values used')
+            exact &= ~too_large
+        for i in np.flatnonzero(exact):
+            pvalue[i] = mann_whitney_exact(counts_a[i], counts_b[i], alternatives[i])
+    
+    return u1, pvalue
+
+
+def permutation_batch(counts, n1, alternative, u2_observed, size, seed):
+    
+    # one batch of label permutations: under permutation the counts per level of sample a
+    # are multivariate hypergeometric, so a batch is drawn at once without shuffling single observations
+    rng = np.random.default_rng(seed)
+    counts = np.asarray(counts, dtype=np.int64)
+    n2 = int(counts.sum()) - n1
+    midrank2 = 2*(np.cumsum(counts) - counts) + counts + 1
+    draws = rng.multivariate_hypergeometric(counts, n1, size=size)
+    u2 = draws @ midrank2 - n1*(n1+1)
+    if alternative == 'greater':
+        return int((u2 >= u2_observed).sum())
+    if alternative == 'less':
+        return int((u2 <= u2_observed).sum())
+    return int((np.abs(u2 - n1*n2) >= abs(u2_observed - n1*n2)).sum())
+
+
+def permutation_pvalues(counts_a, counts_b, alternatives, n_permutations=100000, batch_size=PERMUTATION_BATCH,
+                        seed=0, alpha=0.05, confidence=0.99, workers=None):
+    
+    # permutation p-values for several tests: batches of all unfinished tests are spread over a process pool,
+    # every test gets its own seed sequence (results do not depend on the number of workers)
+    counts_a, counts_b = np.atleast_2d(counts_a), np.atleast_2d(counts_b)
+    alternatives = np.broadcast_to(np.asarray(alternatives), (len(counts_a),))
+    counts = counts_a + counts_b
+    n1 = counts_a.sum(axis=1)
+    midrank2 = 2*(np.cumsum(counts, axis=1) - counts) + counts + 1
+    u2_observed = (counts_a*midrank2).sum(axis=1) - n1*(n1+1)
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    
+    extreme = np.zeros(len(counts), dtype=np.int64)
+    done = np.zeros(len(counts), dtype=np.int64)
+    active = [i for i in range(len(counts)) if n1[i] > 0 and n1[i] < counts[i].sum()]
+    z = stats.norm.ppf(1 - (1-confidence)/2)
+    workers = workers or os.cpu_count()
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        while active:
+            jobs = []
+            for i in active:
+                size = int(min(batch_size, n_permutations - done[i]))
+                args = (counts[i], int(n1[i]), alternatives[i], int(u2_observed[i]), size, seeds[i].spawn(1)[0])
+                jobs.append((i, size, pool.submit(permutation_batch, *args) if pool else permutation_batch(*args)))
+            for i, size, job in jobs:
+                extreme[i] += job.result() if pool else job
+                done[i] += size
+            
+            # early stopping once the confidence interval (wilson) of the p-value lies on one side of alpha
+            p = (extreme + 1) / (done + 1)
+            half = z*np.sqrt(p*(1-p)/np.maximum(done, 1) + z**2/(4*np.maximum(done, 1)**2)) / (1 + z**2/np.maximum(done, 1))
+            active = [i for i in active if done[i] < n_permutations and p[i]-half[i] <= alpha <= p[i]+half[i]]
+    finally:
+        if pool:
+            pool.shutdown()
+    
+    pvalue = np.where(done > 0, (extreme + 1) / (done + 1), np.nan)
+    return pvalue, done
+
+
+def sample_histograms(df, spec):
+    
+    # per-sample counts over the response levels of both sides of every comparison; the wide and the pairs frame
+    # are converted to the response matrix, long frames with likert coded values take the bincount fast path,
+    # anything else the shared-sort path
+    selections = [comparison['a'] for comparison in spec] + [comparison['b'] for comparison in spec]
+    if isinstance(df, ResponseMatrix) or 'value' not in df:
+        df = as_response_matrix(df)
+        counts = select_counts(df.histogram_cube(), {'group': GROUPS, 'dimension': DIMENSIONS, 'environment': ENVIRONMENTS}, selections)
+        return np.arange(1, LIKERT_LEVELS+1), counts[:len(spec)], counts[len(spec):]
+    values = df['value'].to_numpy()
+    codes = sample_codes(df)
+    if np.issubdtype(values.dtype, np.integer) and (len(values) == 0 or (values.min() >= 1 and values.max() <= LIKERT_LEVELS)):
+        levels = np.arange(1, LIKERT_LEVELS+1)
+        counts = likert_histograms(values, codes, selections)
+    else:
+        levels, counts = rank_histograms(values, selection_masks(codes, selections))
+    return levels, counts[:len(spec)], counts[len(spec):]
+
+
+def draw_histograms(title, sample_a, sample_b, label_a, label_b):
+    
+    fig, (ax1, ax2) = plt.subplots(1, 2)
+    fig.suptitle(title)
+    ax1.hist(sample_a, histtype='bar') 
+    ax2.hist(sample_b,  histtype='bar') 
+    ax1.set_xlabel(label_a)
+    ax2.set_xlabel(label_b)
+    return fig
+
+
+@profiled('test')
+def significance_test(df, spec=None, validate=False, method='asymptotic', n_permutations=100000, seed=0, workers=None):
     # shapiro-wild test to check for normal distribution (-> p<0.05 means not normally distributed) 
     # + frequency histogram for visual check
     # mann-whitney-u test to check for significant difference between groups 
     # (requires non-normal distribution of underlying data)
     
-    # prepare data frame
-    df.drop(labels=['participant'], axis=1, inplace=True)
-    df_stroke, df_control = df[(mask:=df['group'].str.contains('stroke'))].copy(), df[~mask].copy()
-    df_stroke_beh, df_stroke_em = df_stroke[(mask:=df_stroke['env'].str.contains('behaviour'))].copy(), df_stroke[~mask].copy()
-    df_control_beh, df_control_em = df_control[(mask:=df_control['env'].str.contains('behaviour'))].copy(), df_control[~mask].copy()
+    # per-sample histograms of all comparisons
+    spec = spec or significance_spec()
+    levels, counts_a, counts_b = sample_histograms(df, spec)
     
-    #1: compare overall values of stroke and control
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('1: compare overall values of stroke vs. control')
-    ax1.hist(df_stroke['value'], histtype='bar') 
-    ax2.hist(df_control['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w1_1, pvalue1_1 = stats.shapiro(df_stroke['value']) #significance: not normally distributed
-    w1_2, pvalue1_2 = stats.shapiro(df_control['value']) #significance: not normally distributed
-    test1 = stats.mannwhitneyu(df_stroke['value'], df_control['value'], alternative='greater') #method='exact'
+    # all mann-whitney-u tests in one pass
+    alternatives = [comparison['alternative'] for comparison in spec]
+    u, pvalue = mann_whitney_counts(counts_a, counts_b, alternatives, method='asymptotic' if method == 'permutation' else method)
+    
+    # permutation p-values instead of the normal approximation (batches on a pool of worker processes)
+    if method == 'permutation':
+        pvalue, _ = permutation_pvalues(counts_a, counts_b, alternatives, n_permutations=n_permutations, seed=seed, workers=workers)
+    
+    # optional cross-check against scipy on the raw samples (scipy has no exact test for tied data)
+    if validate and method == 'asymptotic':
+        if isinstance(df, ResponseMatrix) or 'value' not in df:
+            df = as_response_matrix(df).to_long()
+        values = df['value'].to_numpy()
+        masks = selection_masks(sample_codes(df), [comparison[side] for comparison in spec for side in 'ab'])
+        for i, comparison in enumerate(spec):
+            reference = stats.mannwhitneyu(values[masks[2*i]], values[masks[2*i+1]],
+                                           alternative=comparison['alternative'], method='asymptotic')
+            if not (np.isclose(reference.statistic, u[i]) and np.isclose(reference.pvalue, pvalue[i], equal_nan=True)):
+                raise ValueError('mann-whitney-u of test '+str(comparison['test'])+' ('+comparison['label']+') differs from scipy: U = '+
+                                 str(u[i])+' vs. '+str(reference.statistic)+', p = '+str(pvalue[i])+' vs. '+str(reference.pvalue))
+    
+    # shapiro-wilk test once per distinct sample (samples are restored from their histograms)
+    shapiro = {}
+    def normality(selection, counts):
+        key = tuple(sorted(selection.items()))
+        if key not in shapiro:
+            shapiro[key] = stats.shapiro(np.repeat(levels, counts)) if counts.sum() >= 3 else (np.nan, np.nan)
+        return shapiro[key]
+    
+    rows = []
+    for i, comparison in enumerate(spec):
+        w_a, pvalue_a = normality(comparison['a'], counts_a[i])
+        w_b, pvalue_b = normality(comparison['b'], counts_b[i])
+        rows.append({'test': comparison['test'], 'title': comparison['title'], 'label': comparison['label'],
+                     'kind': comparison['kind'], 'alternative': comparison['alternative'],
+                     'n_a': int(counts_a[i].sum()), 'n_b': int(counts_b[i].sum()),
+                     'shapiro_w_a': w_a, 'shapiro_p_a': pvalue_a, 'shapiro_w_b': w_b, 'shapiro_p_b': pvalue_b,
+                     'U': u[i], 'pvalue': pvalue[i]})
+    results = pd.DataFrame(rows)
+    
+    # frequency histograms for visual check
+    for i, comparison in enumerate(spec):
+        if comparison['hist'] and RENDER['histograms']:
+            title = str(comparison['test'])+': '+comparison['title']+' ('+comparison['label']+')'
+            render_figure('significance_'+str(comparison['test'])+'_'+comparison['label'], draw_histograms, title,
+                          np.repeat(levels, counts_a[i]), np.repeat(levels, counts_b[i]),
+                          ' '.join(str(v) for v in comparison['a'].values()), ' '.join(str(v) for v in comparison['b'].values()))
+    
+    # print results
     print('\n### SIGNIFICANCE TESTING ###')
-    print('\n1: compare overall values of stroke and control')
-    print(w1_1, pvalue1_1)
-    print(w1_2, pvalue1_2)
-    print(test1)
+    for test, rows in results.groupby('test', sort=False):
+        print('\n'+str(test)+': '+rows['title'].iloc[0])
+        print(rows.drop(columns=['test', 'title']).to_string(index=False))
     
-    #2: compare behaviour and emotion in stroke
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('2: compare behaviour and emotion in stroke')
-    ax1.hist(df_stroke_beh['value'], histtype='bar') 
-    ax2.hist(df_stroke_em['value'],  histtype='bar') 
-    ax1.set_xlabel('behaviour')
-    ax2.set_xlabel('emotion')
-    plt.show()
-    w2_1, pvalue2_1 = stats.shapiro(df_stroke_beh['value']) #significance: not normally distributed
-    w2_2, pvalue2_2 = stats.shapiro(df_stroke_em['value']) #significance: not normally distributed
-    test2 = stats.mannwhitneyu(df_stroke_beh['value'], df_stroke_em['value'], alternative='two-sided') #method='exact'
-    print('\n2: compare behaviour and emotion in stroke')
-    print(w2_1, pvalue2_1)
-    print(w2_2, pvalue2_2)
-    print(test2)
-    
-    #3: compare behaviour and emotion in control
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('3: compare behaviour and emotion in control')
-    ax1.hist(df_control_beh['value'], histtype='bar') 
-    ax2.hist(df_control_em['value'],  histtype='bar') 
-    ax1.set_xlabel('behaviour')
-    ax2.set_xlabel('emotion')
-    plt.show()
-    w3_1, pvalue3_1 = stats.shapiro(df_control_beh['value']) #significance: not normally distributed
-    w3_2, pvalue3_2 = stats.shapiro(df_control_em['value']) #significance: not normally distributed
-    test3 = stats.mannwhitneyu(df_control_beh['value'], df_control_em['value'], alternative='two-sided') #method='exact'
-    print('\n3: compare behaviour and emotion in control')
-    print(w3_1, pvalue3_1)
-    print(w3_2, pvalue3_2)
-    print(test3)
-    
-    #4: compare behaviour in stroke and control
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('4: compare behaviour in stroke and control')
-    ax1.hist(df_stroke_beh['value'], histtype='bar') 
-    ax2.hist(df_control_beh['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w4_1, pvalue4_1 = stats.shapiro(df_stroke_beh['value']) #significance: not normally distributed
-    w4_2, pvalue4_2 = stats.shapiro(df_control_beh['value']) #significance: not normally distributed
-    test4 = stats.mannwhitneyu(df_stroke_beh['value'], df_control_beh['value'], alternative='greater') #method='exact'
-    print('\n4: compare behaviour in stroke and control')
-    print(w4_1, pvalue4_1)
-    print(w4_2, pvalue4_2)
-    print(test4)
-    
-    #5: compare emotion in stroke and control
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('5: compare emotion in stroke and control')
-    ax1.hist(df_stroke_em['value'], histtype='bar') 
-    ax2.hist(df_control_em['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w5_1, pvalue5_1 = stats.shapiro(df_stroke_em['value']) #significance: not normally distributed
-    w5_2, pvalue5_2 = stats.shapiro(df_control_em['value']) #significance: not normally distributed
-    test5 = stats.mannwhitneyu(df_stroke_em['value'], df_control_em['value'], alternative='greater') #method='exact'
-    print('\n5: compare emotion in stroke and control')
-    print(w5_1, pvalue5_1)
-    print(w5_2, pvalue5_2)
-    print(test5)
-    
-    #6: compare environments between stroke and control (domestic)
-    df_stroke_dom = df_stroke[(mask:=df_stroke['env'].str.contains('dom'))].copy()
-    df_control_dom = df_control[(mask:=df_control['env'].str.contains('dom'))].copy()
-    df_stroke_dom_beh, df_stroke_dom_em = df_stroke_dom[(mask:=df_stroke_dom['env'].str.contains('beh'))].copy(), df_stroke_dom[~mask].copy()
-    df_control_dom_beh, df_control_dom_em = df_control_dom[(mask:=df_control_dom['env'].str.contains('beh'))].copy(), df_control_dom[~mask].copy()
-    #overall
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('6: compare environments between stroke and control (domestic overall)')
-    ax1.hist(df_stroke_dom['value'], histtype='bar') 
-    ax2.hist(df_control_dom['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w6_1_ov, pvalue6_1_ov = stats.shapiro(df_stroke_dom['value']) #significance: not normally distributed
-    w6_2_ov, pvalue6_2_ov = stats.shapiro(df_control_dom['value']) #significance: not normally distributed
-    test6_ov = stats.mannwhitneyu(df_stroke_dom['value'], df_control_dom['value'], alternative='greater', ) #method='exact'
-    print('\n6: compare environments between stroke and control (domestic)\n(domestic overall)')
-    print(w6_1_ov, pvalue6_1_ov)
-    print(w6_2_ov, pvalue6_2_ov)
-    print(test6_ov)
-    #behaviour
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('6: compare environments between stroke and control (domestic behaviour)')
-    ax1.hist(df_stroke_dom_beh['value'], histtype='bar') 
-    ax2.hist(df_control_dom_beh['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w6_1_beh, pvalue6_1_beh = stats.shapiro(df_stroke_dom_beh['value'])
-    w6_2_beh, pvalue6_2_beh = stats.shapiro(df_control_dom_beh['value'])
-    test6_beh = stats.mannwhitneyu(df_stroke_dom_beh['value'], df_control_dom_beh['value'], alternative='greater') #method='exact'
-    print('(domestic behaviour)')
-    print(w6_1_beh, pvalue6_1_beh)
-    print(w6_2_beh, pvalue6_2_beh)
-    print(test6_beh)
-    #emotion
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('6: compare environments between stroke and control (domestic emotion)')
-    ax1.hist(df_stroke_dom_em['value'], histtype='bar') 
-    ax2.hist(df_control_dom_em['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w6_1_em, pvalue6_1_em = stats.shapiro(df_stroke_dom_em['value']) #plot confirms non-normal distribution
-    w6_2_em, pvalue6_2_em = stats.shapiro(df_control_dom_em['value']) #significance: not normally distributed
-    test6_em = stats.mannwhitneyu(df_stroke_dom_em['value'], df_control_dom_em['value'], alternative='greater') #method='exact'
-    print('(domestic emotion)')
-    print(w6_1_em, pvalue6_1_em)
-    print(w6_2_em, pvalue6_2_em)
-    print(test6_em)
-    
-    #7: compare environments between stroke and control (nature)
-    df_stroke_nat = df_stroke[(mask:=df_stroke['env'].str.contains('nature'))].copy()
-    df_control_nat = df_control[(mask:=df_control['env'].str.contains('nature'))].copy()
-    df_stroke_nat_beh, df_stroke_nat_em = df_stroke_nat[(mask:=df_stroke_nat['env'].str.contains('beh'))].copy(), df_stroke_nat[~mask].copy()
-    df_control_nat_beh, df_control_nat_em = df_control_nat[(mask:=df_control_nat['env'].str.contains('beh'))].copy(), df_control_nat[~mask].copy()
-    #overall
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('7: compare environments between stroke and control (nature overall)')
-    ax1.hist(df_stroke_nat['value'], histtype='bar') 
-    ax2.hist(df_control_nat['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w7_1_ov, pvalue7_1_ov = stats.shapiro(df_stroke_nat['value']) #no significance
-    w7_2_ov, pvalue7_2_ov = stats.shapiro(df_control_nat['value']) #significance: not normally distributed
-    test7_ov = stats.mannwhitneyu(df_stroke_nat['value'], df_control_nat['value'], alternative='greater') #method='exact'
-    print('\n7: compare environments between stroke and control (nature)\n(nature overall)')
-    print(w7_1_ov, pvalue7_1_ov)
-    print(w7_2_ov, pvalue7_2_ov)
-    print(test7_ov)
-    #behaviour
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('7: compare environments between stroke and control (nature behaviour)')
-    ax1.hist(df_stroke_nat_beh['value'], histtype='bar') 
-    ax2.hist(df_control_nat_beh['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w7_1_beh, pvalue7_1_beh = stats.shapiro(df_stroke_nat_beh['value']) #significance: not normally distributed
-    w7_2_beh, pvalue7_2_beh = stats.shapiro(df_control_nat_beh['value']) #significance: not normally distributed
-    test7_beh = stats.mannwhitneyu(df_stroke_nat_beh['value'], df_control_nat_beh['value'], alternative='greater') #method='exact'
-    print('(nature behaviour)')
-    print(w7_1_beh, pvalue7_1_beh)
-    print(w7_2_beh, pvalue7_2_beh)
-    print(test7_beh)
-    #emotion
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('7: compare environments between stroke and control (nature emotion)')
-    ax1.hist(df_stroke_nat_em['value'], histtype='bar') 
-    ax2.hist(df_control_nat_em['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w7_1_em, pvalue7_1_em = stats.shapiro(df_stroke_nat_em['value']) #significance: not normally distributed
-    w7_2_em, pvalue7_2_em = stats.shapiro(df_control_nat_em['value']) #significance: not normally distributed
-    test7_em = stats.mannwhitneyu(df_stroke_nat_em['value'], df_control_nat_em['value'], alternative='greater') #method='exact'
-    print('(nature emotion)')
-    print(w7_1_em, pvalue7_1_em)
-    print(w7_2_em, pvalue7_2_em)
-    print(test7_em)
-    
-    #8: compare environments between stroke and control (public)
-    df_stroke_pub = df_stroke[(mask:=df_stroke['env'].str.contains('public'))].copy()
-    df_control_pub = df_control[(mask:=df_control['env'].str.contains('public'))].copy()
-    df_stroke_pub_beh, df_stroke_pub_em = df_stroke_pub[(mask:=df_stroke_pub['env'].str.contains('beh'))].copy(), df_stroke_pub[~mask].copy()
-    df_control_pub_beh, df_control_pub_em = df_control_pub[(mask:=df_control_pub['env'].str.contains('beh'))].copy(), df_control_pub[~mask].copy()
-    #overall
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('8: compare environments between stroke and control (public overall)')
-    ax1.hist(df_stroke_pub['value'], histtype='bar') 
-    ax2.hist(df_control_pub['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w8_1_ov, pvalue8_1_ov = stats.shapiro(df_stroke_pub['value']) #significance: not normally distributed
-    w8_2_ov, pvalue8_2_ov = stats.shapiro(df_control_pub['value']) #significance: not normally distributed
-    test8_ov = stats.mannwhitneyu(df_stroke_pub['value'], df_control_pub['value'], alternative='greater') #method='exact'
-    print('\n8: compare environments between stroke and control (public)\n(public overall)')
-    print(w8_1_ov, pvalue8_1_ov)
-    print(w8_2_ov, pvalue8_2_ov)
-    print(test8_ov)
-    #behaviour
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('8: compare environments between stroke and control (public behaviour)')
-    ax1.hist(df_stroke_pub_beh['value'], histtype='bar') 
-    ax2.hist(df_control_pub_beh['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w8_1_beh, pvalue8_1_beh = stats.shapiro(df_stroke_nat_beh['value']) #significance: not normally distributed
-    w8_2_beh, pvalue8_2_beh = stats.shapiro(df_control_nat_beh['value']) #significance: not normally distributed
-    test8_beh = stats.mannwhitneyu(df_stroke_nat_beh['value'], df_control_nat_beh['value'], alternative='greater') #method='exact'
-    print('(public behaviour)')
-    print(w8_1_beh, pvalue8_1_beh)
-    print(w8_2_beh, pvalue8_2_beh)
-    print(test8_beh)
-    #emotion
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('8: compare environments between stroke and control (public emotion)')
-    ax1.hist(df_stroke_pub_em['value'], histtype='bar') 
-    ax2.hist(df_control_pub_em['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w8_1_em, pvalue8_1_em = stats.shapiro(df_stroke_pub_em['value']) #significance: not normally distributed
-    w8_2_em, pvalue8_2_em = stats.shapiro(df_control_pub_em['value']) #plot confirms non-normal distribution
-    test8_em = stats.mannwhitneyu(df_stroke_pub_em['value'], df_control_pub_em['value'], alternative='greater') #method='exact'
-    print('public emotion)')
-    print(w8_1_em, pvalue8_1_em)
-    print(w8_2_em, pvalue8_2_em)
-    print(test8_em)
-    
-    #9: compare environments between stroke and control (traffic)
-    df_stroke_traf = df_stroke[(mask:=df_stroke['env'].str.contains('traffic'))].copy()
-    df_control_traf = df_control[(mask:=df_control['env'].str.contains('traffic'))].copy()
-    df_stroke_traf_beh, df_stroke_traf_em = df_stroke_traf[(mask:=df_stroke_traf['env'].str.contains('beh'))].copy(), df_stroke_traf[~mask].copy()
-    df_control_traf_beh, df_control_traf_em = df_control_traf[(mask:=df_control_traf['env'].str.contains('beh'))].copy(), df_control_traf[~mask].copy()
-    #overall
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('9: compare environments between stroke and control (traffic overall)')
-    ax1.hist(df_stroke_traf['value'], histtype='bar') 
-    ax2.hist(df_control_traf['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w9_1_ov, pvalue9_1_ov = stats.shapiro(df_stroke_traf['value']) #no significance
-    w9_2_ov, pvalue9_2_ov = stats.shapiro(df_control_traf['value']) #significance: not normally distributed
-    test9_ov = stats.mannwhitneyu(df_stroke_traf['value'], df_control_traf['value'], alternative='greater') #method='exact'
-    print('\n9: compare environments between stroke and control (traffic)\n(traffic overall)')
-    print(w9_1_ov, pvalue9_1_ov)
-    print(w9_2_ov, pvalue9_2_ov)
-    print(test9_ov)
-    #behaviour
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('9: compare environments between stroke and control (traffic behaviour)')
-    ax1.hist(df_stroke_traf_beh['value'], histtype='bar') 
-    ax2.hist(df_control_traf_beh['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w9_1_beh, pvalue9_1_beh = stats.shapiro(df_stroke_traf_beh['value']) #plot confirms non-normal distribution
-    w9_2_beh, pvalue9_2_beh = stats.shapiro(df_control_traf_beh['value']) #significance: not normally distributed
-    test9_beh = stats.mannwhitneyu(df_stroke_traf_beh['value'], df_control_traf_beh['value'], alternative='greater') #method='exact'
-    print('(traffic behaviour)')
-    print(w9_1_beh, pvalue9_1_beh)
-    print(w9_2_beh, pvalue9_2_beh)
-    print(test9_beh)
-    #emotion
-    fig, (ax1, ax2) = plt.subplots(1, 2)
-    fig.suptitle('9: compare environments between stroke and control (traffic emotion)')
-    ax1.hist(df_stroke_traf_em['value'], histtype='bar') 
-    ax2.hist(df_control_traf_em['value'],  histtype='bar') 
-    ax1.set_xlabel('stroke')
-    ax2.set_xlabel('control')
-    plt.show()
-    w9_1_em, pvalue9_1_em = stats.shapiro(df_stroke_traf_em['value']) #plot confirms non-normal distribution
-    w9_2_em, pvalue9_2_em = stats.shapiro(df_control_traf_em['value']) #significance: not normally distributed
-    test9_em = stats.mannwhitneyu(df_stroke_traf_em['value'], df_control_traf_em['value'], alternative='greater') #method='exact'
-    print('(traffic emotion)')
-    print(w9_1_em, pvalue9_1_em)
-    print(w9_2_em, pvalue9_2_em)
-    print(test9_em)
-    
-    #10: compare environments within groups (stroke)
-    #overall
-    test10_1_ov = stats.mannwhitneyu(df_stroke_dom['value'], df_stroke_nat['value'])
-    test10_2_ov = stats.mannwhitneyu(df_stroke_dom['value'], df_stroke_pub['value'])
-    test10_3_ov = stats.mannwhitneyu(df_stroke_dom['value'], df_stroke_traf['value'])
-    test10_4_ov = stats.mannwhitneyu(df_stroke_nat['value'], df_stroke_pub['value'])
-    test10_5_ov = stats.mannwhitneyu(df_stroke_nat['value'], df_stroke_traf['value'])
-    test10_6_ov = stats.mannwhitneyu(df_stroke_pub['value'], df_stroke_traf['value'])
-    print('\n10: compare environments within groups (stroke)\n(overall)')
-    print('dom vs nat: ' + str(test10_1_ov))
-    print('dom vs pub: ' + str(test10_2_ov))
-    print('dom vs traf: ' + str(test10_3_ov))
-    print('nat vs pub: ' + str(test10_4_ov))
-    print('nat vs traf: ' + str(test10_5_ov))
-    print('pub vs traf: ' + str(test10_6_ov))
-    #behaviour
-    test10_1_beh = stats.mannwhitneyu(df_stroke_dom_beh['value'], df_stroke_nat_beh['value'])
-    test10_2_beh = stats.mannwhitneyu(df_stroke_dom_beh['value'], df_stroke_pub_beh['value'])
-    test10_3_beh = stats.mannwhitneyu(df_stroke_dom_beh['value'], df_stroke_traf_beh['value'])
-    test10_4_beh = stats.mannwhitneyu(df_stroke_nat_beh['value'], df_stroke_pub_beh['value'])
-    test10_5_beh = stats.mannwhitneyu(df_stroke_nat_beh['value'], df_stroke_traf_beh['value'])
-    test10_6_beh = stats.mannwhitneyu(df_stroke_pub_beh['value'], df_stroke_traf_beh['value'])
-    print('(behaviour)')
-    print('dom vs nat: ' + str(test10_1_beh))
-    print('dom vs pub: ' + str(test10_2_beh))
-    print('dom vs traf: ' + str(test10_3_beh))
-    print('nat vs pub: ' + str(test10_4_beh))
-    print('nat vs traf: ' + str(test10_5_beh))
-    print('pub vs traf: ' + str(test10_6_beh))
-    #emotion
-    test10_1_em = stats.mannwhitneyu(df_stroke_dom_em['value'], df_stroke_nat_em['value'])
-    test10_2_em = stats.mannwhitneyu(df_stroke_dom_em['value'], df_stroke_pub_em['value'])
-    test10_3_em = stats.mannwhitneyu(df_stroke_dom_em['value'], df_stroke_traf_em['value'])
-    test10_4_em = stats.mannwhitneyu(df_stroke_nat_em['value'], df_stroke_pub_em['value'])
-    test10_5_em = stats.mannwhitneyu(df_stroke_nat_em['value'], df_stroke_traf_em['value'])
-    test10_6_em = stats.mannwhitneyu(df_stroke_pub_em['value'], df_stroke_traf_em['value'])
-    print('(emotion)')
-    print('dom vs nat: ' + str(test10_1_em))
-    print('dom vs pub: ' + str(test10_2_em))
-    print('dom vs traf: ' + str(test10_3_em))
-    print('nat vs pub: ' + str(test10_4_em))
-    print('nat vs traf: ' + str(test10_5_em))
-    print('pub vs traf: ' + str(test10_6_em))
-    
-    #11: compare environments within groups (control)
-    #overall
-    test11_1_ov = stats.mannwhitneyu(df_control_dom['value'], df_control_nat['value'])
-    test11_2_ov = stats.mannwhitneyu(df_control_dom['value'], df_control_pub['value'])
-    test11_3_ov = stats.mannwhitneyu(df_control_dom['value'], df_control_traf['value'])
-    test11_4_ov = stats.mannwhitneyu(df_control_nat['value'], df_control_pub['value'])
-    test11_5_ov = stats.mannwhitneyu(df_control_nat['value'], df_control_traf['value'])
-    test11_6_ov = stats.mannwhitneyu(df_control_pub['value'], df_control_traf['value'])
-    print('\n11: compare environments within groups (control)\n(overall)')
-    print('dom vs nat: ' + str(test11_1_ov))
-    print('dom vs pub: ' + str(test11_2_ov))
-    print('dom vs traf: ' + str(test11_3_ov))
-    print('nat vs pub: ' + str(test11_4_ov))
-    print('nat vs traf: ' + str(test11_5_ov))
-    print('pub vs traf: ' + str(test11_6_ov))
-    #behaviour
-    test11_1_beh = stats.mannwhitneyu(df_control_dom_beh['value'], df_control_nat_beh['value'])
-    test11_2_beh = stats.mannwhitneyu(df_control_dom_beh['value'], df_control_pub_beh['value'])
-    test11_3_beh = stats.mannwhitneyu(df_control_dom_beh['value'], df_control_traf_beh['value'])
-    test11_4_beh = stats.mannwhitneyu(df_control_nat_beh['value'], df_control_pub_beh['value'])
-    test11_5_beh = stats.mannwhitneyu(df_control_nat_beh['value'], df_control_traf_beh['value'])
-    test11_6_beh = stats.mannwhitneyu(df_control_pub_beh['value'], df_control_traf_beh['value'])
-    print('(behaviour)')
-    print('dom vs nat: ' + str(test11_1_beh))
-    print('dom vs pub: ' + str(test11_2_beh))
-    print('dom vs traf: ' + str(test11_3_beh))
-    print('nat vs pub: ' + str(test11_4_beh))
-    print('nat vs traf: ' + str(test11_5_beh))
-    print('pub vs traf: ' + str(test11_6_beh))
-    #emotion
-    test11_1_em = stats.mannwhitneyu(df_control_dom_em['value'], df_control_nat_em['value'])
-    test11_2_em = stats.mannwhitneyu(df_control_dom_em['value'], df_control_pub_em['value'])
-    test11_3_em = stats.mannwhitneyu(df_control_dom_em['value'], df_control_traf_em['value'])
-    test11_4_em = stats.mannwhitneyu(df_control_nat_em['value'], df_control_pub_em['value'])
-    test11_5_em = stats.mannwhitneyu(df_control_nat_em['value'], df_control_traf_em['value'])
-    test11_6_em = stats.mannwhitneyu(df_control_pub_em['value'], df_control_traf_em['value'])
-    print('(emotion)')
-    print('dom vs nat: ' + str(test11_1_em))
-    print('dom vs pub: ' + str(test11_2_em))
-    print('dom vs traf: ' + str(test11_3_em))
-    print('nat vs pub: ' + str(test11_4_em))
-    print('nat vs traf: ' + str(test11_5_em))
-    print('pub vs traf: ' + str(test11_6_em))
+    return results
+
+
+
+##### BOOTSTRAP CONFIDENCE INTERVALS #####
+def batched_ranks(codes, n_levels):
     
+    # mid-ranks of every row of a (replicates x m) matrix of integer level codes, via one bincount
+    replicates = len(codes)
+    offset = np.arange(replicates)[:, None]*n_levels
+    counts = np.bincount((offset + codes).ravel(), minlength=replicates*n_levels).reshape(replicates, n_levels)
+    midrank = np.cumsum(counts, axis=1) - counts + (counts+1)/2
+    return np.take_along_axis(midrank, codes, axis=1)
+
+
+def batched_spearman(x_codes, x_levels, y_codes, y_levels):
+    
+    # spearman rho of every row (= pearson correlation of the ranks)
+    rx = batched_ranks(x_codes, x_levels)
+    ry = batched_ranks(y_codes, y_levels)
+    rx -= rx.mean(axis=1, keepdims=True)
+    ry -= ry.mean(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (rx*ry).sum(axis=1) / np.sqrt((rx**2).sum(axis=1) * (ry**2).sum(axis=1))
+
+
+def weighted_spearman(weights, age_codes, age_levels, age_repeats, score_counts):
+    
+    # spearman rho of age and every score for every row of a (replicates x m) matrix of participant weights
+    # (resampling counts): mid-ranks come from the weighted level counts, the cross term from one product per
+    # participant, so the (replicates x observations) sample is never materialized
+    replicates = len(weights)
+    n = weights.sum(axis=1) * age_repeats
+    offset = np.arange(replicates)[:, None]*age_levels
+    age_counts = np.bincount((offset + age_codes).ravel(), weights=weights.ravel(),
+                             minlength=replicates*age_levels).reshape(replicates, age_levels) * age_repeats
+    age_ranks = np.cumsum(age_counts, axis=1) - age_counts + (age_counts+1)/2
+    centre = n*((n+1)/2)**2
+    sxx = (age_counts*age_ranks**2).sum(axis=1) - centre
+    weighted_age_ranks = weights * np.take_along_axis(age_ranks, np.broadcast_to(age_codes, weights.shape), axis=1)
+    rho = {}
+    for name, counts in score_counts.items():
+        level_counts = weights @ counts
+        ranks = np.cumsum(level_counts, axis=1) - level_counts + (level_counts+1)/2
+        syy = (level_counts*ranks**2).sum(axis=1) - centre
+        sxy = np.einsum('rm,rm->r', weighted_age_ranks, ranks @ counts.T) - centre
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rho[name] = sxy / np.sqrt(sxx*syy)
+    return rho
+
+
+def bootstrap_ci(data, replicates=BOOTSTRAP_REPLICATES, seed=0, level=0.95, block_elements=4000000):
+    
+    # participant-level bootstrap (one observation per participant and environment): participants are resampled
+    # in blocks of replicates (at most block_elements draws each) and enter only as resampling counts
+    matrix = as_response_matrix(data)
+    behaviour = matrix.view(dimension='behaviour').astype(np.int64)
+    emotion = matrix.view(dimension='emotion').astype(np.int64)
+    variables = {'total': behaviour + emotion, 'behaviour': behaviour, 'emotion': emotion}
+    ages, age_codes = np.unique(matrix.age, return_inverse=True)
+    score_counts = {}
+    for name, values in variables.items():
+        _, codes = np.unique(values, return_inverse=True)
+        codes = codes.reshape(values.shape)
+        score_counts[name] = np.stack([(codes == level).sum(axis=1) for level in range(codes.max()+1)], axis=1).astype(float)
+    sums = {'behaviour': behaviour.sum(axis=1), 'emotion': emotion.sum(axis=1)}
+    
+    rng = np.random.default_rng(seed)
+    tail = (1-level)/2*100
+    results = []
+    for subgroup in ['all', 'stroke', 'control']:
+        members = np.arange(len(matrix)) if subgroup == 'all' else np.arange(len(matrix))[matrix.group_slice(subgroup)]
+        m = len(members)
+        if m == 0:
+            continue
+        
+        def statistics(weights):
+            n = weights.sum(axis=1) * len(ENVIRONMENTS)
+            mean_behaviour = weights @ sums['behaviour'][members] / n
+            mean_emotion = weights @ sums['emotion'][members] / n
+            values = {'mean_behaviour': mean_behaviour, 'mean_emotion': mean_emotion,
+                      'total_percentage': (mean_behaviour + mean_emotion)/8*100}
+            rho = weighted_spearman(weights, age_codes[members], len(ages), len(ENVIRONMENTS),
+                                    {name: counts[members] for name, counts in score_counts.items()})
+            values.update({'rho_'+name: values for name, values in rho.items()})
+            return values
+        
+        # resampling counts of a block of replicates via one bincount
+        observed = statistics(np.ones((1, m)))
+        block = max(1, block_elements // m)
+        replicate_values = []
+        for start in range(0, replicates, block):
+            size = min(block, replicates - start)
+            index = rng.integers(0, m, size=(size, m))
+            weights = np.bincount((index + np.arange(size)[:, None]*m).ravel(), minlength=size*m).reshape(size, m).astype(float)
+            replicate_values.append(statistics(weights))
+        
+        for statistic, estimate in observed.items():
+            replicate = np.concatenate([values[statistic] for values in replicate_values])
+            low, high = np.nanpercentile(replicate, [tail, 100-tail])
+            results.append({'subgroup': subgroup, 'statistic': statistic, 'estimate': estimate[0], 'ci_low': low, 'ci_high': high})
+    
+    return pd.DataFrame(results)
+
 
 
 ##### CORRELATION AGE - HAZARD PERCEPTION #####   
-def spearman_correlation(df_input):
+def correlation_variables(data):
     
-    # prepare data frame
-    df = df_input.copy()
+    # participant-level variables of the wide data frame (or response matrix):
+    # age, all eight items, behaviour / emotion / total scores and completion time
+    if isinstance(data, ResponseMatrix):
+        items = data.values.transpose(0, 2, 1).reshape(len(data), -1)
+        variables = {'age': data.age}
+        variables.update({item: items[:, i] for i, item in enumerate(ITEMS)})
+    else:
+        variables = {'age': data['age'].to_numpy()}
+        variables.update({item: data[item].to_numpy() for item in ITEMS})
+    variables['behaviour'] = sum(variables[item].astype(np.int64) for item in ITEMS[:4])
+    variables['emotion'] = sum(variables[item].astype(np.int64) for item in ITEMS[4:])
+    variables['total'] = variables['behaviour'] + variables['emotion']
+    if not isinstance(data, ResponseMatrix) and 'TIME_total' in data:
+        variables['TIME_total'] = data['TIME_total'].to_numpy()
+    return variables
+
+
+def kendall_matrix(data, table_elements=4000000):
+    
+    # kendall tau-b of all column pairs from contingency tables (the variables are discrete: likert items, scores,
+    # age in years, minutes): with T the joint counts of the sorted levels of x and y,
+    # concordant - discordant = sum T_ij (sum_{k>i, l>j} T_kl - sum_{k>i, l<j} T_kl), O(n + levels_x levels_y) per pair;
+    # S holds 2*(concordant - discordant) off the diagonal and 2*(untied pairs) on it, tau-b = S_xy / sqrt(S_xx S_yy).
+    # pairs whose table would exceed table_elements fall back to scipy's O(n log n) tau-b
+    n, p = data.shape
+    codes, counts = zip(*[np.unique(column, return_inverse=True, return_counts=True)[1:] for column in data.T])
+    S = np.diag([n*(n-1) - (t*(t-1)).sum() for t in counts]).astype(float)
+    for x, y in zip(*np.triu_indices(p, k=1)):
+        levels_x, levels_y = len(counts[x]), len(counts[y])
+        if levels_x*levels_y <= table_elements:
+            table = np.bincount(codes[x]*levels_y + codes[y], minlength=levels_x*levels_y).reshape(levels_x, levels_y)
+            below = np.cumsum(table[::-1], axis=0)[::-1] - table
+            difference = (table*((np.cumsum(below[:, ::-1], axis=1)[:, ::-1] - below) - (np.cumsum(below, axis=1) - below))).sum()
+            S[x, y] = S[y, x] = 2*difference
+        else:
+            S[x, y] = S[y, x] = stats.kendalltau(data[:, x], data[:, y]).statistic * np.sqrt(S[x, x]*S[y, y])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tau = S / np.sqrt(np.outer(np.diag(S), np.diag(S)))
+    
+    # asymptotic p-value with tie correction (as scipy.stats.kendalltau, method='asymptotic')
+    ties = []
+    for t in counts:
+        t = t.astype(float)
+        ties.append(((t*(t-1)).sum()/2, (t*(t-1)*(t-2)).sum(), (t*(t-1)*(2*t+5)).sum()))
+    tie, tie0, tie1 = np.array(ties).T
+    m = n*(n-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = ((m*(2*n+5) - tie1[:, None] - tie1[None, :])/18 + 2*np.outer(tie, tie)/m + np.outer(tie0, tie0)/(9*m*(n-2)))
+        z = (S/2) / np.sqrt(var)
+    pvalue = np.where(np.isnan(tau), np.nan, np.clip(2*stats.norm.sf(np.abs(z)), 0, 1))
+    return tau, pvalue
+
+
+@profiled('correlate')
+def rank_correlation(variables, index=None, subgroups=None, kendall=True):
+    
+    # spearman (and kendall tau-b) matrix of all variables for every subgroup: every variable is
+    # ranked once per subgroup, the coefficients of all pairs come from matrix operations
+    names = list(variables)
+    X = np.column_stack([np.asarray(values, dtype=float) for values in variables.values()])
+    subgroups = subgroups or {'all': {}}
+    pairs = np.triu_indices(len(names), k=1)
+    results = []
+    for subgroup, selection in subgroups.items():
+        data = X[index.rows(**selection)] if selection else X
+        n = len(data)
+        
+        # spearman: pearson correlation of the ranks, t-distribution for the p-value (as scipy.stats.spearmanr)
+        ranks = stats.rankdata(data, axis=0)
+        ranks -= ranks.mean(axis=0)
+        norm = np.sqrt((ranks**2).sum(axis=0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rho = (ranks.T @ ranks) / np.outer(norm, norm)
+            t = rho * np.sqrt((n-2) / ((1-rho)*(1+rho)))
+        pvalue = 2*stats.t.sf(np.abs(t), n-2)
+        coefficients = [('spearman', rho, pvalue)]
+        if kendall:
+            coefficients.append(('kendall', *kendall_matrix(data)))
+        
+        for method, coefficient, p in coefficients:
+            results.append(pd.DataFrame({'subgroup': subgroup, 'method': method, 'x': np.array(names)[pairs[0]], 'y': np.array(names)[pairs[1]],
+                                         'n': n, 'coefficient': coefficient[pairs], 'pvalue': p[pairs]}))
+    
+    return pd.concat(results, ignore_index=True)
+
+
+@profiled('correlate')
+def spearman_correlation(df_input, replicates=BOOTSTRAP_REPLICATES, seed=0, df_ci=None, index=None):
+    
+    # prepare data frame (rows of to_pairs(); the subgroup index of the participants is built once per data set
+    # and passed in if available)
+    matrix = as_response_matrix(df_input)
+    df = matrix.to_pairs()
     df['total'] = df['behaviour'] + df['emotion']
-    df_stroke, df_control = df[(mask:=df['group'].str.contains('stroke'))].copy(), df[~mask].copy()
-    
-    all_total = stats.spearmanr(df['age'], df['total']) #negligible
-    all_behaviour = stats.spearmanr(df['age'], df['behaviour']) #negligible
-    all_emotion = stats.spearmanr(df['age'], df['emotion']) #negligible
-    stroke_total = stats.spearmanr(df_stroke['age'], df_stroke['total']) #negligible
-    stroke_behaviour = stats.spearmanr(df_stroke['age'], df_stroke['behaviour']) #weak
-    stroke_emotion = stats.spearmanr(df_stroke['age'], df_stroke['emotion']) #moderate
-    control_total = stats.spearmanr(df_control['age'], df_control['total']) #negligible
-    control_behaviour = stats.spearmanr(df_control['age'], df_control['behaviour']) #negligible
-    control_emotion = stats.spearmanr(df_control['age'], df_control['emotion']) #negligible
+    index = (subgroup_index(matrix) if index is None else index).repeat(len(ENVIRONMENTS))
+    
+    # age vs total / behaviour / emotion in all subjects, stroke and control
+    variables = {'age': df['age'].to_numpy(), 'total': df['total'].to_numpy(),
+                 'behaviour': df['behaviour'].to_numpy(), 'emotion': df['emotion'].to_numpy()}
+    subgroups = {'all': {}, 'stroke': {'group': 'stroke'}, 'control': {'group': 'control'}}
+    correlation = rank_correlation(variables, index, subgroups, kendall=False)
+    correlation = correlation[correlation['x'].eq('age')].reset_index(drop=True)
+    
+    # bootstrap confidence intervals of rho (participants resampled; shared with plot_riskperception if given)
+    if df_ci is None:
+        df_ci = bootstrap_ci(df_input, replicates=replicates, seed=seed)
+    df_ci = df_ci[df_ci['statistic'].str.startswith('rho')]
+    df_ci = df_ci.assign(y=df_ci['statistic'].str[4:])[['subgroup', 'y', 'ci_low', 'ci_high']]
+    correlation = correlation.merge(df_ci, on=['subgroup', 'y'], how='left')
    
     print('\n### CORRELATION AGE & HAZARD PERCEPTION ###')
-    print('\nall:')
-    print('(total)\n ' + str(all_total))
-    print('(behaviour)\n' + str(all_behaviour))
-    print('(emotion)\n' + str(all_emotion))
-    print('\nstroke:')
-    print('(total)\n ' + str(stroke_total))
-    print('(behaviour)\n' + str(stroke_behaviour))
-    print('(emotion)\n' + str(stroke_emotion))
-    print('\ncontrol:')
-    print('(total)\n ' + str(control_total))
-    print('(behaviour)\n' + str(control_behaviour))
-    print('(emotion)\n' + str(control_emotion))
-    
-    
-    
-#####TWO-SIDED BAR CHART: MEDIAN SINGLE VALUES STROKE VS. CONTROL #####
-def plot_twosided_bar(df):
+    print('(bootstrap confidence intervals: 95%, '+str(replicates)+' replicates)')
+    for subgroup, rows in correlation.groupby('subgroup', sort=False):
+        print('\n'+subgroup+':')
+        print(rows.drop(columns=['subgroup', 'method', 'x']).to_string(index=False))
     
-    # prepare data frame
-    df_melted = df.melt(id_vars=['group'],
-                    var_name = 'env',
-                    value_name = 'value')
+    return correlation
+    
+    
+    
+##### POWER & SAMPLE SIZE SIMULATION #####
+def fit_power_model(data, prior=0.5):
+    
+    # per group: likert probabilities of the eight items (cube counts + prior per level), the observed ages and the
+    # correlation of a gaussian copula between age and the items of each dimension (from the observed spearman rho of
+    # age and the dimension over all environments, as in spearman_correlation(); 0 where either is constant), so that
+    # behaviour and emotion keep the sign of their own association with age
+    matrix = as_response_matrix(data)
+    cube = AggregateCube.from_data(matrix)
+    model = {}
+    for g, group in enumerate(GROUPS):
+        counts = cube.histogram(by=('environment', 'dimension'), group=group)[0] + prior
+        members = matrix.group == g
+        age = np.repeat(matrix.age[members], len(ENVIRONMENTS))
+        rho = np.zeros(len(DIMENSIONS))
+        for d in range(len(DIMENSIONS)):
+            values = matrix.values[members][:, :, d].ravel()
+            if len(np.unique(age)) > 1 and len(np.unique(values)) > 1:
+                rho[d] = stats.spearmanr(age, values)[0]
+        model[group] = {'likert': counts / counts.sum(axis=-1, keepdims=True), 'ages': np.sort(matrix.age[members]),
+                        'r': 2*np.sin(np.pi*rho/6)}
+    return model
+
 
+def simulate_group(model, n, replicates, rng):
     
-    df_melted_behaviour, df_melted_emotion = df_melted[(mask:=df_melted.env.str.contains('behaviour'))].copy(), df_melted[~mask].copy()
+    # (replicates x n) ages and (replicates x n x environment x dimension) responses of synthetic participants
+    z = rng.standard_normal((replicates, n))
+    ages = model['ages'][np.minimum((stats.norm.cdf(z)*len(model['ages'])).astype(np.intp), len(model['ages'])-1)]
+    # latent item scores: copula correlation r[dimension] with the latent age
+    latent = model['r']*z[:, :, None, None] + np.sqrt(1 - model['r']**2)*rng.standard_normal((replicates, n, len(ENVIRONMENTS), len(DIMENSIONS)))
+    cumulative = np.cumsum(model['likert'], axis=-1)[..., :-1]
+    values = 1 + (stats.norm.cdf(latent)[..., None] > cumulative).sum(axis=-1)
+    return ages, values.astype(np.int8)
+
+
+def power_batch(model, spec, n, replicates, alpha, seed):
     
-    df_med_behaviour = df_melted_behaviour.replace(to_replace=['behaviour_dom', 'behaviour_nature', 'behaviour_public', 'behaviour_traffic'], value=['home', 'nature', 'public', 'traffic'])
-    df_med_behaviour.rename(columns={'value': 'behaviour'}, inplace=True)
+    # runs in a worker process: rejections of every comparison in a batch of simulated studies
+    rng = np.random.default_rng(seed)
+    draws = {group: simulate_group(model[group], n[group], replicates, rng) for group in GROUPS}
     
-    df_med_emotion = df_melted_emotion.replace(to_replace=['emotion_dom', 'emotion_nature', 'emotion_public', 'emotion_traffic'], value=['home', 'nature', 'public', 'traffic'])
-    df_med_emotion.rename(columns={'value': 'emotion'}, inplace=True)
+    # mann-whitney-u: level counts per replicate x group x environment x dimension, all tests of all replicates at once
+    cube = np.stack([np.stack([(values == level).sum(axis=1) for level in range(1, LIKERT_LEVELS+1)], axis=-1)
+                     for ages, values in draws.values()], axis=1)
+    selections = [comparison['a'] for comparison in spec] + [comparison['b'] for comparison in spec]
+    labels = {'group': GROUPS, 'environment': ENVIRONMENTS, 'dimension': DIMENSIONS}
+    weights = np.zeros((len(selections), len(GROUPS), len(ENVIRONMENTS), len(DIMENSIONS)), dtype=np.int64)
+    for i, selection in enumerate(selections):
+        cells = [[j for j, label in enumerate(labels[factor]) if selection.get(factor, label) == label] for factor in labels]
+        weights[i][np.ix_(*cells)] = 1
+    counts = np.einsum('rgedl,sged->rsl', cube, weights)
+    alternatives = np.tile([comparison['alternative'] for comparison in spec], replicates)
+    _, pvalue = mann_whitney_counts(counts[:, :len(spec)].reshape(-1, LIKERT_LEVELS), counts[:, len(spec):].reshape(-1, LIKERT_LEVELS), alternatives)
+    rejections = {('mann-whitney', comparison['test'], comparison['label']): count
+                  for comparison, count in zip(spec, (pvalue.reshape(replicates, len(spec)) < alpha).sum(axis=0))}
     
-    df_med_sorted = df_med_behaviour.merge(df_med_emotion, how='inner', on=['group', 'env'])
-    df_med_sorted.sort_values(by='group', inplace=True)
+    # spearman age - total / behaviour / emotion (one observation per participant and environment, as spearman_correlation)
+    for subgroup in ['all'] + GROUPS:
+        members = GROUPS if subgroup == 'all' else [subgroup]
+        age = np.concatenate([np.repeat(draws[group][0], len(ENVIRONMENTS), axis=1) for group in members], axis=1).astype(np.int64)
+        values = np.concatenate([draws[group][1].reshape(replicates, -1, len(DIMENSIONS)) for group in members], axis=1).astype(np.int64)
+        size = age.shape[1]
+        for name, score in [('total', values.sum(axis=2)), ('behaviour', values[:, :, 0]), ('emotion', values[:, :, 1])]:
+            rho = batched_spearman(age - age.min(), age.max() - age.min() + 1, score - score.min(), score.max() - score.min() + 1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = rho * np.sqrt((size-2) / ((1-rho)*(1+rho)))
+            rejections[('spearman', subgroup, 'age vs '+name)] = int((2*stats.t.sf(np.abs(t), size-2) < alpha).sum())
+    return rejections
+
+
+@profiled('power')
+def power_simulation(data, sizes=(10, 20, 50, 100, 200, 500), replicates=1000, alpha=0.05, ratio=1.0, prior=0.5,
+                     seed=0, workers=None, batch_elements=4000000):
     
-    # plot
-    df_med_sorted.loc[df_med_sorted.group.eq('stroke'), 'behaviour'] = df_med_sorted['behaviour'].mul(-1)
-    df_med_sorted.loc[df_med_sorted.group.eq('stroke'), 'emotion'] = df_med_sorted['emotion'].mul(-1)
-    df_stroke, df_control = df_med_sorted[(mask:=df_med_sorted['group'].str.contains('stroke'))].copy(), df_med_sorted[~mask].copy()
-    df_stroke.set_index(['env'])
-    df_control.set_index(['env'])
+    # monte carlo power of every comparison of significance_test() and spearman_correlation() per candidate
+    # sample size (stroke subjects; control = ratio * stroke), replicates in batches spread over a process pool
+    model = fit_power_model(data, prior)
+    spec = significance_spec()
+    jobs = []
+    for size in sizes:
+        n = {'stroke': int(size), 'control': max(int(round(size*ratio)), 2)}
+        batch = max(1, batch_elements // (sum(n.values())*len(ITEMS)))
+        for start in range(0, replicates, batch):
+            jobs.append((size, n, min(batch, replicates-start)))
+    seeds = np.random.SeedSequence(seed).spawn(len(jobs))
+    workers = min(workers or os.cpu_count(), len(jobs))
+    args = [(model, spec, n, batch, alpha, job_seed) for (size, n, batch), job_seed in zip(jobs, seeds)]
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            batches = list(pool.map(power_batch, *zip(*args)))
+    else:
+        batches = [power_batch(*job) for job in args]
+    
+    # power curves: share of significant replicates (+ monte carlo standard error)
+    rejections = {}
+    for (size, n, batch), counts in zip(jobs, batches):
+        for key, count in counts.items():
+            rejections[(size,) + key] = rejections.get((size,) + key, 0) + count
+    curves = pd.DataFrame([{'size': size, 'analysis': analysis, 'test': test, 'label': label, 'power': count/replicates}
+                           for (size, analysis, test, label), count in rejections.items()])
+    curves['se'] = np.sqrt(curves['power']*(1-curves['power'])/replicates)
+    render_figure('power', draw_power, curves, alpha)
+    return curves
+
+
+def draw_power(curves, alpha):
+    
+    fig, axes = plt.subplots(1, 2, figsize=(14, 7), sharey=True)
+    for ax, analysis in zip(axes, ['mann-whitney', 'spearman']):
+        for (test, label), rows in curves[curves['analysis'] == analysis].groupby(['test', 'label'], sort=False):
+            ax.plot(rows['size'], rows['power'], marker='o', lw=1, label=str(test)+': '+label)
+        ax.axhline(0.8, color='dimgray', linestyle='--', lw=1)
+        ax.axhline(alpha, color='dimgray', linestyle=':', lw=1)
+        ax.set_xscale('log')
+        ax.set_title(analysis)
+        ax.set_xlabel('stroke subjects')
+        ax.legend(fontsize=6, ncol=2)
+    axes[0].set_ylabel('power')
+    return fig
+
+
+
+##### TWO-SIDED BAR CHART: MEDIAN SINGLE VALUES STROKE VS. CONTROL #####
+def draw_twosided_bar(df_stroke, df_control):
     
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12,7), sharey=True)
     df_stroke.set_index(['env']).loc[['traffic', 'public', 'nature', 'home']].plot.barh(ax=ax1, legend=False, color=['tab:blue', 'darkorange'])
@@ -566,41 +2053,59 @@ def plot_twosided_bar(df):
     plt.subplots_adjust(wspace=0.12)
     plt.subplots_adjust(top=0.85) 
 
-    plt.show()
-    
-
+    return fig
 
-##### MEAN RISKPERCEPTION STROKE VS. CONTROL#####
-def plot_riskperception(df):
 
+@profiled('plot')
+def plot_twosided_bar(df):
+    
     # prepare data frame
-    df.drop(labels=['age'], axis=1, inplace=True)
-    df_mean = df.groupby('group').mean()
-    df_mean.sort_values('group', ascending=False, inplace=True)
-    df_std = df.groupby(['group'])['behaviour', 'emotion'].std()
-    df_total = df.copy()
-    df_total['total'] = df_total['behaviour'] + df_total['emotion']
-    df_total.drop(columns=['behaviour', 'emotion'], inplace=True)
-    df_total_mean = df_total.groupby('group').mean()
-    df_total_mean.sort_values('group', ascending=False, inplace=True)
-    df_total_mean['percentage'] = ((df_total_mean['total']/8)*100).round(2)
-    df_total_perc = df_total_mean.drop(columns=['total'])
+    df_melted = df.melt(id_vars=['group'],
+                    var_name = 'env',
+                    value_name = 'value')
+
+    
+    behaviour = df_melted['env'].str.startswith('behaviour')
+    df_melted_behaviour, df_melted_emotion = df_melted[behaviour], df_melted[~behaviour]
+    
+    df_med_behaviour = df_melted_behaviour.replace(to_replace=['behaviour_dom', 'behaviour_nature', 'behaviour_public', 'behaviour_traffic'], value=['home', 'nature', 'public', 'traffic'])
+    df_med_behaviour.rename(columns={'value': 'behaviour'}, inplace=True)
+    
+    df_med_emotion = df_melted_emotion.replace(to_replace=['emotion_dom', 'emotion_nature', 'emotion_public', 'emotion_traffic'], value=['home', 'nature', 'public', 'traffic'])
+    df_med_emotion.rename(columns={'value': 'emotion'}, inplace=True)
+    
+    df_med_sorted = df_med_behaviour.merge(df_med_emotion, how='inner', on=['group', 'env'])
+    df_med_sorted.sort_values(by='group', inplace=True)
     
     # plot
+    df_med_sorted.loc[df_med_sorted.group.eq('stroke'), 'behaviour'] = df_med_sorted['behaviour'].mul(-1)
+    df_med_sorted.loc[df_med_sorted.group.eq('stroke'), 'emotion'] = df_med_sorted['emotion'].mul(-1)
+    stroke = df_med_sorted['group'].eq('stroke')
+    df_stroke, df_control = df_med_sorted[stroke], df_med_sorted[~stroke]
+    df_stroke.set_index(['env'])
+    df_control.set_index(['env'])
+    
+    render_figure('twosided_bar', draw_twosided_bar, df_stroke, df_control)
+    
+
+
+##### MEAN RISKPERCEPTION STROKE VS. CONTROL#####
+def draw_riskperception(df_total_perc, total_err, df_mean, mean_err):
+    
     fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 7))
-    df_total_perc.plot.bar(ax=ax1, color='dimgray') #yerr=df_total_std, error_kw=dict(ecolor='dimgray', lw=2, capsize=5, capthick=2), 
+    df_total_perc.plot.bar(ax=ax1, color='dimgray', yerr=total_err, error_kw=dict(ecolor='dimgray', lw=2, capsize=5, capthick=2))
     ax1.legend(loc='upper center', ncol=1, frameon=True, labels=['Total in %'])
     ax1.yaxis.set_ticks_position('left')
     ax1.xaxis.set_ticks_position('top')
     ax1.set_xlabel(None)
     ax1.set_yticks([0,25,50,75,100], ['','25%','50%','75%','100%'])
-    ax1.bar_label(ax1.containers[0])
+    ax1.bar_label(ax1.containers[-1])
     ax1.tick_params(top=False, left=False)
     ax1.grid(axis='y', which='major', color='dimgray', linestyle='-')
     ax1.xaxis.set_ticks([0,1], labels=['Stroke', 'Control'], rotation=0, weight='bold', fontsize=12)
     ax1.grid(visible=False, axis='x', which='both')
     
-    df_mean.plot.bar(ax=ax2, yerr=df_std, error_kw=dict(ecolor='dimgray', lw=2, capsize=5, capthick=2), color=['tab:blue', 'darkorange'])
+    df_mean.plot.bar(ax=ax2, yerr=mean_err, error_kw=dict(ecolor='dimgray', lw=2, capsize=5, capthick=2), color=['tab:blue', 'darkorange'])
     ax2.set_xlabel(None)
     ax2.yaxis.set_ticks_position('right')
     ax2.xaxis.set_ticks_position('top')
@@ -613,58 +2118,636 @@ def plot_riskperception(df):
 
     plt.subplots_adjust(wspace=0.03)
 
-    plt.show()
+    return fig
+
+
+@profiled('plot')
+def plot_riskperception(df, ci=True, replicates=BOOTSTRAP_REPLICATES, seed=0, cube=None, df_ci=None):
+
+    # bootstrap confidence intervals (error bars; ci=False or aggregate input falls back to the std;
+    # shared with spearman_correlation if given)
+    ci = ci and (df_ci is not None or not isinstance(df, AggregateCube))
+    if ci:
+        df_ci = (bootstrap_ci(df, replicates=replicates, seed=seed) if df_ci is None else df_ci).set_index(['subgroup', 'statistic'])
+    
+    # means, stds and total percentage from the aggregate cube
+    groups = ['stroke', 'control']
+    cube = AggregateCube.from_data(df if cube is None else cube)
+    df_mean = cube.summary('mean', by=('group', 'dimension')).unstack('dimension').reindex(groups)[DIMENSIONS]
+    df_std = cube.summary('std', by=('group', 'dimension')).unstack('dimension').reindex(groups)[DIMENSIONS]
+    df_total_perc = pd.DataFrame({'percentage': ((df_mean.sum(axis=1)/8)*100).round(2)})
+    
+    # asymmetric error bars (columns x 2 x groups)
+    def errorbar(statistic, values):
+        low = df_ci.loc[[(group, statistic) for group in groups], 'ci_low'].to_numpy()
+        high = df_ci.loc[[(group, statistic) for group in groups], 'ci_high'].to_numpy()
+        return [values.to_numpy() - low, high - values.to_numpy()]
+    if ci:
+        total_err = np.array([errorbar('total_percentage', df_total_perc['percentage'])])
+        mean_err = np.array([errorbar('mean_behaviour', df_mean['behaviour']), errorbar('mean_emotion', df_mean['emotion'])])
+    else:
+        total_err, mean_err = None, df_std
+    
+    # plot
+    render_figure('riskperception', draw_riskperception, df_total_perc, total_err, df_mean, mean_err)
+    
+
+    
+##### ANALYSIS SERVER #####
+class AnalysisServer:
+    # resident http server (localhost or unix socket): the cleaned data set is loaded and indexed once,
+    # queries are answered from the aggregate cube and the subgroup index, results are kept in a bounded lru cache
+    #   GET /summary?statistic=mean&by=group,dimension&environment=traffic&gender=female&age_band=70-79&age_band=80-89
+    #   GET /mannwhitney?a.group=stroke&b.group=control&environment=traffic&dimension=emotion&alternative=two-sided
+    #   GET /spearman?x=age&y=total&group=stroke&method=spearman
+    # several labels of an axis are selected by repeating the parameter (labels may contain commas: 'GB, United Kingdom')
+    
+    def __init__(self, df, cache_size=1024):
+        self.cube = AggregateCube.from_data(df)
+        self.variables = correlation_variables(df)
+        self.index = SubgroupIndex(frame_factors(df))
+        self.n = len(df)
+        self.query = functools.lru_cache(maxsize=cache_size)(self.answer)
+    
+    def selection(self, params, axes):
+        
+        # labels per axis (repeated parameters); unknown axes and labels are errors (the cube would silently ignore them)
+        selection = {}
+        for key, labels in params.items():
+            if key not in axes:
+                raise ValueError('unknown selection '+key+' (one of '+', '.join(axes)+')')
+            axis = key.split('.', 1)[-1]
+            unknown = [label for label in labels if label not in self.cube.labels[axis]]
+            if unknown:
+                raise ValueError('unknown '+axis+': '+', '.join(unknown))
+            selection[key] = list(labels)
+        return selection
+    
+    def answer(self, path, params):
+        
+        # params: sorted (key, values) pairs of the query string, the values of repeated parameters in one tuple
+        params = dict(params)
+        options = {}
+        for key in ['statistic', 'by', 'alternative', 'method', 'x', 'y']:
+            if key in params:
+                values = params.pop(key)
+                if len(values) > 1 and key != 'by':
+                    raise ValueError('repeated parameter: '+key)
+                options[key] = ','.join(values)
+        
+        if path == '/summary':
+            selection = self.selection(params, AggregateCube.AXES)
+            by = options.get('by', 'group').split(',')
+            unknown = [axis for axis in by if axis not in AggregateCube.AXES]
+            if unknown:
+                raise ValueError('unknown axis: '+', '.join(unknown))
+            result = self.cube.summary(options.get('statistic', 'mean'), by=tuple(axis for axis in AggregateCube.AXES if axis in by), **selection)
+            return json.loads(result.reset_index().to_json(orient='records'))
+        
+        if path == '/mannwhitney':
+            alternative, method = options.get('alternative', 'two-sided'), options.get('method', 'asymptotic')
+            if alternative not in ['two-sided', 'less', 'greater']:
+                raise ValueError('unknown alternative: '+alternative)
+            if method not in ['asymptotic', 'auto']:
+                raise ValueError('unsupported method: '+method+' (asymptotic or auto)')
+            selection = self.selection(params, AggregateCube.AXES + ['a.'+axis for axis in AggregateCube.AXES] + ['b.'+axis for axis in AggregateCube.AXES])
+            common = {key: value for key, value in selection.items() if '.' not in key}
+            sides = [dict(common, **{key[2:]: value for key, value in selection.items() if key.startswith(side+'.')}) for side in 'ab']
+            counts_a, counts_b = [self.cube.histogram(**side)[0][None] for side in sides]
+            u, pvalue = mann_whitney_counts(counts_a, counts_b, [alternative], method=method)
+            return {'n_a': int(counts_a.sum()), 'n_b': int(counts_b.sum()), 'alternative': alternative,
+                    'U': float(u[0]), 'pvalue': float(pvalue[0])}
+        
+        if path == '/spearman':
+            # participant-level variables: only the participant axes select rows
+            selection = self.selection(params, AggregateCube.AXES[:4])
+            names = [options.get('x', 'age'), options.get('y', 'total')]
+            unknown = [name for name in names if name not in self.variables]
+            if unknown:
+                raise ValueError('unknown variable: '+', '.join(unknown)+' (one of '+', '.join(self.variables)+')')
+            method = options.get('method', 'spearman')
+            if method not in ['spearman', 'kendall']:
+                raise ValueError('unknown method: '+method)
+            variables = {name: self.variables[name] for name in names}
+            result = rank_correlation(variables, self.index, {'query': selection}, kendall=method == 'kendall')
+            return json.loads(result[result['method'] == method].drop(columns=['subgroup']).to_json(orient='records'))[0]
+        
+        raise LookupError(path)
+    
+    def health(self):
+        
+        # answered directly (not through the lru cache, so that cache_info is current)
+        return {'rows': self.n, 'cache': self.query.cache_info()._asdict()}
+    
+    async def handle(self, reader, writer):
+        
+        # one http/1.0 style request per connection; the computation runs in the default thread pool
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            while (await reader.readline()).strip():
+                pass
+            url = urlsplit(request[1])
+            params = tuple(sorted((key, tuple(sorted(values))) for key, values in parse_qs(url.query).items()))
+            if url.path == '/health':
+                status, body = '200 OK', self.health()
+            else:
+                loop = asyncio.get_running_loop()
+                status, body = '200 OK', await loop.run_in_executor(None, self.query, url.path, params)
+        except (ValueError, KeyError, IndexError) as error:
+            status, body = '400 Bad Request', {'error': str(error)}
+        except LookupError as error:
+            status, body = '404 Not Found', {'error': 'unknown query: '+str(error)}
+        data = json.dumps(body).encode()
+        writer.write(('HTTP/1.1 '+status+'\r\nContent-Type: application/json\r\nContent-Length: '+str(len(data))+
+                      '\r\nConnection: close\r\n\r\n').encode() + data)
+        await writer.drain()
+        writer.close()
+    
+    async def serve(self, host='127.0.0.1', port=8765, socket=None):
+        if socket:
+            server = await asyncio.start_unix_server(self.handle, path=socket)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        print('serving '+str(self.n)+' subjects on '+(socket or host+':'+str(port)))
+        async with server:
+            await server.serve_forever()
+
+
+
+##### TASK GRAPH #####
+# results of graph nodes by fingerprint (in memory; on disk under <cache_dir>/graph, at most GRAPH_CACHE_ENTRIES files)
+GRAPH_MEMO = {}
+GRAPH_CACHE_ENTRIES = 256
+
+
+def pipeline_tasks(summary=False, age_tests=False, method='asymptotic', n_permutations=100000, replicates=BOOTSTRAP_REPLICATES, seed=0):
+    
+    # analysis stages as nodes: function, inputs {argument: node} and parameters; 'data' is the cleaned data set,
+    # info and the plots share one aggregate cube ('cube')
+    return {
+        'responses': {'function': rearrange_data, 'inputs': {'df': 'data'}, 'params': {}},
+        'cube': {'function': AggregateCube.from_data, 'inputs': {'data': 'data'}, 'params': {}},
+        'info': {'function': info_data, 'inputs': {'df': 'cube'}, 'params': {'summary': summary, 'age_tests': age_tests}},
+        'test': {'function': significance_test, 'inputs': {'df': 'responses'},
+                 'params': {'method': method, 'n_permutations': n_permutations, 'seed': seed}},
+        'index': {'function': subgroup_index, 'inputs': {'data': 'responses'}, 'params': {}},
+        'bootstrap': {'function': bootstrap_ci, 'inputs': {'data': 'responses'}, 'params': {'replicates': replicates, 'seed': seed}},
+        'correlate': {'function': spearman_correlation, 'inputs': {'df_input': 'responses', 'df_ci': 'bootstrap', 'index': 'index'},
+                      'params': {'replicates': replicates, 'seed': seed}},
+        'medians': {'function': median_values, 'inputs': {'df': 'cube'}, 'params': {}},
+        'twosided_bar': {'function': plot_twosided_bar, 'inputs': {'df': 'medians'}, 'params': {}},
+        'riskperception': {'function': plot_riskperception, 'inputs': {'df': 'responses', 'cube': 'cube', 'df_ci': 'bootstrap'},
+                           'params': {'replicates': replicates, 'seed': seed}},
+    }
+
+
+def data_fingerprint(df):
+    
+    # content hash of a data frame (values, index, columns and dtypes)
+    sha = hashlib.sha256(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    sha.update(json.dumps([[col, str(dtype)] for col, dtype in df.dtypes.items()]).encode())
+    return sha.hexdigest()
+
+
+def task_fingerprints(tasks, roots):
+    
+    # fingerprint of a node: code of this module, function, parameters and fingerprints of its inputs (+ whether
+    # diagnostic histograms are drawn), so that a change only invalidates the nodes downstream of it
+    fingerprints = dict(roots)
+    code = file_hash(__file__), RENDER['histograms']
+    def fingerprint(name):
+        if name not in fingerprints:
+            task = tasks[name]
+            inputs = {arg: fingerprint(node) for arg, node in sorted(task['inputs'].items())}
+            key = json.dumps([code, task['function'].__qualname__, task['params'], inputs], sort_keys=True, default=str)
+            fingerprints[name] = hashlib.sha256(key.encode()).hexdigest()[:16]
+        return fingerprints[name]
+    for name in tasks:
+        fingerprint(name)
+    return fingerprints
+
+
+def freeze(value):
+    
+    # stage outputs are shared between stages and kept in the memo: arrays become read-only views, data frames
+    # shallow copies (copy-on-write: a write to one copies the touched columns, to_numpy() gives read-only views);
+    # the objects passed in are not modified
+    if isinstance(value, (tuple, list)):
+        return type(value)(freeze(item) for item in value)
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    if isinstance(value, np.ndarray):
+        view = value.view()
+        view.flags.writeable = False
+        return view
+    slots = [slot for slot in getattr(type(value), '__slots__', ()) if isinstance(getattr(value, slot, None), np.ndarray)]
+    if slots:
+        value = copy.copy(value)
+        for slot in slots:
+            setattr(value, slot, freeze(getattr(value, slot)))
+    return value
+
+
+def execute_task(function, inputs, params, render, profile=False):
+    
+    # runs in a worker process: printed output, queued figures and (if profiling) the stages traced in the worker
+    # are returned with the result
+    RENDER.update(render, mode='save')
+    FIGURE_JOBS.clear()
+    configure_profiling(enabled=profile)
+    output = io.StringIO()
+    with redirect_stdout(output):
+        result = function(**inputs, **params)
+    return (freeze(result), output.getvalue(), FIGURE_JOBS[:]), PROFILE['stages']
+
+
+@profiled('graph')
+def run_graph(tasks, roots, targets=None, workers=None, cache_dir=CACHE_DIR, replay=True):
+    
+    # dependency-aware concurrent execution: every node whose inputs are available is submitted to the pool,
+    # results are memoized by fingerprint (memory & disk), printed output and figures are replayed in graph order;
+    # returns (result, printed output, figure jobs) of every node that was needed
+    fingerprints = task_fingerprints(tasks, {name: data_fingerprint(df) for name, df in roots.items()})
+    needed = []
+    def require(name):
+        if name not in roots and name not in needed:
+            for node in tasks[name]['inputs'].values():
+                require(node)
+            needed.append(name)
+    for name in targets or tasks:
+        require(name)
+    
+    directory = os.path.join(cache_dir, 'graph') if cache_dir else None
+    results = {name: (freeze(df), '', []) for name, df in roots.items()}
+    for name in needed:
+        fingerprint = fingerprints[name]
+        path = os.path.join(directory, fingerprint+'.pkl') if directory else None
+        if fingerprint not in GRAPH_MEMO and path and os.path.exists(path):
+            with open(path, 'rb') as f:
+                GRAPH_MEMO[fingerprint] = pickle.load(f)
+        if fingerprint in GRAPH_MEMO:
+            results[name] = GRAPH_MEMO[fingerprint]
+            if path and os.path.exists(path):
+                os.utime(path)
+    
+    # no pool if every node is memoized; stages traced in the workers are merged into the trace (below this stage)
+    pending = [name for name in needed if name not in results]
+    render = {key: value for key, value in RENDER.items() if key != 'mode'}
+    workers = min(workers or os.cpu_count(), max(len(pending), 1))
+    with ProcessPoolExecutor(workers) if pending else nullcontext() as pool:
+        running = {}
+        while pending or running:
+            for name in [name for name in pending if all(node in results for node in tasks[name]['inputs'].values())]:
+                inputs = {arg: results[node][0] for arg, node in tasks[name]['inputs'].items()}
+                running[pool.submit(execute_task, tasks[name]['function'], inputs, tasks[name]['params'], render, PROFILE['enabled'])] = name
+                pending.remove(name)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], stages = future.result()
+                depth = len(PROFILE['stack'])
+                PROFILE['stages'].extend(dict(stage, depth=stage['depth']+depth, task=name) for stage in stages)
+                GRAPH_MEMO[fingerprints[name]] = results[name]
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                    tmp = os.path.join(directory, fingerprints[name]+'.tmp')
+                    with open(tmp, 'wb') as f:
+                        pickle.dump(results[name], f)
+                    os.replace(tmp, os.path.join(directory, fingerprints[name]+'.pkl'))
     
+    # eviction: results of other fingerprints (older code, data or parameters) leave the memory; on disk the least
+    # recently used of them are removed beyond GRAPH_CACHE_ENTRIES files, the current fingerprints are always kept
+    current = set(fingerprints.values())
+    for fingerprint in [fingerprint for fingerprint in GRAPH_MEMO if fingerprint not in current]:
+        del GRAPH_MEMO[fingerprint]
+    if directory and os.path.isdir(directory):
+        files = [entry for entry in os.scandir(directory) if entry.name.endswith('.pkl')]
+        stale = sorted((entry for entry in files if entry.name[:-4] not in current), key=lambda entry: entry.stat().st_mtime)
+        for entry in stale[:max(len(files) - GRAPH_CACHE_ENTRIES, 0)]:
+            os.remove(entry.path)
+    
+    # replay output and figures of the targets (in the order of the task definition)
+    for name in needed:
+        result, output, figures = results[name]
+        if replay and (not targets or name in targets):
+            sys.stdout.write(output)
+            for figure in figures:
+                render_figure(*figure[:2], *figure[2])
+    
+    return {name: freeze(results[name]) for name in needed}
+
+
 
+##### INCREMENTAL REPORT #####
+REPORT_SECTIONS = [('info', 'Demographic info'), ('test', 'Significance testing'), ('correlate', 'Correlation age - hazard perception'),
+                   ('twosided_bar', 'Median single values stroke vs. control'), ('riskperception', 'Mean riskperception stroke vs. control')]
+
+
+def artifact_key(code, *parts):
     
+    # content hash of the input slice of an artifact (data, parameters, drawing function) and of this module's code
+    # (code: file_hash of the module, computed once per build)
+    return hashlib.sha256(pickle.dumps((code,) + parts, protocol=4)).hexdigest()[:16]
+
+
+def markdown_table(df):
+    
+    rows = [[str(col) for col in df.columns]] + [['' if pd.isna(value) else ('%.6g' % value if isinstance(value, float) else str(value))
+                                                   for value in row] for row in df.itertuples(index=False)]
+    lines = ['| '+' | '.join(row)+' |' for row in rows]
+    return '\n'.join(lines[:1] + ['|'+'---|'*len(df.columns)] + lines[1:])
+
+
+def write_if_changed(path, text):
+    
+    if os.path.exists(path):
+        with open(path) as f:
+            if f.read() == text:
+                return False
+    with open(path, 'w') as f:
+        f.write(text)
+    return True
+
+
+@profiled('report')
+def build_report(df, directory='report', formats=('png',), workers=None, cache_dir=CACHE_DIR, **params):
+    
+    # stage results from the memoized task graph (unchanged stages are not recomputed)
+    tasks = pipeline_tasks(**params)
+    results = run_graph(tasks, {'data': df}, targets=[name for name, title in REPORT_SECTIONS], workers=workers,
+                        cache_dir=cache_dir, replay=False)
+    
+    # figures are keyed by the content hash of their drawing inputs; only new keys are rendered
+    artifacts = os.path.join(directory, 'artifacts')
+    os.makedirs(artifacts, exist_ok=True)
+    code = file_hash(__file__)
+    figures, jobs = {}, []
+    for name, title in REPORT_SECTIONS:
+        for figure, draw, args in results[name][2]:
+            stem = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in figure)+'-'+artifact_key(code, draw.__qualname__, args)
+            figures.setdefault(name, []).append(stem)
+            if not all(os.path.exists(os.path.join(artifacts, stem+'.'+fmt)) for fmt in formats):
+                jobs.append((stem, draw, args, artifacts, list(formats)))
+    workers = min(workers or os.cpu_count(), max(len(jobs), 1))
+    if workers > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            list(pool.map(save_figure, *zip(*jobs)))
+    else:
+        for job in jobs:
+            save_figure(*job)
+    
+    # artifacts of earlier builds that this build did not produce (older inputs or formats) are removed
+    produced = {stem+'.'+fmt for stems in figures.values() for stem in stems for fmt in formats}
+    for entry in os.scandir(artifacts):
+        if entry.name not in produced:
+            os.remove(entry.path)
+    
+    # markdown & html report: printed output, result tables and figures of every section
+    markdown, html = ['# Hazard perception questionnaire'], ['<html><body><h1>Hazard perception questionnaire</h1>']
+    for name, title in REPORT_SECTIONS:
+        result, output, _ = results[name]
+        markdown.append('\n## '+title)
+        html.append('<h2>'+title+'</h2>')
+        if isinstance(result, pd.DataFrame):
+            markdown.append(markdown_table(result))
+            html.append(result.to_html(index=False, na_rep=''))
+        elif output.strip():
+            markdown.append('```\n'+output.strip()+'\n```')
+            html.append('<pre>'+output.strip().replace('&', '&amp;').replace('<', '&lt;')+'</pre>')
+        for stem in figures.get(name, []):
+            markdown.append('![' + stem + '](artifacts/'+stem+'.'+formats[0]+')')
+            html.append('<img src="artifacts/'+stem+'.'+formats[0]+'">')
+    html.append('</body></html>')
+    write_if_changed(os.path.join(directory, 'report.md'), '\n\n'.join(markdown)+'\n')
+    write_if_changed(os.path.join(directory, 'report.html'), '\n'.join(html)+'\n')
+    
+    n_figures = sum(len(stems) for stems in figures.values())
+    print('report written to '+directory+': '+str(n_figures - len(jobs))+' figures reused, '+str(len(jobs))+' rendered')
+    return figures
+
+
+
 ##### MAIN & PREPROCESSING #####
-def main():
+def load(args):
     
-    # input csv-data file
-    df = pd.read_csv('C:/Users/hgaud/OneDrive/Studium/8. SoSe2022/BA/Questionnaire/data-2022-07-20/data.csv', index_col=False)
+    # stage trace (zero cost when disabled)
+    if args.profile:
+        configure_profiling(args.profile)
     
-    # rename columns 
-    df.columns = ['participant', 'age',	'gender', 'group', 'behaviour_dom', 'behaviour_nature',	'behaviour_public',	'behaviour_traffic',
-                  'emotion_dom', 'emotion_nature', 'emotion_public', 'emotion_traffic', 'country', 'TIME_start', 'TIME_end', 'TIME_total']
-   
-    #remove incomplete trials
-    incomplete = df.isnull().any(axis=1).sum()  
-    df.dropna(axis=0, how = 'any', inplace=True)
-    print('incomplete trials (removed): '+str(incomplete))
+    # headless rendering: figures are written to files (in parallel) instead of plt.show()
+    if args.save:
+        configure_rendering(mode='save', directory=args.save, formats=args.formats, histograms=not args.no_histograms, workers=args.workers)
+    else:
+        RENDER['histograms'] = not args.no_histograms
     
-    #remove subjects younger than 60 years old
-    young = (df.age < 60).sum()
-    df = df[df.age >= 60]
-    print('subjects younger than 60 years old (removed): '+str(young))
+    # input csv-data file, glob of dated exports or directory of participant files (streamed in chunks: renaming,
+    # removal of incomplete trials and subjects younger than min_age, recoding of gender and group);
+    # the cleaned data set is cached on disk and reused as long as the export does not change
+    paths = wave_paths(args.path) if glob.has_magic(args.path) else [args.path]
+    if len(paths) > 1:
+        waves = load_waves(paths, cache_dir=None if args.no_cache else args.cache_dir, min_age=args.min_age, workers=args.workers)
+        for wave in waves:
+            print(wave['wave']+': '+str(len(wave['data']))+' subjects, incomplete trials (removed): '+str(wave['incomplete'])+
+                  ', younger than '+str(args.min_age)+' (removed): '+str(wave['young'])+
+                  ', submitted in an earlier wave (removed): '+str(wave['duplicates']))
+            print(format_report(wave['report']))
+        df, summary = pool_waves(waves)
+        datasets = [(wave['wave'], wave['data'], wave['summary']) for wave in waves] if args.per_wave else []
+        return datasets + [('pooled', df, summary)], None
+    elif not paths:
+        raise FileNotFoundError('no export matches '+args.path)
+    report, ingested = rejection_report(), None
+    if os.path.isdir(paths[0]):
+        df, incomplete, young, names = load_directory(paths[0], manifest=args.manifest, min_age=args.min_age, workers=args.workers, report=report)
+        ingested = (df, names) if args.manifest else None
+    elif args.no_cache:
+        df, incomplete, young = load_data(paths[0], min_age=args.min_age, report=report)
+    else:
+        df, incomplete, young = load_data_cached(paths[0], cache_dir=args.cache_dir, min_age=args.min_age, report=report)
+    print('incomplete trials (removed): '+str(incomplete))
+    print('subjects younger than '+str(args.min_age)+' years old (removed): '+str(young))
+    print(format_report(report))
     
-    # replace number coding of gender and group with actual strings
-    df['gender'].replace({1:'female', 2:'male', 3:'other'}, inplace=True)
-    df['group'].replace({1:'stroke', 2:'control'}, inplace=True)
+    return [(None, df, None)], ingested
 
+
+def run(args, df, summary=None, label=None):
+    
+    # report of all stages, artifacts re-rendered only when their inputs change
+    if args.command == 'report':
+        return build_report(df, os.path.join(args.output, label) if label else args.output, formats=args.formats,
+                            workers=args.workers, cache_dir=args.cache_dir, summary=args.summary, age_tests=args.age_tests,
+                            method=args.method, n_permutations=args.permutations, replicates=args.replicates, seed=args.seed)
+    
+    # power & sample size simulation (power curve per comparison, smallest size with 80% power)
+    if args.command == 'power':
+        curves = power_simulation(df, sizes=args.sizes, replicates=args.replicates, alpha=args.alpha, ratio=args.ratio,
+                                  prior=args.prior, seed=args.seed, workers=args.workers)
+        table = curves.pivot_table(index=['analysis', 'test', 'label'], columns='size', values='power', sort=False)
+        table['n_80'] = pd.array([next((size for size in table.columns if row[size] >= 0.8), None) for _, row in table.iterrows()], dtype='Int64')
+        print('\n### POWER ('+str(args.replicates)+' simulated studies per size, alpha = '+str(args.alpha)+') ###')
+        print(table.to_string())
+        return curves
+    
+    # inter-item reliability (participant files: from the loaded data set)
+    if args.command == 'reliability':
+        return print_reliability(update_covariance(covariance_state(), df))
+    
+    # resident query server (blocks)
+    if args.command == 'serve':
+        return asyncio.run(AnalysisServer(df, cache_size=args.cache_size).serve(args.host, args.port, args.socket))
+    
+    # all stages as a task graph (independent stages run concurrently, unchanged stages are reused)
+    if args.command == 'all':
+        tasks = pipeline_tasks(summary=args.summary, age_tests=args.age_tests, method=args.method, n_permutations=args.permutations,
+                               replicates=args.replicates, seed=args.seed)
+        return run_graph(tasks, {'data': df}, targets=['info', 'test', 'correlate', 'twosided_bar', 'riskperception'],
+                         workers=args.workers, cache_dir=None if args.no_cache else args.cache_dir)
     
-    # demographic info & summary values of raw data
-    first_infos = info_data(df)
-    print(first_infos)
+    # demographic info & summary values of raw data (from the partial statistics of a wave if given)
+    if args.command == 'info' and args.state:
+        state = update_summary(load_summary(args.state), df)
+        save_summary(state, args.state)
+        info_summary(state, age_tests=args.age_tests)
+    elif args.command == 'info' and summary is not None and not args.summary:
+        info_summary(summary, age_tests=args.age_tests)
+    elif args.command == 'info':
+        info_data(df, summary=args.summary, age_tests=args.age_tests)
+    
+    # rearrange data set for further analysis & visualization
+    else:
+        responses = rearrange_data(df)
+    
+    if args.command == 'rearrange':
+        print(responses.to_long())
+        print(responses.to_pairs())
+        if args.output:
+            responses.to_long().to_csv(args.output+'1.csv', index=False)
+            responses.to_pairs().to_csv(args.output+'2.csv', index=False)
+    
+    # significance testing (Shapiro-Wilk-Test, Mann-Withney-U-Test)
+    elif args.command == 'test':
+        significance_test(responses, method=args.method, n_permutations=args.permutations, seed=args.seed, workers=args.workers)
+    
+    # correlation age - hazard perception (Spearman rank-order correlation)
+    elif args.command == 'correlate' and args.matrix:
+        subgroups = {'all': {}, 'stroke': {'group': 'stroke'}, 'control': {'group': 'control'}}
+        print(rank_correlation(correlation_variables(df), SubgroupIndex(frame_factors(df)), subgroups).to_string(index=False))
+    elif args.command == 'correlate':
+        spearman_correlation(responses, replicates=args.replicates, seed=args.seed)
+    
+    # visualization of medians of single variables & mean riskperception stroke vs. control
+    elif args.command == 'plot':
+        cube = AggregateCube.from_data(df)
+        if args.figure in ['twosided_bar', 'all']:
+            plot_twosided_bar(median_values(cube))
+        if args.figure in ['riskperception', 'all']:
+            plot_riskperception(responses, replicates=args.replicates, seed=args.seed, cube=cube)
+
+
+def main(argv=None):
     
-    # #rearrange data set for further analysis & visualization
-    # rearrange = rearrange_data(df)
-    # print(rearrange)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('path', help='csv export of the questionnaire, glob of dated exports (quoted) or directory of '
+                                     's.<uuid>.txt participant files')
+    common.add_argument('--per-wave', action='store_true', help='with a glob: analyse every wave besides the pooled data')
+    common.add_argument('--manifest', help='only parse participant files not listed in this file (and list them after a successful run; '
+                        'the cleaned rows of listed files are kept next to it)')
+    common.add_argument('--min-age', type=int, default=MIN_AGE, help='remove subjects younger than this')
+    common.add_argument('--cache-dir', default=CACHE_DIR, help='directory of the cleaned-data cache')
+    common.add_argument('--no-cache', action='store_true', help='always parse the csv export')
+    common.add_argument('--save', metavar='DIR', help='render figures headless into DIR instead of showing them')
+    common.add_argument('--formats', nargs='+', default=['png'], help='file formats of saved figures')
+    common.add_argument('--no-histograms', action='store_true', help='skip the diagnostic histograms')
+    common.add_argument('--window', nargs=2, metavar=('BEGIN', 'END'), help='only responses started in [BEGIN, END), e.g. 2022-06 2022-07')
+    common.add_argument('--min-duration', type=int, metavar='MINUTES', help='exclude responses completed faster than this')
+    common.add_argument('--workers', type=int, help='worker processes (default: all cores)')
+    common.add_argument('--profile', metavar='JSON', help='write a trace of the pipeline stages to this file')
+    common.add_argument('--seed', type=int, default=0, help='seed of permutation and bootstrap runs')
     
-    # # significance testing (Shapiro-Wilk-Test, Mann-Withney-U-Test)
-    # test = significance_test(df_melted1)
-    # print(test)
+    parser = argparse.ArgumentParser(description='Analysis and visualisation of the hazard perception questionnaire.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    info = commands.add_parser('info', parents=[common], help='demographic info & summary values of raw data')
+    info.add_argument('--summary', action='store_true', help='print mean, mode, median and std of the items by group')
+    info.add_argument('--age-tests', action='store_true', help='shapiro-wilk, levene and t-test of age between the groups (imports scipy)')
+    info.add_argument('--state', metavar='JSON', help='fold the data into this persisted summary state and report from it')
+    rearrange = commands.add_parser('rearrange', parents=[common], help='rearrange data set into long format')
+    rearrange.add_argument('--output', metavar='PREFIX', help='write the long data frames to PREFIX1.csv / PREFIX2.csv')
+    test = commands.add_parser('test', parents=[common], help='significance testing (Shapiro-Wilk-Test, Mann-Withney-U-Test)')
+    test.add_argument('--method', choices=['asymptotic', 'exact', 'auto', 'permutation'], default='asymptotic')
+    test.add_argument('--permutations', type=int, default=100000)
+    correlate = commands.add_parser('correlate', parents=[common], help='correlation age - hazard perception (Spearman)')
+    correlate.add_argument('--replicates', type=int, default=BOOTSTRAP_REPLICATES, help='bootstrap replicates')
+    correlate.add_argument('--matrix', action='store_true', help='spearman & kendall matrix of all variables and subgroups')
+    plot = commands.add_parser('plot', parents=[common], help='visualization stroke vs. control')
+    plot.add_argument('--figure', choices=['twosided_bar', 'riskperception', 'all'], default='all')
+    plot.add_argument('--replicates', type=int, default=BOOTSTRAP_REPLICATES, help='bootstrap replicates')
+    everything = commands.add_parser('all', parents=[common], help='info, tests, correlation and plots as a concurrent task graph')
+    everything.add_argument('--summary', action='store_true', help='print mean, mode, median and std of the items by group')
+    everything.add_argument('--age-tests', action='store_true', help='shapiro-wilk, levene and t-test of age between the groups (imports scipy)')
+    everything.add_argument('--method', choices=['asymptotic', 'exact', 'auto', 'permutation'], default='asymptotic')
+    everything.add_argument('--permutations', type=int, default=100000)
+    everything.add_argument('--replicates', type=int, default=BOOTSTRAP_REPLICATES, help='bootstrap replicates')
+    power = commands.add_parser('power', parents=[common], help='monte carlo power of all comparisons per sample size')
+    power.add_argument('--sizes', type=int, nargs='+', default=[10, 20, 50, 100, 200, 500], help='stroke subjects per study')
+    power.add_argument('--ratio', type=float, default=1.0, help='control subjects per stroke subject')
+    power.add_argument('--replicates', type=int, default=1000, help='simulated studies per sample size')
+    power.add_argument('--alpha', type=float, default=0.05)
+    power.add_argument('--prior', type=float, default=0.5, help='pseudo count per likert level of the fitted distributions')
+    reliability = commands.add_parser('reliability', parents=[common], help="inter-item correlations, cronbach's alpha, item-total correlations")
+    reliability.add_argument('--chunksize', type=int, default=100000, help='rows per chunk of the streaming pass')
+    report = commands.add_parser('report', parents=[common], help='incremental markdown / html report of all stages')
+    report.add_argument('--output', metavar='DIR', default='report', help='directory of the report and its artifacts')
+    report.add_argument('--summary', action='store_true', help='print mean, mode, median and std of the items by group')
+    report.add_argument('--age-tests', action='store_true', help='shapiro-wilk, levene and t-test of age between the groups (imports scipy)')
+    report.add_argument('--method', choices=['asymptotic', 'exact', 'auto', 'permutation'], default='asymptotic')
+    report.add_argument('--permutations', type=int, default=100000)
+    report.add_argument('--replicates', type=int, default=BOOTSTRAP_REPLICATES, help='bootstrap replicates')
+    serve = commands.add_parser('serve', parents=[common], help='keep the data set in memory and answer queries over http')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+    serve.add_argument('--socket', metavar='PATH', help='listen on this unix socket instead')
+    serve.add_argument('--cache-size', type=int, default=1024, help='entries of the lru result cache')
+    args = parser.parse_args(argv)
     
-    # # correlation age - hazard perception (Spearman rank-order correlation)
-    # correlation = spearman_correlation(df_melted2)
-    # print(correlation)
+    # reliability of csv exports in one streaming pass per file (files on the process pool, states merged),
+    # without loading the data sets
+    paths = wave_paths(args.path) if glob.has_magic(args.path) else [args.path]
+    if args.command == 'reliability' and paths and all(os.path.isfile(path) for path in paths):
+        workers = min(args.workers or os.cpu_count(), len(paths))
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                states = list(pool.map(stream_covariance, paths, repeat(args.chunksize), repeat(args.min_age)))
+        else:
+            states = [stream_covariance(path, args.chunksize, args.min_age) for path in paths]
+        print_reliability(functools.reduce(merge_covariance, states, covariance_state()))
+        return
     
-    # # visualization of medians of single variables stroke vs. control
-    # twosided_bar = plot_twosided_bar(df_median)
-    # print(twosided_bar)
+    # one run per wave and of the pooled waves (batch mode), figures of each run in their own directory
+    datasets, ingested = load(args)
+    for label, df, summary in datasets:
+        if label is not None:
+            print('\n\n##### '+label.upper()+' #####')
+            if args.save:
+                RENDER['directory'] = os.path.join(args.save, label)
+        
+        # time window & exclusion of implausibly fast completions (partial statistics no longer apply)
+        if args.window or args.min_duration is not None:
+            n = len(df)
+            df, index = select_times(df, *(args.window or (None, None)), min_duration=args.min_duration)
+            summary = None
+            print('responses outside the time window or too fast (removed): '+str(n - len(df))+
+                  ', inconsistent TIME_total: '+str(len(index.inconsistent())))
+        run(args, df, summary, label)
+        
+        # write queued figures (headless rendering only)
+        flush_figures()
     
-    # # visualization of mean behavioural, emotional & total riskperception stroke vs. control
-    # riskperception = plot_riskperception(df_melted2)
-    # print(riskperception)
+    # participant files count as ingested only once the run went through
+    if ingested is not None:
+        save_manifest(args.manifest, *ingested)
+    if PROFILE['enabled']:
+        write_trace()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,182 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import subprocess
+import tempfile
+
+import pandas as pd
+import numpy as np
+
+import analysis
+
+
+
+##### CONSTANTS #####
+SIZES = [10**3, 10**4, 10**5, 10**6, 10**7]
+DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+SYNTHETIC_DIR = os.path.join(DIRECTORY, analysis.CACHE_DIR, 'synthetic')
+RESULTS = os.path.join(DIRECTORY, 'benchmark.jsonl')
+REFERENCE = os.path.join(DIRECTORY, 'data-20-07-2022.csv')
+COUNTRIES = ['GB, United Kingdom', 'DE, Germany', 'US, United States', 'IE, Ireland']
+COUNTRY_WEIGHTS = [0.85, 0.07, 0.05, 0.03]
+START = datetime.datetime(2022, 6, 1)
+END = datetime.datetime(2022, 7, 20)
+CHUNK = 10**6
+
+
+
+##### SYNTHETIC QUESTIONNAIRE GENERATOR #####
+def fit_profile(path=REFERENCE):
+
+    # per group: likert probabilities of the eight items (add-one smoothing), age mean & std and group share;
+    # fitted from a real export, so that the synthetic data looks like the questionnaire
+    df = analysis.load_data(path)[0]
+    cube = analysis.AggregateCube.from_data(df)
+    profile = {}
+    for group in analysis.GROUPS:
+        counts, _ = cube.histogram(by=('dimension', 'environment'), group=group)
+        counts = counts.reshape(len(analysis.ITEMS), analysis.LIKERT_LEVELS) + 1
+        age = df.loc[df['group'] == group, 'age'].astype(float)
+        profile[group] = {'likert': counts / counts.sum(axis=1, keepdims=True), 'age': (age.mean(), age.std()),
+                          'share': len(age) / len(df)}
+    return profile
+
+
+def synthetic_chunk(n, profile, rng, offset=0, missing=0.02, young=0.05):
+
+    # one chunk of an export in the raw column schema (numeric codes, header names of the questionnaire tool)
+    groups = rng.choice(len(analysis.GROUPS), size=n, p=[profile[group]['share'] for group in analysis.GROUPS])
+    items = np.empty((n, len(analysis.ITEMS)), dtype=np.int8)
+    age = np.empty(n)
+    for code, group in enumerate(analysis.GROUPS):
+        rows = np.flatnonzero(groups == code)
+        cumulative = np.cumsum(profile[group]['likert'], axis=1)
+        items[rows] = 1 + (rng.random((len(rows), len(analysis.ITEMS)))[:, :, None] > cumulative[None, :, :-1]).sum(axis=2)
+        age[rows] = rng.normal(*profile[group]['age'], size=len(rows))
+    age = np.clip(np.round(age), analysis.MIN_AGE, 95)
+    under = rng.random(n) < young
+    age[under] = rng.integers(40, analysis.MIN_AGE, size=int(under.sum()))
+
+    # timestamps in the format of the export (YYYY-MM-DD-HH-MM) and completion time in minutes
+    span = int((END - START).total_seconds() // 60)
+    start = pd.Timestamp(START) + pd.to_timedelta(rng.integers(0, span, size=n), unit='m')
+    total = 1 + rng.poisson(3, size=n)
+    end = start + pd.to_timedelta(total, unit='m')
+
+    chunk = pd.DataFrame({'participant': ['s.%032x.txt' % (offset+i) for i in range(n)], 'age:1': age,
+                          'gender:1': rng.choice([1, 2, 3], size=n, p=[0.5, 0.48, 0.02]), 'group:1': groups + 1})
+    for col, values in zip(analysis.RAW_COLUMNS[4:12], items.T):
+        chunk[col] = values
+    chunk['country'] = rng.choice(COUNTRIES, size=n, p=COUNTRY_WEIGHTS)
+    chunk['TIME_start'] = start.strftime('%Y-%m-%d-%H-%M')
+    chunk['TIME_end'] = end.strftime('%Y-%m-%d-%H-%M')
+    chunk['TIME_total'] = total
+
+    # incomplete trials: one random answer missing
+    incomplete = np.flatnonzero(rng.random(n) < missing)
+    columns = rng.integers(1, 12, size=len(incomplete))
+    answers = chunk[analysis.RAW_COLUMNS[1:12]].to_numpy(dtype='float64')
+    answers[incomplete, columns-1] = np.nan
+    chunk[analysis.RAW_COLUMNS[1:12]] = answers
+    return chunk
+
+
+def synthetic_export(n, path=None, profile=None, seed=0, chunksize=CHUNK):
+
+    # csv export with n rows (written in chunks; reused if it already exists)
+    path = path or os.path.join(SYNTHETIC_DIR, 'data-'+str(n)+'-'+str(seed)+'.csv')
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    profile = profile or fit_profile()
+    rng = np.random.default_rng(seed)
+    tmp = path+'.tmp'
+    for offset in range(0, n, chunksize):
+        chunk = synthetic_chunk(min(chunksize, n-offset), profile, rng, offset)
+        chunk.to_csv(tmp, mode='w' if offset == 0 else 'a', header=offset == 0, index=False, float_format='%.0f')
+    os.replace(tmp, path)
+    return path
+
+
+
+##### BENCHMARK #####
+def version():
+
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORY, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark(path, replicates=200, seed=0):
+
+    # every stage of the pipeline once, traced by the profiling layer of analysis.py (printed output discarded);
+    # the lazy modules are imported before the trace starts, so that the first stage using them does not absorb
+    # the import time
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        analysis.configure_rendering(mode='save', directory=directory, histograms=False)
+        for module, attr in [(analysis.stats, 'norm'), (analysis.plt, 'figure')]:
+            getattr(module, attr)
+        analysis.configure_profiling()
+        df = analysis.load_data(path)[0]
+        analysis.info_data(df)
+        responses = analysis.rearrange_data(df)
+        analysis.significance_test(responses)
+        df_ci = analysis.bootstrap_ci(responses, replicates=replicates, seed=seed)
+        analysis.spearman_correlation(responses, df_ci=df_ci)
+        cube = analysis.AggregateCube.from_data(df)
+        analysis.plot_twosided_bar(analysis.median_values(cube))
+        analysis.plot_riskperception(responses, cube=cube, df_ci=df_ci)
+        analysis.flush_figures()
+    trace = analysis.write_trace()
+    analysis.configure_profiling(enabled=False)
+    return trace
+
+
+def compare(result, previous):
+
+    # wall time and peak memory relative to the last run of the same size
+    print('\n'+str(result['rows'])+' rows ('+str(result['version'])+' vs. '+str(previous['version'] if previous else None)+')')
+    for stage, total in result['totals'].items():
+        line = '  %-10s %9.3f s %9.1f MB' % (stage, total['wall_s'], total['peak_bytes']/2**20)
+        if previous and stage in previous['totals']:
+            before = previous['totals'][stage]
+            line += '   x%.2f time   x%.2f memory' % (total['wall_s']/max(before['wall_s'], 1e-9), total['peak_bytes']/max(before['peak_bytes'], 1))
+        print(line)
+
+
+def main(argv=None):
+
+    parser = argparse.ArgumentParser(description='Benchmark of analysis.py on synthetic questionnaire exports.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES[:3], help='rows of the synthetic exports')
+    parser.add_argument('--replicates', type=int, default=200, help='bootstrap replicates')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results', default=RESULTS, help='json lines file the results are appended to')
+    parser.add_argument('--generate-only', action='store_true', help='only write the synthetic exports')
+    args = parser.parse_args(argv)
+
+    previous = {}
+    if os.path.exists(args.results):
+        with open(args.results) as f:
+            for line in f:
+                result = json.loads(line)
+                previous[result['rows']] = result
+
+    profile = fit_profile()
+    for n in args.sizes:
+        path = synthetic_export(n, profile=profile, seed=args.seed)
+        if args.generate_only:
+            print(path)
+            continue
+        trace = benchmark(path, replicates=args.replicates, seed=args.seed)
+        result = {'version': version(), 'date': datetime.datetime.now().isoformat(timespec='seconds'), 'rows': n,
+                  'totals': trace['totals'], 'stages': trace['stages']}
+        compare(result, previous.get(n))
+        with open(args.results, 'a') as f:
+            f.write(json.dumps(result)+'\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import os
+import tracemalloc
+
+import matplotlib
+import pandas as pd
+import pytest
+
+import analysis
+
+
+# figures are never shown while testing
+matplotlib.use('Agg')
+
+EXPORT = os.path.join(os.path.dirname(__file__), 'data-20-07-2022.csv')
+
+
+@pytest.fixture
+def export():
+    return EXPORT
+
+
+@pytest.fixture
+def messy_export(tmp_path):
+
+    # the shipped export plus one incomplete trial and one subject younger than 60
+    raw = pd.read_csv(EXPORT, dtype=str)
+    incomplete = raw.iloc[[0]].assign(participant='s.incomplete.txt', **{'emotion:2': None})
+    young = raw.iloc[[1]].assign(participant='s.young.txt', **{'age:1': '45'})
+    path = tmp_path / 'data-messy.csv'
+    pd.concat([raw, incomplete, young]).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def render(monkeypatch):
+
+    # module-level render state is restored after every test
+    monkeypatch.setattr(analysis, 'RENDER', dict(analysis.RENDER))
+    monkeypatch.setattr(analysis, 'FIGURE_JOBS', [])
+    return analysis.RENDER
+
+
+@pytest.fixture
+def profile(monkeypatch):
+
+    # fresh profiling state; tracing is stopped again afterwards
+    monkeypatch.setattr(analysis, 'PROFILE', {'enabled': False, 'path': None, 'stages': [], 'stack': []})
+    tracing = tracemalloc.is_tracing()
+    yield analysis.PROFILE
+    if not tracing:
+        tracemalloc.stop()
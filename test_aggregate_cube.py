@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+
+
+@pytest.fixture
+def df(export):
+    return analysis.load_data(export)[0]
+
+
+def long_responses(df):
+
+    # reference: one row per participant and item, with the cube's axes as columns
+    long = df.assign(age_band=analysis.age_bands(df['age'])).melt(
+        id_vars=['group', 'gender', 'country', 'age_band'], value_vars=analysis.ITEMS, var_name='env', value_name='value')
+    long['dimension'] = long['env'].str.split('_').str[0]
+    long['environment'] = long['env'].str.split('_').str[1]
+    for col in ['group', 'gender', 'country']:
+        long[col] = long[col].astype(str)
+    return long
+
+
+@pytest.mark.parametrize('statistic', ['count', 'mean', 'std', 'median'])
+@pytest.mark.parametrize('by', [('group',), ('group', 'dimension', 'environment'), ('gender', 'age_band')])
+def test_summary_matches_pandas(df, statistic, by):
+    cube = analysis.AggregateCube.from_data(df)
+    summary = cube.summary(statistic, by=by)
+    expected = long_responses(df).groupby(summary.index.names)['value'].agg(statistic)
+    
+    # cells without responses are empty in the cube and missing in the groupby
+    cells = summary.index if statistic == 'count' else summary.dropna().index
+    expected = expected.reindex(cells).fillna(0)
+    pd.testing.assert_series_equal(summary.loc[cells].astype(float), expected.astype(float), check_names=False)
+
+
+def test_selection_and_percentages(df):
+    cube = analysis.AggregateCube.from_data(df)
+    long = long_responses(df)
+    rows = long[(long['dimension'] == 'emotion') & long['environment'].isin(['public', 'traffic'])]
+    expected = rows.groupby('group')['value'].value_counts(normalize=True).unstack(fill_value=0)*100
+    percentage = cube.summary('percentage', by=('group',), dimension='emotion', environment=['public', 'traffic'])
+    np.testing.assert_allclose(percentage.loc[expected.index, expected.columns], expected)
+    mode = cube.summary('mode', by=('group',), dimension='emotion', environment=['public', 'traffic'])
+    assert mode['control'] == rows[rows['group'] == 'control']['value'].mode().max()
+
+
+def test_subject_counts(df):
+    cube = analysis.AggregateCube.from_data(df)
+    counts = cube.participant_counts(by=('group', 'gender'))
+    expected = df.groupby(['group', 'gender'], observed=True).size()
+    for key, count in expected.items():
+        assert counts[key] == count
+    assert counts.sum() == len(df.index)
+    assert cube.age_histogram(group='stroke') == df['age'][df['group'] == 'stroke'].value_counts().to_dict()
+
+
+def test_layouts_agree(df):
+    wide = analysis.AggregateCube.from_data(df)
+    matrix = analysis.AggregateCube.from_data(analysis.rearrange_data(df))
+    np.testing.assert_array_equal(wide.counts.sum(axis=2), matrix.counts.sum(axis=2))
+
+
+def test_median_values(df):
+    expected = df[['group']+analysis.ITEMS].groupby('group', observed=True).median()
+    df_median = analysis.median_values(df).set_index('group')
+    np.testing.assert_array_equal(df_median.loc[expected.index.astype(str)].to_numpy(float), expected.to_numpy(float))
+
+
+def test_cli_summary(export, capsys):
+    analysis.main(['info', export, '--no-cache', '--summary'])
+    assert 'median' in capsys.readouterr().out
+
+
+def test_graph_shares_one_cube(df, capsys):
+
+    # info and the plots take the 'cube' node; only responses and cube read the data set itself
+    tasks = analysis.pipeline_tasks()
+    assert {name for name, task in tasks.items() if 'data' in task['inputs'].values()} == {'responses', 'cube'}
+    assert tasks['info']['inputs'] == {'df': 'cube'}
+    analysis.info_data(df, summary=True)
+    expected = capsys.readouterr().out
+    analysis.info_data(analysis.AggregateCube.from_data(df), summary=True)
+    assert capsys.readouterr().out == expected
+
+
+def test_small_groups_report_nan(df, capsys):
+
+    # a group with one subject: std, shapiro-wilk and levene are nan instead of failing
+    small = pd.concat([df[df['group'] == 'stroke'].iloc[:1], df[df['group'] == 'control']])
+    analysis.info_data(small, age_tests=True)
+    output = capsys.readouterr().out
+    assert 'distribution of age in stroke subjects: (nan, nan)' in output
+    assert 'variance of age between groups: (nan, nan)' in output
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import analysis
+import benchmark
+
+
+@pytest.fixture
+def fitted(export):
+    return benchmark.fit_profile(export)
+
+
+def test_profile_is_fitted(fitted):
+    assert sum(fitted[group]['share'] for group in analysis.GROUPS) == pytest.approx(1)
+    for group in analysis.GROUPS:
+        assert fitted[group]['likert'].shape == (len(analysis.ITEMS), analysis.LIKERT_LEVELS)
+        np.testing.assert_allclose(fitted[group]['likert'].sum(axis=1), 1)
+
+
+def test_one_missing_answer_per_incomplete_trial(fitted):
+    chunk = benchmark.synthetic_chunk(5000, fitted, np.random.default_rng(0), missing=0.1)
+    missing = chunk[analysis.RAW_COLUMNS[1:12]].isna().sum(axis=1)
+    assert set(missing.unique()) == {0, 1}
+    assert missing.sum() == pytest.approx(500, rel=0.2)
+    assert list(chunk.columns) == analysis.RAW_COLUMNS
+
+
+def test_export_loads(fitted, tmp_path):
+    path = benchmark.synthetic_export(3000, path=str(tmp_path / 'export.csv'), profile=fitted, chunksize=700)
+    df, incomplete, young = analysis.load_data(path)
+    assert len(df.index) + incomplete + young == 3000
+    assert df['participant'].is_unique
+    assert (df['age'] >= analysis.MIN_AGE).all()
+    assert young == pytest.approx(0.05*3000, rel=0.3)
+    assert set(df['country'].astype(str)) <= set(benchmark.COUNTRIES)
+    assert (df['TIME_end'] - df['TIME_start'] == df['TIME_total']).all()
+
+
+def test_benchmark_traces_every_stage(fitted, tmp_path, profile, render):
+    path = benchmark.synthetic_export(500, path=str(tmp_path / 'export.csv'), profile=fitted)
+    trace = benchmark.benchmark(path, replicates=20)
+    assert {'load', 'info', 'rearrange', 'test', 'correlate', 'plot'} <= set(trace['totals'])
+
+
+def test_version_and_results_do_not_depend_on_cwd(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    expected = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(benchmark.__file__),
+                              capture_output=True, text=True).stdout.strip() or None
+    assert benchmark.version() == expected
+    assert os.path.dirname(benchmark.RESULTS) == os.path.dirname(os.path.abspath(benchmark.__file__))
+    assert subprocess.run(['git', 'check-ignore', '-q', benchmark.RESULTS], cwd=os.path.dirname(benchmark.__file__)).returncode == 0
+
+
+def test_lazy_modules_imported_before_the_trace(fitted, tmp_path):
+
+    # a fresh process: scipy and pyplot are loaded when profiling starts, not inside the first stage using them
+    path = benchmark.synthetic_export(300, path=str(tmp_path / 'export.csv'), profile=fitted)
+    code = ('import sys, analysis, benchmark; configure = analysis.configure_profiling; '
+            'analysis.configure_profiling = lambda *a, **k: (print(all(m in sys.modules for m in ["scipy.stats", "matplotlib.pyplot"])), configure(*a, **k)); '
+            'benchmark.benchmark(sys.argv[1], replicates=10)')
+    output = subprocess.run([sys.executable, '-c', code, path], cwd=os.path.dirname(benchmark.__file__), capture_output=True, text=True, check=True)
+    assert output.stdout.split()[0] == 'True'
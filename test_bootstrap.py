@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+import analysis
+
+
+def long_frame(n=40, seed=0):
+
+    # df_melted2-like frame: one row per participant and environment
+    rng = np.random.default_rng(seed)
+    age = rng.integers(60, 85, size=n)
+    group = np.where(np.arange(n) % 2, 'stroke', 'control')
+    rows = []
+    for p in range(n):
+        for env in ['nature', 'public', 'traffic', 'home']:
+            behaviour = int(np.clip(round((age[p]-60)/8 + rng.normal(1.5, 1)), 1, 4))
+            rows.append({'participant': 'p'+str(p), 'group': group[p], 'age': age[p], 'env': env,
+                         'behaviour': behaviour, 'emotion': int(rng.integers(1, 5))})
+    return pd.DataFrame(rows)
+
+
+def test_estimates_match_scipy():
+    df = long_frame()
+    df_ci = analysis.bootstrap_ci(df, replicates=200).set_index(['subgroup', 'statistic'])
+    for subgroup, rows in [('all', df), ('stroke', df[df['group'] == 'stroke'])]:
+        assert df_ci.loc[(subgroup, 'mean_behaviour'), 'estimate'] == pytest.approx(rows['behaviour'].mean())
+        assert df_ci.loc[(subgroup, 'rho_behaviour'), 'estimate'] == pytest.approx(stats.spearmanr(rows['age'], rows['behaviour'])[0])
+        total = rows['behaviour'] + rows['emotion']
+        assert df_ci.loc[(subgroup, 'rho_total'), 'estimate'] == pytest.approx(stats.spearmanr(rows['age'], total)[0])
+
+
+def test_percentile_ci_matches_scipy_bootstrap():
+
+    # same participant resampling through scipy.stats.bootstrap (percentile method); the two
+    # random streams differ, so the interval ends agree up to monte carlo error
+    df = long_frame()
+    df_ci = analysis.bootstrap_ci(df, replicates=4000, seed=1).set_index(['subgroup', 'statistic'])
+    rows = df.groupby('participant', sort=False).indices
+    blocks = np.array([rows[p] for p in df['participant'].unique()])
+    age, behaviour = df['age'].to_numpy(), df['behaviour'].to_numpy()
+
+    def rho(index):
+        sample = blocks[index].ravel()
+        return stats.spearmanr(age[sample], behaviour[sample])[0]
+    def mean(index):
+        return behaviour[blocks[index].ravel()].mean()
+
+    for statistic, function, tolerance in [('rho_behaviour', rho, 0.03), ('mean_behaviour', mean, 0.05)]:
+        reference = stats.bootstrap((np.arange(len(blocks)),), function, vectorized=False, n_resamples=4000,
+                                    method='percentile', random_state=np.random.default_rng(2)).confidence_interval
+        assert df_ci.loc[('all', statistic), 'ci_low'] == pytest.approx(reference.low, abs=tolerance)
+        assert df_ci.loc[('all', statistic), 'ci_high'] == pytest.approx(reference.high, abs=tolerance)
+
+
+def test_seeded():
+    df = long_frame()
+    pd.testing.assert_frame_equal(analysis.bootstrap_ci(df, replicates=100, seed=3), analysis.bootstrap_ci(df, replicates=100, seed=3))
+
+
+def test_blocks_do_not_change_the_result():
+
+    # replicates drawn in small blocks of resampling counts give the same intervals as one block
+    df = long_frame()
+    pd.testing.assert_frame_equal(analysis.bootstrap_ci(df, replicates=300, seed=4, block_elements=100),
+                                  analysis.bootstrap_ci(df, replicates=300, seed=4))
@@ -0,0 +1,47 @@
+import os
+import shutil
+
+import pandas as pd
+
+import analysis
+
+
+def test_cached_equals_uncached(export, tmp_path):
+    expected = analysis.load_data(export)
+    cold = analysis.load_data_cached(export, cache_dir=str(tmp_path))
+    warm = analysis.load_data_cached(export, cache_dir=str(tmp_path))
+    for df, incomplete, young in [cold, warm]:
+        pd.testing.assert_frame_equal(df, expected[0], check_dtype=False, check_index_type=False)
+        assert (incomplete, young) == expected[1:]
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_warm_start_skips_parsing(export, tmp_path, monkeypatch):
+    analysis.load_data_cached(export, cache_dir=str(tmp_path))
+    def fail(*args, **kwargs):
+        raise AssertionError('export parsed again')
+    monkeypatch.setattr(analysis, 'load_data', fail)
+    analysis.load_data_cached(export, cache_dir=str(tmp_path))
+
+
+def test_changed_export_replaces_entry(export, tmp_path):
+    path = str(tmp_path / 'export.csv')
+    cache_dir = str(tmp_path / 'cache')
+    shutil.copy(export, path)
+    first = analysis.load_data_cached(path, cache_dir=cache_dir)[0]
+    
+    # drop the last trial: new key, and the stale entry of the same export is removed
+    with open(path) as f:
+        lines = f.readlines()
+    with open(path, 'w') as f:
+        f.writelines(lines[:-1])
+    second = analysis.load_data_cached(path, cache_dir=cache_dir)[0]
+    assert len(second.index) < len(first.index)
+    assert len([name for name in os.listdir(cache_dir) if not name.endswith('.tmp')]) == 1
+
+
+def test_min_age_is_part_of_key(export, tmp_path):
+    default = analysis.load_data_cached(export, cache_dir=str(tmp_path))[0]
+    older = analysis.load_data_cached(export, cache_dir=str(tmp_path), min_age=70)[0]
+    assert (older['age'] >= 70).all()
+    assert len(older.index) <= len(default.index)
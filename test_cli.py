@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+
+import analysis
+
+
+def test_import_is_lazy():
+
+    # matplotlib and scipy are only imported by the stages that use them
+    code = 'import sys, analysis; print(any(name.split(".")[0] in ["scipy", "matplotlib"] for name in sys.modules))'
+    output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(analysis.__file__), capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == 'False'
+
+
+def test_info_on_cached_data_does_not_import_scipy(export, tmp_path):
+
+    # the demographic tests of age are opt-in: a warm info run stays free of scipy
+    code = ('import sys, analysis; analysis.main(["info", sys.argv[1], "--cache-dir", sys.argv[2]] + sys.argv[3:]); '
+            'print("scipy" in sys.modules)')
+    run = lambda *options: subprocess.run([sys.executable, '-c', code, export, str(tmp_path), *options], cwd=os.path.dirname(analysis.__file__),
+                                          capture_output=True, text=True, check=True).stdout
+    run()
+    output = run()
+    assert output.strip().endswith('False') and 't-test' not in output
+    output = run('--age-tests')
+    assert output.strip().endswith('True') and 't-test for age difference between groups: ' in output
+
+
+def test_rearrange_writes_long_frames(export, tmp_path, capsys):
+    analysis.main(['rearrange', export, '--cache-dir', str(tmp_path / 'cache'), '--output', str(tmp_path / 'long')])
+    df = analysis.load_data(export)[0]
+    assert len(pd.read_csv(tmp_path / 'long1.csv').index) == len(df.index)*len(analysis.ITEMS)
+    assert len(pd.read_csv(tmp_path / 'long2.csv').index) == len(df.index)*len(analysis.ENVIRONMENTS)
+    assert os.listdir(tmp_path / 'cache')
+
+
+def test_plot_saves_figures(export, tmp_path, render):
+    analysis.main(['plot', export, '--no-cache', '--save', str(tmp_path), '--replicates', '50', '--workers', '1'])
+    assert sorted(os.listdir(tmp_path)) == ['riskperception.png', 'twosided_bar.png']
+
+
+def test_test_stage_prints_results(export, tmp_path, render, capsys):
+    analysis.main(['test', export, '--no-cache', '--save', str(tmp_path), '--no-histograms'])
+    assert '### SIGNIFICANCE TESTING ###' in capsys.readouterr().out
+    assert os.listdir(tmp_path) == []
+
+
+def test_min_age_option(export, capsys):
+    analysis.main(['info', export, '--no-cache', '--min-age', '65'])
+    assert 'subjects younger than 65 years old (removed): ' in capsys.readouterr().out
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+import analysis
+
+
+@pytest.fixture
+def df(export):
+    return analysis.load_data(export)[0]
+
+
+@pytest.mark.parametrize('selection', [{}, {'group': 'control'}])
+def test_matrix_matches_scipy(df, selection):
+    variables = analysis.correlation_variables(df)
+    index = analysis.SubgroupIndex(analysis.frame_factors(df))
+    table = analysis.rank_correlation(variables, index, {'subgroup': selection}).set_index(['method', 'x', 'y'])
+    rows = index.rows(**selection)
+    names = list(variables)
+    assert len(table.index) == 2*len(names)*(len(names)-1)//2
+    for x, y in [('age', 'total'), ('age', 'behaviour_public'), ('emotion_dom', 'TIME_total'), ('behaviour', 'emotion')]:
+        a, b = np.asarray(variables[x], dtype=float)[rows], np.asarray(variables[y], dtype=float)[rows]
+        spearman, kendall = stats.spearmanr(a, b), stats.kendalltau(a, b, method='asymptotic')
+        assert table.loc[('spearman', x, y), 'coefficient'] == pytest.approx(spearman.statistic, nan_ok=True)
+        assert table.loc[('spearman', x, y), 'pvalue'] == pytest.approx(spearman.pvalue, nan_ok=True)
+        assert table.loc[('kendall', x, y), 'coefficient'] == pytest.approx(kendall.statistic, nan_ok=True)
+        assert table.loc[('kendall', x, y), 'pvalue'] == pytest.approx(kendall.pvalue, nan_ok=True)
+
+
+def test_kendall_tables_match_scipy_fallback(df):
+
+    # contingency tables and the scipy fallback (table_elements=0) give the same matrix
+    data = np.column_stack([np.asarray(values, dtype=float) for values in analysis.correlation_variables(df).values()])
+    tables, fallback = analysis.kendall_matrix(data), analysis.kendall_matrix(data, table_elements=0)
+    np.testing.assert_allclose(tables[0], fallback[0])
+    np.testing.assert_allclose(tables[1], fallback[1])
+
+
+def test_kendall_constant_column():
+    rng = np.random.default_rng(0)
+    data = np.column_stack([rng.integers(1, 5, 50), rng.integers(60, 90, 50), np.full(50, 3)]).astype(float)
+    tau, pvalue = analysis.kendall_matrix(data)
+    reference = stats.kendalltau(data[:, 0], data[:, 1])
+    assert tau[0, 1] == pytest.approx(reference.statistic) and pvalue[0, 1] == pytest.approx(reference.pvalue)
+    assert np.isnan(tau[0, 2]) and np.isnan(pvalue[0, 2])
+
+
+def test_age_correlations(df):
+    responses = analysis.rearrange_data(df)
+    correlation = analysis.spearman_correlation(responses, replicates=50).set_index(['subgroup', 'y'])
+    pairs = responses.to_pairs()
+    stroke = pairs[pairs['group'] == 'stroke']
+    assert len(correlation.index) == 9
+    assert correlation.loc[('stroke', 'behaviour'), 'coefficient'] == pytest.approx(stats.spearmanr(stroke['age'], stroke['behaviour'])[0])
+    assert (correlation['ci_low'] <= correlation['ci_high']).all()
+
+
+def test_cli_matrix(export, capsys):
+    analysis.main(['correlate', export, '--no-cache', '--matrix', '--replicates', '20'])
+    assert 'kendall' in capsys.readouterr().out
@@ -0,0 +1,85 @@
+import os
+
+import pandas as pd
+import pytest
+
+import analysis
+
+
+def write_participant_files(export, directory):
+
+    # every row of the export as a psytoolkit participant file (TIME_total is left to the parser)
+    raw = pd.read_csv(export, dtype=str)
+    for _, row in raw.iterrows():
+        lines = []
+        for label in ['age', 'gender', 'group', 'behaviour', 'emotion', 'country']:
+            lines.append('l: '+label)
+            for col in [col for col in raw.columns if col.split(':')[0] == label]:
+                if not pd.isna(row[col]):
+                    lines.append('- '+row[col])
+        lines += [col+': '+row[col] for col in ['TIME_start', 'TIME_end'] if not pd.isna(row[col])]
+        with open(os.path.join(directory, row['participant']), 'w') as f:
+            f.write('\n'.join(lines)+'\n')
+    return sorted(raw['participant'])
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_directory_matches_export(export, tmp_path, workers):
+    write_participant_files(export, tmp_path)
+    df, incomplete, young, names = analysis.load_directory(str(tmp_path), workers=workers)
+    expected, expected_incomplete, expected_young = analysis.load_data(export)
+    assert (incomplete, young) == (expected_incomplete, expected_young)
+    expected = expected.sort_values('participant').reset_index(drop=True)
+    pd.testing.assert_frame_equal(df.reset_index(drop=True), expected, check_categorical=False)
+
+
+def test_manifest_skips_ingested_files(export, tmp_path):
+    directory, manifest = tmp_path / 'files', str(tmp_path / 'manifest.txt')
+    directory.mkdir()
+    names = write_participant_files(export, directory)
+    first, _, _, parsed = analysis.load_directory(str(directory), manifest=manifest, workers=1)
+    assert sorted(parsed) == names and not os.path.exists(manifest)
+    analysis.save_manifest(manifest, first, parsed)
+    assert open(manifest).read().split() == sorted(parsed)
+    
+    # a rerun parses nothing and still returns the whole data set
+    again, _, _, parsed = analysis.load_directory(str(directory), manifest=manifest, workers=1)
+    assert parsed == []
+    pd.testing.assert_frame_equal(again, first.reset_index(drop=True), check_categorical=False)
+    
+    # a new file is the only one parsed by the next run and is added to the kept rows
+    os.replace(directory / first['participant'].iloc[0], directory / 's.new.txt')
+    new, _, _, parsed = analysis.load_directory(str(directory), manifest=manifest, workers=1)
+    assert parsed == ['s.new.txt']
+    assert len(new) == len(first)+1 and new['participant'].iloc[-1] == 's.new.txt'
+
+
+def test_manifest_written_after_successful_run(export, tmp_path, monkeypatch, capsys):
+    directory, manifest = tmp_path / 'files', str(tmp_path / 'manifest.txt')
+    directory.mkdir()
+    write_participant_files(export, directory)
+    
+    # a failing run records nothing
+    def fail(*args, **kwargs):
+        raise RuntimeError('stage failed')
+    monkeypatch.setattr(analysis, 'info_data', fail)
+    with pytest.raises(RuntimeError):
+        analysis.main(['info', str(directory), '--manifest', manifest, '--workers', '1'])
+    assert not os.path.exists(manifest)
+    monkeypatch.undo()
+    
+    analysis.main(['info', str(directory), '--manifest', manifest, '--workers', '1'])
+    first = capsys.readouterr().out
+    assert 'incomplete trials (removed): 3' in first
+    
+    # the rerun parses no file but reports the demographics of the whole data set
+    analysis.main(['info', str(directory), '--manifest', manifest, '--workers', '1'])
+    again = capsys.readouterr().out
+    assert 'incomplete trials (removed): 0' in again
+    assert again.split('### DEMOGRAPHIC INFO ###')[1] == first.split('### DEMOGRAPHIC INFO ###')[1]
+
+
+def test_cli_accepts_directory(export, tmp_path, capsys):
+    write_participant_files(export, tmp_path)
+    analysis.main(['info', str(tmp_path), '--workers', '1'])
+    assert '### DEMOGRAPHIC INFO ###' in capsys.readouterr().out
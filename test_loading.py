@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+import analysis
+
+
+def reference(path, min_age=analysis.MIN_AGE):
+
+    # the original cleaning on the whole file: rename, drop incomplete trials and young subjects, recode
+    raw = pd.read_csv(path)
+    raw.columns = analysis.COLUMNS
+    complete = raw.dropna()
+    df = complete[complete['age'] >= min_age].copy()
+    df['gender'] = df['gender'].map(analysis.GENDER_CODES)
+    df['group'] = df['group'].map(analysis.GROUP_CODES)
+    return df, len(raw.index) - len(complete.index), len(complete.index) - len(df.index)
+
+
+@pytest.mark.parametrize('chunksize', [1, 5, 100000])
+def test_chunks_match_reference(messy_export, chunksize):
+    df, incomplete, young = analysis.load_data(messy_export, chunksize=chunksize)
+    expected, expected_incomplete, expected_young = reference(messy_export)
+    assert (incomplete, young) == (expected_incomplete, expected_young)
+    assert young >= 1
+    assert df['participant'].tolist() == expected['participant'].tolist()
+    for col in ['age', 'TIME_total'] + analysis.ITEMS:
+        assert df[col].tolist() == expected[col].astype(int).tolist()
+    for col in ['gender', 'group', 'country']:
+        assert df[col].astype(str).tolist() == expected[col].tolist()
+
+
+def test_compact_dtypes(export):
+    df = analysis.load_data(export)[0]
+    assert all(df[item].dtype == 'uint8' for item in analysis.ITEMS)
+    assert isinstance(df['group'].dtype, pd.CategoricalDtype)
+    assert isinstance(df['country'].dtype, pd.CategoricalDtype)
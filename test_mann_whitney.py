@@ -0,0 +1,134 @@
+import itertools
+import os
+import warnings
+
+import numpy as np
+import pytest
+from scipy import stats
+
+import analysis
+
+
+ALTERNATIVES = ['two-sided', 'less', 'greater']
+
+
+def histograms(sample_a, sample_b, levels):
+    return np.array([[(sample_a == level).sum() for level in levels]]), np.array([[(sample_b == level).sum() for level in levels]])
+
+
+@pytest.mark.parametrize('alternative', ALTERNATIVES)
+@pytest.mark.parametrize('seed', range(5))
+def test_asymptotic_matches_scipy(alternative, seed):
+
+    # likert coded samples of different sizes (many ties)
+    rng = np.random.default_rng(seed)
+    sample_a = rng.integers(1, analysis.LIKERT_LEVELS+1, size=rng.integers(5, 60))
+    sample_b = rng.integers(1, analysis.LIKERT_LEVELS+1, size=rng.integers(5, 60))
+    counts_a, counts_b = histograms(sample_a, sample_b, np.arange(1, analysis.LIKERT_LEVELS+1))
+    u, pvalue = analysis.mann_whitney_counts(counts_a, counts_b, [alternative])
+    reference = stats.mannwhitneyu(sample_a, sample_b, alternative=alternative, method='asymptotic')
+    assert u[0] == pytest.approx(reference.statistic)
+    assert pvalue[0] == pytest.approx(reference.pvalue)
+
+
+@pytest.mark.parametrize('alternative', ALTERNATIVES)
+def test_rank_histograms_match_scipy(alternative):
+
+    # arbitrary (non-likert) values through the shared-sort path
+    rng = np.random.default_rng(1)
+    values = rng.normal(size=80).round(1)
+    masks = np.zeros((2, len(values)), dtype=bool)
+    masks[0, :35], masks[1, 35:] = True, True
+    levels, counts = analysis.rank_histograms(values, masks)
+    u, pvalue = analysis.mann_whitney_counts(counts[:1], counts[1:], [alternative])
+    reference = stats.mannwhitneyu(values[:35], values[35:], alternative=alternative, method='asymptotic')
+    assert u[0] == pytest.approx(reference.statistic)
+    assert pvalue[0] == pytest.approx(reference.pvalue)
+
+
+@pytest.mark.parametrize('alternative', ALTERNATIVES)
+@pytest.mark.parametrize('samples', [([1, 2, 2, 4], [2, 3, 3, 5, 5]), ([1, 1, 3, 3, 3], [3, 4, 4, 5, 5, 5]), ([2, 2, 2], [2, 2, 4, 4])])
+def test_exact_matches_enumeration(alternative, samples, tmp_path, monkeypatch):
+
+    # p-value of the exact test against all splits of the combined sample into samples of the original sizes
+    monkeypatch.setattr(analysis.exact_null_distribution.__wrapped__, '__defaults__', (str(tmp_path),))
+    sample_a, sample_b = np.array(samples[0]), np.array(samples[1])
+    counts_a, counts_b = histograms(sample_a, sample_b, np.union1d(sample_a, sample_b))
+    u, pvalue = analysis.mann_whitney_counts(counts_a, counts_b, [alternative], method='exact')
+
+    combined = np.concatenate([sample_a, sample_b])
+    n1, n2 = len(sample_a), len(sample_b)
+    ranks = stats.rankdata(combined)
+    statistic = lambda rows: ranks[list(rows)].sum() - n1*(n1+1)/2
+    null = np.array([statistic(rows) for rows in itertools.combinations(range(n1+n2), n1)])
+    observed = statistic(range(n1))
+    greater, less = np.mean(null >= observed - 1e-9), np.mean(null <= observed + 1e-9)
+    expected = {'greater': greater, 'less': less, 'two-sided': min(1.0, 2*min(greater, less))}[alternative]
+    assert u[0] == pytest.approx(observed)
+    assert pvalue[0] == pytest.approx(expected)
+
+
+@pytest.mark.parametrize('alternative', ALTERNATIVES)
+def test_exact_matches_scipy_without_ties(alternative, tmp_path, monkeypatch):
+
+    monkeypatch.setattr(analysis.exact_null_distribution.__wrapped__, '__defaults__', (str(tmp_path),))
+    sample_a, sample_b = np.array([1, 4, 5, 9, 12]), np.array([2, 3, 6, 7, 8, 10, 11])
+    counts_a, counts_b = histograms(sample_a, sample_b, np.arange(1, 13))
+    u, pvalue = analysis.mann_whitney_counts(counts_a, counts_b, [alternative], method='exact')
+    reference = stats.mannwhitneyu(sample_a, sample_b, alternative=alternative, method='exact')
+    assert u[0] == pytest.approx(reference.statistic)
+    assert pvalue[0] == pytest.approx(reference.pvalue)
+
+
+def test_exact_null_is_persisted(tmp_path):
+
+    # a second process finds the distribution on disk
+    pmf = analysis.exact_null_distribution.__wrapped__(4, 5, (2, 3, 4), str(tmp_path))
+    assert pmf.sum() == pytest.approx(1)
+    assert len(os.listdir(tmp_path / 'mwu_exact')) == 1
+    np.testing.assert_array_equal(analysis.exact_null_distribution.__wrapped__(4, 5, (2, 3, 4), str(tmp_path)), pmf)
+
+
+def test_auto_uses_exact_for_small_samples(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(analysis.exact_null_distribution.__wrapped__, '__defaults__', (str(tmp_path),))
+    counts_a, counts_b = [[1, 2, 0, 1]], [[0, 1, 2, 2]]
+    auto = analysis.mann_whitney_counts(counts_a, counts_b, ['two-sided'], method='auto')[1]
+    exact = analysis.mann_whitney_counts(counts_a, counts_b, ['two-sided'], method='exact')[1]
+    asymptotic = analysis.mann_whitney_counts(counts_a, counts_b, ['two-sided'])[1]
+    assert auto[0] == exact[0] != asymptotic[0]
+
+
+def test_exact_falls_back_for_large_tables(tmp_path, monkeypatch):
+
+    # tests whose null distribution table exceeds EXACT_MAX_TABLE get the asymptotic p-value and a warning
+    monkeypatch.setattr(analysis.exact_null_distribution.__wrapped__, '__defaults__', (str(tmp_path),))
+    counts_a, counts_b = [[1, 2, 0, 1], [300, 200, 250, 250]], [[0, 1, 2, 2], [250, 250, 200, 300]]
+    asymptotic = analysis.mann_whitney_counts(counts_a, counts_b, ['two-sided'])[1]
+    exact = analysis.mann_whitney_counts(counts_a[:1], counts_b[:1], ['two-sided'], method='exact')[1]
+    with pytest.warns(UserWarning, match='1000/1000'):
+        pvalue = analysis.mann_whitney_counts(counts_a, counts_b, ['two-sided'], method='exact')[1]
+    assert pvalue[0] == exact[0] != asymptotic[0]
+    assert pvalue[1] == asymptotic[1]
+
+
+def test_validate_matches_scipy(export):
+
+    # the cross-check of significance_test() on the raw samples of the export passes
+    responses = analysis.rearrange_data(analysis.load_data(export)[0])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        results = analysis.significance_test(responses, validate=True)
+    assert len(results) == len(analysis.significance_spec())
+
+
+def test_validate_raises_on_mismatch(export, monkeypatch):
+
+    # a wrong engine result is reported, not silently printed
+    responses = analysis.rearrange_data(analysis.load_data(export)[0])
+    counts = analysis.mann_whitney_counts
+    monkeypatch.setattr(analysis, 'mann_whitney_counts', lambda *args, **kwargs: (counts(*args, **kwargs)[0]+1, counts(*args, **kwargs)[1]))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        with pytest.raises(ValueError):
+            analysis.significance_test(responses, validate=True)
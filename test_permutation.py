@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import analysis
+
+
+COUNTS_A = [[3, 5, 6, 2], [4, 4, 4, 4], [1, 2, 6, 7]]
+COUNTS_B = [[6, 6, 3, 1], [4, 4, 5, 3], [2, 3, 5, 6]]
+ALTERNATIVES = ['greater', 'two-sided', 'less']
+
+
+def test_seeded_and_independent_of_workers():
+    serial = analysis.permutation_pvalues(COUNTS_A, COUNTS_B, ALTERNATIVES, n_permutations=4000, batch_size=1000, workers=1)
+    parallel = analysis.permutation_pvalues(COUNTS_A, COUNTS_B, ALTERNATIVES, n_permutations=4000, batch_size=1000, workers=2)
+    for a, b in zip(serial, parallel):
+        np.testing.assert_array_equal(a, b)
+    other = analysis.permutation_pvalues(COUNTS_A, COUNTS_B, ALTERNATIVES, n_permutations=4000, batch_size=1000, seed=1, workers=1)
+    assert not np.array_equal(serial[0], other[0])
+
+
+@pytest.mark.parametrize('alternative', ['two-sided', 'less', 'greater'])
+def test_close_to_exact(alternative, tmp_path, monkeypatch):
+
+    # one batch of 20000 permutations estimates the exact p-value
+    monkeypatch.setattr(analysis.exact_null_distribution.__wrapped__, '__defaults__', (str(tmp_path),))
+    counts_a, counts_b = [[2, 4, 3, 1]], [[1, 2, 4, 3]]
+    exact = analysis.mann_whitney_counts(counts_a, counts_b, [alternative], method='exact')[1][0]
+    pvalue, done = analysis.permutation_pvalues(counts_a, counts_b, [alternative], n_permutations=20000,
+                                                batch_size=20000, workers=1)
+    assert done[0] == 20000
+    assert pvalue[0] == pytest.approx(exact, abs=0.02)
+
+
+def test_early_stopping():
+
+    # clearly separated and clearly equal samples stop after the first batch
+    counts_a, counts_b = [[0, 0, 5, 15], [5, 5, 5, 5]], [[15, 5, 0, 0], [5, 5, 5, 5]]
+    pvalue, done = analysis.permutation_pvalues(counts_a, counts_b, ['greater', 'greater'], n_permutations=50000,
+                                                batch_size=1000, workers=1)
+    assert done.tolist() == [1000, 1000]
+    assert pvalue[0] < 0.05 < pvalue[1]
+
+
+def test_cli_passes_workers(export, monkeypatch, capsys):
+
+    # --workers reaches the permutation pool of the test stage
+    calls = []
+    permutation_pvalues = analysis.permutation_pvalues
+    def spy(*args, **kwargs):
+        calls.append(kwargs['workers'])
+        return permutation_pvalues(*args, **kwargs)
+    monkeypatch.setattr(analysis, 'permutation_pvalues', spy)
+    analysis.main(['test', export, '--no-cache', '--no-histograms', '--method', 'permutation', '--permutations', '1000', '--workers', '1'])
+    assert calls == [1]
+    assert 'SIGNIFICANCE TESTING' in capsys.readouterr().out
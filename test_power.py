@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+import analysis
+
+
+@pytest.fixture
+def model(export):
+    return analysis.fit_power_model(analysis.load_data(export)[0])
+
+
+def test_model(model):
+    for group in analysis.GROUPS:
+        likert = model[group]['likert']
+        assert likert.shape == (len(analysis.ENVIRONMENTS), len(analysis.DIMENSIONS), analysis.LIKERT_LEVELS)
+        np.testing.assert_allclose(likert.sum(axis=-1), 1)
+        assert (likert > 0).all()
+        assert model[group]['r'].shape == (len(analysis.DIMENSIONS),) and (np.abs(model[group]['r']) <= 1).all()
+
+
+def test_simulated_marginals(model):
+    ages, values = analysis.simulate_group(model['control'], 200, 50, np.random.default_rng(0))
+    assert ages.shape == (50, 200) and values.shape == (50, 200, len(analysis.ENVIRONMENTS), len(analysis.DIMENSIONS))
+    assert set(np.unique(ages)) <= set(model['control']['ages'])
+    frequencies = np.stack([(values == level).mean(axis=(0, 1)) for level in range(1, analysis.LIKERT_LEVELS+1)], axis=-1)
+    np.testing.assert_allclose(frequencies, model['control']['likert'], atol=0.02)
+
+
+def test_dimensions_keep_their_own_correlation(export, model):
+
+    # the simulated age - behaviour and age - emotion rho of each group have the sign of the observed ones
+    # (stroke: negative for behaviour, positive for emotion)
+    pairs = analysis.rearrange_data(analysis.load_data(export)[0]).to_pairs()
+    for group in analysis.GROUPS:
+        ages, values = analysis.simulate_group(model[group], 100, 200, np.random.default_rng(1))
+        rows = pairs[pairs['group'] == group]
+        for d, dimension in enumerate(analysis.DIMENSIONS):
+            observed = stats.spearmanr(rows['age'], rows[dimension])[0]
+            simulated = np.mean([stats.spearmanr(np.repeat(ages[r], len(analysis.ENVIRONMENTS)), values[r][:, :, d].ravel())[0]
+                                 for r in range(len(ages))])
+            assert np.sign(simulated) == np.sign(observed)
+            assert simulated == pytest.approx(observed, abs=0.1)
+
+
+def test_batch_matches_scipy(model):
+
+    # the vectorised tests of a batch agree with scipy on the same simulated studies
+    spec = [comparison for comparison in analysis.significance_spec() if comparison['test'] in (1, 7)]
+    n = {'stroke': 15, 'control': 25}
+    seed = np.random.SeedSequence(3)
+    rejections = analysis.power_batch(model, spec, n, 40, 0.05, seed)
+    rng = np.random.default_rng(seed)
+    draws = {group: analysis.simulate_group(model[group], n[group], 40, rng) for group in analysis.GROUPS}
+    for comparison in spec:
+        def sample(selection, r):
+            ages, values = draws[selection['group']]
+            env = slice(None) if 'environment' not in selection else analysis.ENVIRONMENTS.index(selection['environment'])
+            dim = slice(None) if 'dimension' not in selection else analysis.DIMENSIONS.index(selection['dimension'])
+            return values[r][:, env, dim].ravel()
+        expected = sum(stats.mannwhitneyu(sample(comparison['a'], r), sample(comparison['b'], r), alternative=comparison['alternative'],
+                                          method='asymptotic').pvalue < 0.05 for r in range(40))
+        assert rejections[('mann-whitney', comparison['test'], comparison['label'])] == expected
+
+
+def test_null_model_holds_alpha(model):
+
+    # both groups drawn from the same model: rejection rate of the two-sided tests is close to alpha
+    null = {'stroke': model['control'], 'control': model['control']}
+    spec = [comparison for comparison in analysis.significance_spec() if comparison['test'] == 7]
+    rejections = analysis.power_batch(null, spec, {'stroke': 30, 'control': 30}, 2000, 0.05, np.random.SeedSequence(0))
+    for comparison in spec:
+        assert rejections[('mann-whitney', 7, comparison['label'])] / 2000 < 0.08
+
+
+def test_power_curves(export, render, tmp_path):
+    analysis.configure_rendering('save', directory=str(tmp_path), workers=1)
+    df = analysis.load_data(export)[0]
+    serial = analysis.power_simulation(df, sizes=(10, 200), replicates=100, workers=1, batch_elements=20000)
+    parallel = analysis.power_simulation(df, sizes=(10, 200), replicates=100, workers=2, batch_elements=20000)
+    assert serial.equals(parallel)
+    overall = serial[(serial['analysis'] == 'mann-whitney') & (serial['test'] == 3)].groupby('size')['power'].max()
+    assert overall[200] >= overall[10]
+    assert [job[0] for job in analysis.FIGURE_JOBS] == ['power', 'power']
@@ -0,0 +1,58 @@
+import json
+
+import numpy as np
+import pytest
+
+import analysis
+
+
+def test_disabled_records_nothing(profile, export):
+    analysis.load_data(export)
+    assert profile['stages'] == []
+
+
+def test_stage_records(profile, export):
+    analysis.configure_profiling()
+    df = analysis.load_data(export)[0]
+    analysis.rearrange_data(df)
+    stages = {record['stage']: record for record in analysis.PROFILE['stages']}
+    assert {'load', 'clean', 'rearrange'} <= set(stages)
+    assert stages['load']['rows_out'] == len(df.index)
+    assert stages['rearrange']['rows_in'] == stages['rearrange']['rows_out'] == len(df.index)
+    assert all(record['wall_s'] >= 0 and record['peak_bytes'] >= 0 for record in stages.values())
+    assert stages['clean']['depth'] == stages['load']['depth'] + 1
+
+
+def test_nested_peak_is_folded(profile):
+    analysis.configure_profiling()
+    with analysis.ProfileStage('outer'):
+        with analysis.ProfileStage('inner'):
+            block = np.ones(1 << 20)
+            del block
+    inner, outer = analysis.PROFILE['stages']
+    assert inner['peak_bytes'] >= 8 << 20
+    assert outer['peak_bytes'] >= inner['peak_bytes']
+
+
+def test_trace_file(profile, export, tmp_path):
+    path = str(tmp_path / 'trace.json')
+    analysis.main(['rearrange', export, '--no-cache', '--profile', path])
+    with open(path) as f:
+        trace = json.load(f)
+    assert trace['totals']['rearrange']['calls'] == 1
+    assert len(trace['stages']) == sum(total['calls'] for total in trace['totals'].values())
+
+
+def test_nested_same_name_counted_once(profile, export, tmp_path):
+
+    # load_data_cached() wraps load_data() and spearman_correlation() wraps rank_correlation(): the totals hold the
+    # outer call only
+    analysis.configure_profiling()
+    df = analysis.load_data_cached(export, cache_dir=str(tmp_path))[0]
+    analysis.spearman_correlation(analysis.rearrange_data(df), replicates=20)
+    trace = analysis.write_trace()
+    for name in ['load', 'correlate']:
+        records = [record for record in trace['stages'] if record['stage'] == name]
+        assert [record['nested'] for record in records] == [True, False]
+        assert trace['totals'][name]['calls'] == 1
+        assert trace['totals'][name]['wall_s'] == records[1]['wall_s']
@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+
+import analysis
+
+
+def cronbach(frame):
+    k = frame.shape[1]
+    return k/(k-1) * (1 - frame.var().sum()/frame.sum(axis=1).var())
+
+
+def test_streaming_matches_batch(export):
+    df = analysis.load_data(export)[0]
+    streamed = analysis.stream_covariance(export, chunksize=7)
+    batch = analysis.batch_covariance(df)
+    np.testing.assert_array_equal(streamed['n'], batch['n'])
+    np.testing.assert_allclose(streamed['mean'], batch['mean'])
+    np.testing.assert_allclose(streamed['m2'], batch['m2'], atol=1e-9)
+
+
+def test_merged_shards(export):
+    df = analysis.load_data(export)[0]
+    shards = [analysis.batch_covariance(df.iloc[i::3]) for i in range(3)]
+    merged = analysis.merge_covariance(analysis.merge_covariance(shards[0], shards[1]), shards[2])
+    batch = analysis.batch_covariance(df)
+    np.testing.assert_allclose(merged['m2'], batch['m2'], atol=1e-9)
+    empty = analysis.merge_covariance(analysis.covariance_state(), batch)
+    np.testing.assert_allclose(empty['mean'], batch['mean'])
+
+
+def test_reliability_matches_pandas(export):
+    df = analysis.load_data(export)[0]
+    results = analysis.reliability(analysis.batch_covariance(df))
+    alpha = results['alpha'].set_index(['group', 'scale'])['alpha']
+    for group, frame in list(df.groupby('group', observed=True)) + [('all', df)]:
+        items = frame[analysis.ITEMS].astype(float)
+        pd.testing.assert_frame_equal(results['correlation'][group], items.corr(), check_names=False)
+        assert np.isclose(alpha[group, 'all'], cronbach(items), equal_nan=True)
+        for dimension in analysis.DIMENSIONS:
+            scale = items[[item for item in analysis.ITEMS if item.startswith(dimension)]]
+            assert np.isclose(alpha[group, dimension], cronbach(scale), equal_nan=True)
+            totals = results['item_total'].set_index(['group', 'item'])
+            for item in scale:
+                rest = scale.drop(columns=item)
+                assert np.isclose(totals.loc[(group, item), 'corrected_r'], scale[item].corr(rest.sum(axis=1)), equal_nan=True)
+                assert np.isclose(totals.loc[(group, item), 'alpha_if_deleted'], cronbach(rest), equal_nan=True)
+
+
+def test_cli(export, capsys):
+    analysis.main(['reliability', export, '--chunksize', '10'])
+    assert "cronbach's alpha" in capsys.readouterr().out
@@ -0,0 +1,44 @@
+import os
+import warnings
+
+import pytest
+
+import analysis
+
+
+@pytest.fixture
+def inputs(export):
+    df = analysis.load_data(export)[0]
+    return analysis.rearrange_data(df), analysis.median_values(df)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_save_mode_writes_queued_figures(render, inputs, tmp_path, workers):
+    analysis.configure_rendering('save', directory=str(tmp_path), formats=('png', 'svg'), workers=workers)
+    analysis.plot_riskperception(inputs[0], replicates=50)
+    analysis.plot_twosided_bar(inputs[1])
+    assert [job[0] for job in analysis.FIGURE_JOBS] == ['riskperception', 'twosided_bar']
+    paths = analysis.flush_figures()
+    assert sorted(os.listdir(tmp_path)) == ['riskperception.png', 'riskperception.svg', 'twosided_bar.png', 'twosided_bar.svg']
+    assert sorted(paths) == sorted(str(tmp_path / name) for name in os.listdir(tmp_path))
+    assert analysis.FIGURE_JOBS == [] and analysis.flush_figures() == []
+
+
+def test_histograms_can_be_skipped(render, inputs, tmp_path):
+    analysis.configure_rendering('save', directory=str(tmp_path))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        analysis.significance_test(inputs[0])
+        queued = len(analysis.FIGURE_JOBS)
+        analysis.FIGURE_JOBS.clear()
+        analysis.configure_rendering('save', directory=str(tmp_path), histograms=False)
+        analysis.significance_test(inputs[0])
+    assert queued == sum(comparison['hist'] for comparison in analysis.significance_spec())
+    assert analysis.FIGURE_JOBS == []
+
+
+def test_show_mode_draws_immediately(render, monkeypatch):
+    shown = []
+    monkeypatch.setattr(analysis.plt, 'show', lambda: shown.append(True))
+    analysis.render_figure('histograms', analysis.draw_histograms, 'title', [1, 2, 2], [3, 4], 'a', 'b')
+    assert shown == [True] and analysis.FIGURE_JOBS == []
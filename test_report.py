@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+import analysis
+
+
+@pytest.fixture
+def df(monkeypatch, render, export):
+    monkeypatch.setattr(analysis, 'GRAPH_MEMO', {})
+    analysis.RENDER['histograms'] = False
+    return analysis.load_data(export)[0]
+
+
+def test_report_sections(df, tmp_path):
+    figures = analysis.build_report(df, str(tmp_path / 'report'), workers=1, cache_dir=str(tmp_path), replicates=50)
+    with open(tmp_path / 'report' / 'report.md') as f:
+        markdown = f.read()
+    for name, title in analysis.REPORT_SECTIONS:
+        assert '## '+title in markdown
+    stems = [stem for stems in figures.values() for stem in stems]
+    assert sorted(os.listdir(tmp_path / 'report' / 'artifacts')) == sorted(stem+'.png' for stem in stems)
+    assert all('artifacts/'+stem+'.png' in markdown for stem in stems)
+    assert os.path.exists(tmp_path / 'report' / 'report.html')
+
+
+def test_rebuild_reuses_artifacts(df, tmp_path, capsys):
+    directory = str(tmp_path / 'report')
+    first = analysis.build_report(df, directory, workers=1, cache_dir=str(tmp_path), replicates=50)
+    modified = os.path.getmtime(os.path.join(directory, 'report.md'))
+    capsys.readouterr()
+    second = analysis.build_report(df, directory, workers=1, cache_dir=str(tmp_path), replicates=50)
+    assert second == first
+    assert '0 rendered' in capsys.readouterr().out
+    assert os.path.getmtime(os.path.join(directory, 'report.md')) == modified
+    
+    # a changed parameter re-renders only the figures that depend on it
+    third = analysis.build_report(df, directory, workers=1, cache_dir=str(tmp_path), replicates=60)
+    assert third['twosided_bar'] == first['twosided_bar']
+    assert third['riskperception'] != first['riskperception']
+    assert '1 rendered' in capsys.readouterr().out
+
+
+def test_artifact_key():
+    assert analysis.artifact_key('code', 'draw', (1, 2)) == analysis.artifact_key('code', 'draw', (1, 2))
+    assert analysis.artifact_key('code', 'draw', (1, 2)) != analysis.artifact_key('code', 'draw', (1, 3))
+    assert analysis.artifact_key('code', 'draw', (1, 2)) != analysis.artifact_key('other', 'draw', (1, 2))
+
+
+def test_module_hashed_once_per_build(df, tmp_path, monkeypatch):
+    calls = []
+    file_hash = analysis.file_hash
+    def counting(path, *args):
+        calls.append(path)
+        return file_hash(path, *args)
+    monkeypatch.setattr(analysis, 'file_hash', counting)
+    analysis.build_report(df, str(tmp_path / 'report'), workers=1, cache_dir=None, replicates=20)
+    
+    # once for the graph fingerprints and once for the artifact keys, not once per figure
+    assert calls.count(analysis.__file__) == 2
+
+
+def test_stale_artifacts_are_pruned(df, tmp_path, capsys):
+    directory = tmp_path / 'report'
+    first = analysis.build_report(df, str(directory), workers=1, cache_dir=str(tmp_path), replicates=50)
+    (directory / 'artifacts' / 'unrelated.png').write_text('')
+    third = analysis.build_report(df, str(directory), formats=('png', 'svg'), workers=1, cache_dir=str(tmp_path), replicates=60)
+    expected = sorted(stem+'.'+fmt for stems in third.values() for stem in stems for fmt in ['png', 'svg'])
+    assert sorted(os.listdir(directory / 'artifacts')) == expected
+    assert not set(first['riskperception']) & {name.rsplit('.', 1)[0] for name in os.listdir(directory / 'artifacts')}
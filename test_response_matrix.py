@@ -0,0 +1,70 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+
+
+@pytest.fixture
+def df(export):
+    return analysis.load_data(export)[0]
+
+
+def test_layout(df):
+    responses = analysis.rearrange_data(df)
+    assert responses.values.shape == (len(df.index), len(analysis.ENVIRONMENTS), len(analysis.DIMENSIONS))
+    assert responses.values.dtype == np.uint8
+    assert np.all(np.diff(responses.group) >= 0)
+    row = df.set_index('participant').loc[responses.participant[0]]
+    assert responses.values[0, analysis.ENVIRONMENTS.index('public'), analysis.DIMENSIONS.index('emotion')] == row['emotion_public']
+
+
+def test_views_are_zero_copy(df):
+    responses = analysis.rearrange_data(df)
+    stroke = responses.view(group='stroke', dimension='behaviour')
+    assert np.shares_memory(stroke, responses.values)
+    assert stroke.shape == ((df['group'] == 'stroke').sum(), len(analysis.ENVIRONMENTS))
+    assert sorted(stroke[:, 0].tolist()) == sorted(df['behaviour_dom'][df['group'] == 'stroke'].tolist())
+    assert len(responses.subset('control')) == (df['group'] == 'control').sum()
+
+
+@pytest.mark.parametrize('layout', ['to_long', 'to_pairs'])
+def test_long_layouts_round_trip(df, layout):
+    responses = analysis.rearrange_data(df)
+    back = analysis.as_response_matrix(getattr(responses, layout)())
+    order = np.argsort(responses.participant)
+    back_order = np.argsort(back.participant)
+    np.testing.assert_array_equal(back.values[back_order], responses.values[order])
+    np.testing.assert_array_equal(back.group[back_order], responses.group[order])
+    np.testing.assert_array_equal(back.age[back_order], responses.age[order])
+
+
+def test_pairs_keep_domestic_environment(df):
+    pairs = analysis.rearrange_data(df).to_pairs()
+    assert len(pairs.index) == len(df.index)*len(analysis.ENVIRONMENTS)
+    assert set(pairs['env']) == {'home', 'nature', 'public', 'traffic'}
+
+
+def test_histogram_cube_matches_pandas(df):
+    cube = analysis.rearrange_data(df).histogram_cube()
+    for g, group in enumerate(analysis.GROUPS):
+        for d, dimension in enumerate(analysis.DIMENSIONS):
+            for e, environment in enumerate(analysis.ENVIRONMENTS):
+                values = df[dimension+'_'+environment][df['group'] == group]
+                expected = np.bincount(values, minlength=analysis.LIKERT_LEVELS+1)[1:]
+                np.testing.assert_array_equal(cube[g, d, e], expected)
+
+
+def test_consumers_accept_every_layout(df):
+    responses = analysis.rearrange_data(df)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        expected = analysis.significance_test(responses)
+        for data in [df, responses.to_long()]:
+            pd.testing.assert_frame_equal(analysis.significance_test(data), expected)
+    
+    # the pairs frame is sorted by participant, so only the estimates (not the resamples) coincide
+    pd.testing.assert_series_equal(analysis.bootstrap_ci(responses.to_pairs(), replicates=100)['estimate'],
+                                   analysis.bootstrap_ci(responses, replicates=100)['estimate'])
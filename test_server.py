@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+from scipy import stats
+
+import analysis
+
+
+@pytest.fixture
+def df(export):
+    return analysis.load_data(export)[0]
+
+
+def request(server, target):
+
+    # one http request against the handler of a server on a free localhost port
+    async def roundtrip():
+        listener = await asyncio.start_server(server.handle, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(('GET '+target+' HTTP/1.1\r\nHost: localhost\r\n\r\n').encode())
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+        head, body = response.split(b'\r\n\r\n', 1)
+        return int(head.split()[1]), json.loads(body)
+    return asyncio.run(roundtrip())
+
+
+def test_summary(df):
+    server = analysis.AnalysisServer(df)
+    status, body = request(server, '/summary?statistic=mean&by=group&dimension=emotion&environment=traffic')
+    assert status == 200
+    expected = df.groupby('group', observed=True)['emotion_traffic'].mean()
+    assert {row['group']: row['mean'] for row in body} == pytest.approx(expected.to_dict())
+
+
+def test_mannwhitney_matches_scipy(df):
+    server = analysis.AnalysisServer(df)
+    status, body = request(server, '/mannwhitney?a.group=stroke&b.group=control&environment=public&dimension=behaviour&alternative=greater')
+    reference = stats.mannwhitneyu(df['behaviour_public'][df['group'] == 'stroke'], df['behaviour_public'][df['group'] == 'control'],
+                                   alternative='greater', method='asymptotic')
+    assert status == 200
+    assert (body['n_a'], body['n_b']) == ((df['group'] == 'stroke').sum(), (df['group'] == 'control').sum())
+    assert body['U'] == pytest.approx(reference.statistic)
+    assert body['pvalue'] == pytest.approx(reference.pvalue)
+
+
+@pytest.mark.parametrize('method', ['spearman', 'kendall'])
+def test_spearman_matches_scipy(df, method):
+    server = analysis.AnalysisServer(df)
+    status, body = request(server, '/spearman?x=age&y=behaviour&group=control&method='+method)
+    control = df[df['group'] == 'control']
+    behaviour = control[analysis.ITEMS[:4]].astype(int).sum(axis=1)
+    reference = (stats.spearmanr if method == 'spearman' else stats.kendalltau)(control['age'], behaviour)
+    assert status == 200
+    assert body['coefficient'] == pytest.approx(reference[0])
+    assert body['pvalue'] == pytest.approx(reference[1])
+
+
+def test_cached_answers_and_errors(df):
+    server = analysis.AnalysisServer(df, cache_size=4)
+    for _ in range(3):
+        assert request(server, '/summary?statistic=median&by=gender')[0] == 200
+    assert server.query.cache_info().hits == 2
+    assert request(server, '/unknown')[0] == 404
+    assert request(server, '/summary?statistic=unknown')[0] == 400
+    status, body = request(server, '/health')
+    assert status == 200 and body['rows'] == len(df.index)
+
+
+def test_repeated_parameters_select_labels_with_commas(df):
+    df = df.assign(country=df['country'].astype(object))
+    df.loc[df.index[:5], 'country'] = 'DE, Germany'
+    server = analysis.AnalysisServer(df)
+    status, body = request(server, '/summary?statistic=count&by=country&dimension=behaviour&environment=dom&country=GB%2C+United+Kingdom')
+    assert status == 200
+    assert body == [{'country': 'GB, United Kingdom', 'count': len(df.index) - 5}]
+    status, body = request(server, '/summary?statistic=count&by=group&dimension=behaviour&environment=dom'
+                                   '&country=GB%2C+United+Kingdom&country=DE%2C+Germany')
+    assert sum(row['count'] for row in body) == len(df.index)
+    status, body = request(server, '/mannwhitney?a.country=DE%2C+Germany&b.country=GB%2C+United+Kingdom&environment=dom&dimension=emotion')
+    assert status == 200 and (body['n_a'], body['n_b']) == (5, len(df.index) - 5)
+    assert request(server, '/summary?country=GB')[0] == 400
+
+
+def test_sides_only_for_mannwhitney(df):
+    server = analysis.AnalysisServer(df)
+    assert request(server, '/summary?a.group=stroke')[0] == 400
+    assert request(server, '/spearman?b.group=control')[0] == 400
+    assert request(server, '/summary?statistic=mean&statistic=median')[0] == 400
+
+
+def test_health_is_not_cached(df):
+    server = analysis.AnalysisServer(df)
+    request(server, '/summary')
+    assert request(server, '/health')[1]['cache']['misses'] == 1
+    request(server, '/summary')
+    assert request(server, '/health')[1]['cache'] == {'hits': 1, 'misses': 1, 'maxsize': 1024, 'currsize': 1}
@@ -0,0 +1,44 @@
+import warnings
+
+import pytest
+from scipy import stats
+
+import analysis
+
+
+def select(melted, selection):
+
+    # reference selection of one sample straight from the long data frame
+    env = melted['env'].str.split('_')
+    mask = True
+    for factor, value in selection.items():
+        column = {'group': melted['group'].astype(str), 'dimension': env.str[0], 'environment': env.str[1]}[factor]
+        mask = mask & (column == value)
+    return melted['value'][mask]
+
+
+def test_samples_follow_spec(export):
+
+    # every row of the results table is the scipy test of the selections described by the spec
+    melted = analysis.rearrange_data(analysis.load_data(export)[0]).to_long()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        results = analysis.significance_test(melted)
+    spec = analysis.significance_spec()
+    assert len(results) == len(spec)
+
+    for comparison, (_, row) in zip(spec, results.iterrows()):
+        a, b = select(melted, comparison['a']), select(melted, comparison['b'])
+        reference = stats.mannwhitneyu(a, b, alternative=comparison['alternative'], method='asymptotic')
+        assert (row['n_a'], row['n_b']) == (len(a), len(b))
+        assert row['U'] == pytest.approx(reference.statistic)
+        assert row['pvalue'] == pytest.approx(reference.pvalue)
+
+
+def test_public_behaviour_selection():
+
+    # test 8 compares the public samples (it used to compare nature)
+    for comparison in analysis.significance_spec():
+        if comparison['test'] == 8:
+            assert comparison['label'].startswith('public')
+            assert comparison['a']['environment'] == comparison['b']['environment'] == 'public'
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+import analysis
+
+
+@pytest.fixture
+def df(export):
+    return analysis.load_data(export)[0]
+
+
+SELECTIONS = [{'group': 'stroke'},
+              {'group': 'control', 'gender': 'female'},
+              {'gender': ['male', 'other'], 'age_band': ['60-69', '70-79']},
+              {'country': 'GB, United Kingdom', 'group': 'stroke'},
+              {'group': 'unknown'},
+              {}]
+
+
+@pytest.mark.parametrize('selection', SELECTIONS)
+def test_matches_pandas_masks(df, selection):
+    index = analysis.SubgroupIndex(analysis.frame_factors(df))
+    expected = np.ones(len(df.index), dtype=bool)
+    bands = analysis.age_bands(df['age'])
+    for factor, value in selection.items():
+        column = bands if factor == 'age_band' else df[factor].astype(str).to_numpy()
+        expected &= np.isin(column, value if isinstance(value, list) else [value])
+    np.testing.assert_array_equal(index.mask(**selection), expected)
+    np.testing.assert_array_equal(index.rows(**selection), np.flatnonzero(expected))
+    assert index.count(**selection) == expected.sum()
+
+
+def test_age_bands():
+    edges = [edge for edge, label in analysis.AGE_BANDS]
+    labels = analysis.age_bands([edges[0]-1, edges[0], edges[1]-1, edges[1]])
+    assert labels.tolist() == ['<'+str(edges[0]), analysis.AGE_BANDS[0][1], analysis.AGE_BANDS[0][1], analysis.AGE_BANDS[1][1]]
+
+
+@pytest.mark.parametrize('selection', [{'group': 'stroke', 'environment': 'traffic'}, {'environment': ['dom', 'public']}, {'age_band': '70-79'}])
+def test_repeat_matches_pairs_layout(df, selection):
+
+    # the participant index expanded to one row per environment equals the index of the pairs frame
+    responses = analysis.rearrange_data(df)
+    repeated = analysis.subgroup_index(responses).repeat(len(analysis.ENVIRONMENTS), environment=analysis.ENVIRONMENTS)
+    pairs = analysis.SubgroupIndex(analysis.frame_factors(responses.to_pairs()))
+    np.testing.assert_array_equal(repeated.mask(**selection), pairs.mask(**selection))
+
+
+def test_long_frame_factors(df):
+    long = analysis.rearrange_data(df).to_long()
+    index = analysis.SubgroupIndex(analysis.frame_factors(long))
+    expected = (long['env'] == 'emotion_nature') & (long['group'] == 'control')
+    np.testing.assert_array_equal(index.mask(dimension='emotion', environment='nature', group='control'), expected)
+
+
+def test_response_matrix_carries_country(df):
+
+    # country codes survive the group sort of the matrix, its subsets and the aggregate cube
+    df = df.assign(country=df['country'].astype(str))
+    df.loc[df.index[::3], 'country'] = 'DE, Germany'
+    matrix = analysis.rearrange_data(df)
+    index = analysis.subgroup_index(matrix)
+    for selection in [{'country': 'DE, Germany'}, {'country': 'GB, United Kingdom', 'group': 'control'}]:
+        expected = np.ones(len(df.index), dtype=bool)
+        for factor, value in selection.items():
+            expected &= df[factor].astype(str).to_numpy() == value
+        assert sorted(matrix.participant[index.rows(**selection)]) == sorted(df['participant'][expected])
+    stroke = matrix.subset('stroke')
+    assert sorted(stroke.factors()['country']) == sorted(df['country'][df['group'] == 'stroke'])
+    counts = analysis.AggregateCube.from_data(matrix).summary('count', by=('country',), dimension='behaviour', environment='dom')
+    assert counts.to_dict() == {('DE, Germany',): (df['country'] == 'DE, Germany').sum(), ('GB, United Kingdom',): (df['country'] != 'DE, Germany').sum()}
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from scipy import stats
+
+import analysis
+
+
+@pytest.fixture
+def df(export):
+    return analysis.load_data(export)[0]
+
+
+def test_state_matches_batch_statistics(df):
+    state = analysis.update_summary(analysis.summary_state(), df)
+    assert state['participants'] == set(df['participant'])
+    for i, group in enumerate(analysis.GROUPS):
+        ages = df['age'][df['group'] == group].astype(float)
+        assert state['age'][i].tolist() == pytest.approx([len(ages), ages.mean(), ((ages - ages.mean())**2).sum()])
+        assert sum(state['age_hist'][i].values()) == len(ages)
+    assert state['items'].sum() == len(df.index)*len(analysis.ITEMS)
+    item = analysis.ITEMS.index('emotion_public')
+    assert state['items'][0, :, item, 2].sum() == ((df['group'] == 'stroke') & (df['emotion_public'] == 3)).sum()
+
+
+def test_merge_of_shards_equals_whole(df):
+    whole = analysis.update_summary(analysis.summary_state(), df)
+    shards = [analysis.update_summary(analysis.summary_state(), part) for part in [df.iloc[:7], df.iloc[7:12], df.iloc[12:]]]
+    merged = analysis.merge_summary(analysis.merge_summary(shards[0], shards[1]), shards[2])
+    assert merged['participants'] == whole['participants']
+    np.testing.assert_allclose(merged['age'], whole['age'])
+    assert merged['age_hist'] == whole['age_hist']
+    np.testing.assert_array_equal(merged['items'], whole['items'])
+    with pytest.raises(ValueError):
+        analysis.merge_summary(whole, shards[0])
+
+
+def test_update_skips_known_participants(df, tmp_path):
+    path = str(tmp_path / 'state.json')
+    state = analysis.update_summary(analysis.summary_state(), df.iloc[:10])
+    analysis.save_summary(state, path)
+    state = analysis.update_summary(analysis.load_summary(path), df)
+    whole = analysis.update_summary(analysis.summary_state(), df)
+    np.testing.assert_allclose(state['age'], whole['age'])
+    np.testing.assert_array_equal(state['items'], whole['items'])
+
+
+def test_tests_from_state_match_scipy(df):
+    state = analysis.update_summary(analysis.summary_state(), df)
+    stroke, control = (df['age'][df['group'] == group].astype(float) for group in analysis.GROUPS)
+    assert analysis.levene_from_histograms(state['age_hist']) == pytest.approx(tuple(stats.levene(stroke, control)))
+
+
+def test_info_state_option(export, tmp_path, capsys):
+    path = str(tmp_path / 'state.json')
+    analysis.main(['info', export, '--no-cache', '--state', path])
+    analysis.main(['info', export, '--no-cache', '--state', path])
+    assert len(analysis.load_summary(path)['participants']) == len(analysis.load_data(export)[0].index)
+    assert '### DEMOGRAPHIC INFO ###' in capsys.readouterr().out
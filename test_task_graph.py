@@ -0,0 +1,118 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+
+
+@pytest.fixture
+def graph(monkeypatch, render, tmp_path):
+
+    # empty memo, headless rendering without diagnostic histograms
+    monkeypatch.setattr(analysis, 'GRAPH_MEMO', {})
+    analysis.configure_rendering('save', directory=str(tmp_path / 'figures'), histograms=False, workers=1)
+    return analysis.GRAPH_MEMO
+
+
+@pytest.fixture
+def df(export):
+    return analysis.load_data(export)[0]
+
+
+def test_fingerprints_invalidate_downstream_only():
+    roots = {'data': 'root'}
+    before = analysis.task_fingerprints(analysis.pipeline_tasks(replicates=100), roots)
+    after = analysis.task_fingerprints(analysis.pipeline_tasks(replicates=200), roots)
+    changed = {name for name in before if before[name] != after[name]}
+    assert changed == {'bootstrap', 'correlate', 'riskperception'}
+    other = analysis.task_fingerprints(analysis.pipeline_tasks(replicates=100), {'data': 'other'})
+    assert all(other[name] != before[name] for name in before if name != 'data')
+
+
+def test_results_match_direct_calls(graph, df, tmp_path, capsys):
+    tasks = analysis.pipeline_tasks(replicates=50)
+    results = analysis.run_graph(tasks, {'data': df}, targets=['test', 'correlate', 'medians'], workers=2, cache_dir=str(tmp_path))
+    assert set(results) == {'responses', 'cube', 'index', 'bootstrap', 'test', 'correlate', 'medians'}
+    assert '### SIGNIFICANCE TESTING ###' in capsys.readouterr().out
+    responses = analysis.rearrange_data(df)
+    pd.testing.assert_frame_equal(results['test'][0], analysis.significance_test(responses))
+    pd.testing.assert_frame_equal(results['correlate'][0], analysis.spearman_correlation(responses, replicates=50))
+    pd.testing.assert_frame_equal(results['medians'][0], analysis.median_values(df))
+
+
+def test_memo_in_memory_and_on_disk(graph, df, tmp_path, capsys):
+    tasks = analysis.pipeline_tasks(replicates=50)
+    first = analysis.run_graph(tasks, {'data': df}, targets=['correlate'], workers=1, cache_dir=str(tmp_path))
+    stored = sorted(os.listdir(tmp_path / 'graph'))
+    assert len(stored) == len(first) == len(graph)
+    
+    # a new process (empty memory) reads the results from disk; output is replayed
+    graph.clear()
+    capsys.readouterr()
+    second = analysis.run_graph(tasks, {'data': df}, targets=['correlate'], workers=1, cache_dir=str(tmp_path))
+    assert sorted(os.listdir(tmp_path / 'graph')) == stored
+    pd.testing.assert_frame_equal(second['correlate'][0], first['correlate'][0])
+    assert 'CORRELATION AGE' in capsys.readouterr().out
+
+
+def test_figures_are_replayed(graph, df, tmp_path):
+    tasks = analysis.pipeline_tasks(replicates=50)
+    analysis.run_graph(tasks, {'data': df}, targets=['twosided_bar', 'riskperception'], workers=2, cache_dir=None)
+    assert [job[0] for job in analysis.FIGURE_JOBS] == ['twosided_bar', 'riskperception']
+    analysis.flush_figures()
+    assert sorted(os.listdir(tmp_path / 'figures')) == ['riskperception.png', 'twosided_bar.png']
+
+
+def test_freeze():
+    original = np.arange(3)
+    array = analysis.freeze(original)
+    with pytest.raises(ValueError):
+        array[0] = 1
+    original[0] = 1
+    assert array[0] == 1
+
+
+def test_freeze_leaves_the_input_untouched(df):
+
+    # data frames: a shallow copy whose writes never reach the input (copy-on-write); slotted objects: copies
+    # holding read-only views
+    frozen = analysis.freeze(df)
+    assert frozen is not df and not frozen['age'].to_numpy().flags.writeable
+    frozen.loc[frozen.index[0], 'age'] = 99
+    assert df['age'].iloc[0] != 99
+    df.loc[df.index[0], 'age'] = 98
+    assert frozen['age'].iloc[0] == 99
+    matrix = analysis.rearrange_data(df)
+    frozen = analysis.freeze(matrix)
+    assert not frozen.values.flags.writeable and matrix.values.flags.writeable
+    np.testing.assert_array_equal(frozen.values, matrix.values)
+
+
+def test_run_graph_keeps_root_and_memo_apart(graph, df):
+
+    # the caller's data set stays writeable, writes to a returned result do not reach the memo
+    original = df.copy()
+    tasks = analysis.pipeline_tasks(replicates=20)
+    results = analysis.run_graph(tasks, {'data': df}, targets=['medians'], workers=1, cache_dir=None, replay=False)
+    df.loc[df.index[0], 'behaviour_dom'] = 1
+    results['medians'][0].loc[0, 'behaviour_dom'] = -1
+    again = analysis.run_graph(tasks, {'data': original}, targets=['medians'], workers=1, cache_dir=None, replay=False)
+    pd.testing.assert_frame_equal(again['medians'][0], analysis.median_values(original))
+
+
+def test_memo_eviction(graph, df, tmp_path, monkeypatch):
+
+    # files of other fingerprints are evicted (least recently used first) beyond GRAPH_CACHE_ENTRIES; the memory only
+    # keeps the current fingerprints
+    first = analysis.run_graph(analysis.pipeline_tasks(replicates=20), {'data': df}, targets=['correlate'], workers=1, cache_dir=str(tmp_path))
+    stored = set(os.listdir(tmp_path / 'graph'))
+    monkeypatch.setattr(analysis, 'GRAPH_CACHE_ENTRIES', len(stored))
+    tasks = analysis.pipeline_tasks(replicates=30)
+    analysis.run_graph(tasks, {'data': df}, targets=['correlate'], workers=1, cache_dir=str(tmp_path))
+    current = analysis.task_fingerprints(tasks, {'data': analysis.data_fingerprint(df)})
+    assert set(graph) <= set(current.values())
+    files = set(os.listdir(tmp_path / 'graph'))
+    assert len(files) == len(stored)
+    assert {name[:-4] for name in files} == {current[name] for name in first if name != 'data'}
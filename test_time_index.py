@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+
+
+@pytest.fixture
+def df(export):
+    return analysis.load_data(export)[0]
+
+
+def test_timestamps_parsed_to_epoch_minutes(df, export):
+    raw = pd.read_csv(export).set_index('participant')
+    start = pd.to_datetime(raw.loc[df['participant'], 'TIME_start'], format='%Y-%m-%d-%H-%M')
+    assert df['TIME_start'].dtype == np.int64
+    assert df['TIME_start'].tolist() == ((start - analysis.EPOCH) // pd.Timedelta(minutes=1)).tolist()
+
+
+def test_invalid_timestamps_are_incomplete(messy_export, tmp_path):
+    raw = pd.read_csv(messy_export, dtype=str)
+    raw.loc[0, 'TIME_start'] = '13.06.2022 08:29'
+    raw.loc[1, 'TIME_total'] = None
+    path = str(tmp_path / 'export.csv')
+    raw.to_csv(path, index=False)
+    df, incomplete, young = analysis.load_data(path)
+    assert incomplete == analysis.load_data(messy_export)[1] + 1
+    assert raw.loc[0, 'participant'] not in set(df['participant'])
+    
+    # a missing completion time is recomputed from the timestamps
+    row = df[df['participant'] == raw.loc[1, 'participant']].iloc[0]
+    assert row['TIME_total'] == row['TIME_end'] - row['TIME_start']
+
+
+@pytest.mark.parametrize('begin, end', [('2022-06', '2022-06-15'), (None, '2022-06-14-00-00'), ('2022-06-16', None), ('2023', '2024')])
+def test_window_matches_scan(df, begin, end):
+    index = analysis.TimeIndex(df)
+    start = df['TIME_start'].to_numpy()
+    expected = np.ones(len(start), dtype=bool)
+    if begin is not None:
+        expected &= start >= analysis.to_minutes(begin)
+    if end is not None:
+        expected &= start < analysis.to_minutes(end)
+    assert sorted(index.window(begin, end)) == np.flatnonzero(expected).tolist()
+
+
+def test_month_and_speed_queries(df):
+    index = analysis.TimeIndex(df)
+    months = pd.to_datetime(df['TIME_start'], unit='m').dt.month.to_numpy()
+    assert sorted(index.month(2022, 6)) == np.flatnonzero(months == 6).tolist()
+    duration = (df['TIME_end'] - df['TIME_start']).to_numpy()
+    assert sorted(index.faster_than(3)) == np.flatnonzero(duration < 3).tolist()
+    assert sorted(index.slower_than(3)) == np.flatnonzero(duration > 3).tolist()
+    assert index.inconsistent().tolist() == np.flatnonzero(df['TIME_total'].to_numpy() != duration).tolist()
+
+
+def test_select_times(df):
+    selected, index = analysis.select_times(df, '2022-06', '2022-07', min_duration=3)
+    duration = selected['TIME_end'] - selected['TIME_start']
+    assert (duration >= 3).all()
+    assert len(selected.index) == len(set(index.month(2022, 6)) - set(index.faster_than(3)))
+
+
+def test_cli_window(export, capsys):
+    analysis.main(['info', export, '--no-cache', '--window', '2022-06', '2022-07', '--min-duration', '2'])
+    assert 'too fast (removed)' in capsys.readouterr().out
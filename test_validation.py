@@ -0,0 +1,57 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+
+
+@pytest.fixture
+def invalid_export(export, tmp_path):
+
+    # the shipped export plus rows with an out-of-range item, a fractional item, an unknown group,
+    # an implausible age and a repeated submission
+    raw = pd.read_csv(export, dtype=str)
+    complete = raw.dropna().reset_index(drop=True)
+    bad = pd.concat([complete.iloc[[0]].assign(participant='s.item.txt', **{'behaviour:2': '7'}),
+                     complete.iloc[[1]].assign(participant='s.fraction.txt', **{'emotion:4': '2.5'}),
+                     complete.iloc[[2]].assign(participant='s.group.txt', **{'group:1': '3'}),
+                     complete.iloc[[3]].assign(participant='s.age.txt', **{'age:1': '160'}),
+                     complete.iloc[[4]].assign(**{'emotion:1': '1'})])
+    path = tmp_path / 'export.csv'
+    pd.concat([raw, bad]).to_csv(path, index=False)
+    return str(path), complete.loc[4, 'participant']
+
+
+def test_epoch_minutes_matches_pandas():
+    values = pd.Series(['2022-06-13-08-29', '1999-12-31-23-59', '2024-02-29-00-00', '2023-02-29-00-00',
+                        '2022-13-01-00-00', '2022-06-13 08:29', None])
+    expected = (pd.to_datetime(values, format='%Y-%m-%d-%H-%M', errors='coerce') - analysis.EPOCH) // pd.Timedelta(minutes=1)
+    np.testing.assert_array_equal(analysis.epoch_minutes(values).to_numpy(), expected.to_numpy(dtype=float))
+    
+    # unlike pandas, fields without zero padding are rejected (the export is fixed width)
+    assert analysis.epoch_minutes(pd.Series(['2022-06-13-8-29'])).isna().all()
+
+
+@pytest.mark.parametrize('chunksize', [2, 100000])
+def test_invalid_rows_are_reported(invalid_export, export, chunksize):
+    path, resubmitted = invalid_export
+    report = analysis.rejection_report()
+    df, incomplete, young = analysis.load_data(path, chunksize=chunksize, report=report)
+    assert report['invalid'] == {'behaviour_nature': 1, 'emotion_traffic': 1, 'group': 1, 'age': 1}
+    assert report['duplicates'] == 1
+    assert report['examples']['group'] == ['s.group.txt']
+    assert (incomplete, young) == analysis.load_data(export)[1:]
+    
+    # the first submission is kept
+    expected = analysis.load_data(export)[0]
+    assert df['participant'].tolist() == expected['participant'].tolist()
+    assert (df[df['participant'] == resubmitted]['emotion_dom'].to_numpy() == expected[expected['participant'] == resubmitted]['emotion_dom'].to_numpy()).all()
+    assert 'duplicate submissions (removed): 1' in analysis.format_report(report)
+
+
+def test_report_survives_the_cache(invalid_export, tmp_path):
+    path, _ = invalid_export
+    cold, warm = analysis.rejection_report(), analysis.rejection_report()
+    analysis.load_data_cached(path, cache_dir=str(tmp_path / 'cache'), report=cold)
+    analysis.load_data_cached(path, cache_dir=str(tmp_path / 'cache'), report=warm)
+    assert cold == warm and cold['duplicates'] == 1
@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+
+
+@pytest.fixture
+def waves(export, tmp_path):
+
+    # two dated exports: the later one (alphabetically first) resubmits the last five participants of the earlier one
+    raw = pd.read_csv(export, dtype=str)
+    later = raw.iloc[-5:].assign(**{'emotion:1': '1'})
+    later = pd.concat([later, raw.assign(participant=lambda rows: 'new.'+rows['participant'])])
+    raw.to_csv(tmp_path / 'data-20-07-2022.csv', index=False)
+    later.to_csv(tmp_path / 'data-01-08-2022.csv', index=False)
+    return str(tmp_path / 'data-*.csv')
+
+
+def test_waves_in_date_order(waves):
+    assert [os.path.basename(path) for path in analysis.wave_paths(waves)] == ['data-20-07-2022.csv', 'data-01-08-2022.csv']
+    assert analysis.wave_date('data-01-08-2022.csv').isoformat() == '2022-08-01'
+    assert analysis.wave_date('export.csv') is None
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_first_submission_is_kept(waves, export, tmp_path, workers):
+    loaded = analysis.load_waves(analysis.wave_paths(waves), cache_dir=str(tmp_path / 'cache'), workers=workers)
+    first = analysis.load_data(export)[0]
+    resubmitted = set(first['participant']) & set(pd.read_csv(analysis.wave_paths(waves)[1])['participant'])
+    assert loaded[1]['duplicates'] == len(resubmitted)
+    assert not set(loaded[1]['data']['participant']) & set(first['participant'])
+    
+    df, summary = analysis.pool_waves(loaded)
+    assert df['participant'].is_unique
+    original = df[df['participant'].isin(resubmitted)].set_index('participant')['emotion_dom']
+    assert (original == first.set_index('participant').loc[original.index, 'emotion_dom']).all()
+    whole = analysis.batch_summary(df)
+    np.testing.assert_allclose(summary['age'], whole['age'])
+    np.testing.assert_array_equal(summary['items'], whole['items'])
+    assert summary['participants'] == set(df['participant'])
+
+
+def test_per_wave_runs(waves, tmp_path, render, capsys):
+    analysis.main(['plot', waves, '--no-cache', '--per-wave', '--save', str(tmp_path / 'figures'), '--replicates', '20', '--workers', '1'])
+    assert sorted(os.listdir(tmp_path / 'figures')) == ['data-01-08-2022', 'data-20-07-2022', 'pooled']
+    assert os.listdir(tmp_path / 'figures' / 'pooled')
+    assert 'submitted in an earlier wave (removed): ' in capsys.readouterr().out